@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+# Copyright 2014 Quod Libet contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as
+# published by the Free Software Foundation
+
+"""Shared setup for the benchmark scripts in this directory"""
+
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+
+def init():
+    """Makes the quodlibet package importable and initializes it
+    the same way the test suite does.
+    """
+
+    sys.path.insert(0, os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))))
+
+    import quodlibet
+    quodlibet._dbus_init()
+    quodlibet._gtk_init()
+    quodlibet._python_init()
+
+    from quodlibet import config
+    config.init()
+
+
+def get_rss():
+    """The resident set size of this process in MB (Linux only)"""
+
+    with open("/proc/self/statm", "rb") as h:
+        pages = int(h.read().split()[1])
+    return pages * os.sysconf("SC_PAGE_SIZE") / 1024.0 / 1024.0
+
+
+@contextmanager
+def timed(name):
+    start = time.time()
+    yield
+    print "%-32s %.3fs" % (name, time.time() - start)
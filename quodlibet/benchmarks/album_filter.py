@@ -0,0 +1,61 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+# Copyright 2014 Quod Libet contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as
+# published by the Free Software Foundation
+
+"""Refiltering 20k albums with 10 songs each
+
+Runs a query using 11 album keys over all albums a few times, like
+the album list does on each search. The first pass fills the album
+caches, the following ones should reuse them.
+
+    ./benchmarks/album_filter.py [ALBUMS] [PASSES]
+"""
+
+import sys
+
+import _common
+_common.init()
+
+from quodlibet.formats._audio import AudioFile
+from quodlibet.parse import Query
+from quodlibet.util.collection import Album
+
+
+QUERY = ("&(album=album, artist=artist, genre=genre, date=19, "
+         "labelid=label, ~people=a, !albumartist=b, #(rating>0.1), "
+         "#(length>-1), !composer=c, #(tracks=10))")
+
+
+def create_albums(count):
+    albums = []
+    for i in xrange(count):
+        album = None
+        for track in xrange(10):
+            song = AudioFile({
+                "album": "album%d" % i, "artist": "artist%d" % (i % 100),
+                "title": "t%d" % track, "genre": "genre%d" % (i % 10),
+                "date": str(1960 + i % 50), "labelid": "label%d" % i,
+                "~#rating": 0.5, "~#length": i})
+            album = album or Album(song)
+            album.songs.add(song)
+        albums.append(album)
+    return albums
+
+
+def main(argv):
+    count = int(argv[1]) if len(argv) > 1 else 20000
+    passes = int(argv[2]) if len(argv) > 2 else 3
+    albums = create_albums(count)
+    query = Query(QUERY)
+    for i in xrange(passes):
+        with _common.timed("pass %d" % (i + 1)):
+            result = filter(query.search, albums)
+    print "%d of %d albums match" % (len(result), len(albums))
+
+
+if __name__ == "__main__":
+    main(sys.argv)
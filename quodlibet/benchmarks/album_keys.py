@@ -0,0 +1,85 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+# Copyright 2014 Quod Libet contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as
+# published by the Free Software Foundation
+
+"""Album key computation and the album library for 150k songs
+
+Shows the effect of the memoised album keys and of the album keys
+stored in the library file through AudioFile.__getstate__.
+
+    ./benchmarks/album_keys.py [SONGS]
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+
+import _common
+_common.init()
+
+from quodlibet.formats._audio import AudioFile, clear_album_keys
+from quodlibet.library.libraries import dump_items, load_items
+from quodlibet.library.libraries import SongLibrary, AlbumLibrary
+
+
+def create_songs(count):
+    """12 songs per album, 5 albums per artist"""
+
+    songs = []
+    for i in xrange(count):
+        album = i // 12
+        artist = album // 5
+        songs.append(AudioFile({
+            "~filename": "/music/artist%d/album%d/%02d.flac" % (
+                artist, album, i % 12),
+            "~mountpoint": "/", "title": u"Title %d" % i,
+            "artist": u"Artist %d" % artist, "album": u"Album %d" % album,
+            "tracknumber": u"%d/12" % (i % 12 + 1), "date": u"2001",
+            "genre": u"Rock", "musicbrainz_albumid": u"%032x" % album,
+            "~#length": 200, "~#added": 1, "~#mtime": 1.0,
+            "~#filesize": 1000, "~#rating": 0.5,
+        }))
+    return songs
+
+
+def main(argv):
+    count = int(argv[1]) if len(argv) > 1 else 150000
+    temp = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(temp, "songs")
+        songs = create_songs(count)
+        print "%d songs, %d albums" % (len(songs), (count + 11) // 12)
+
+        # like an old library file, without stored album keys
+        with _common.timed("computing all album keys"):
+            for song in songs:
+                song.album_key
+
+        with _common.timed("saving the library"):
+            dump_items(filename, songs)
+        print "%-32s %.1fMB" % (
+            "library file size", os.path.getsize(filename) / 1024.0 ** 2)
+        del songs
+        clear_album_keys()
+
+        with _common.timed("loading the library"):
+            songs = load_items(filename)
+        with _common.timed("album keys from the library file"):
+            for song in songs:
+                song.album_key
+
+        library = SongLibrary()
+        library._load_init(songs)
+        with _common.timed("AlbumLibrary(library)"):
+            AlbumLibrary(library)
+    finally:
+        shutil.rmtree(temp)
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,108 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+# Copyright 2014 Quod Libet contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as
+# published by the Free Software Foundation
+
+"""Memory use of a loaded library of 150k songs with 11 tags each
+
+Loads a synthetic library, computes all sort keys and prints the
+resident memory this takes and the size of the library file: without
+compaction, like before AudioFile.compact() existed, with compaction,
+and for the library saved after compaction. Linux only.
+
+    ./benchmarks/song_memory.py [SONGS]
+"""
+
+import gc
+import os
+import shutil
+import sys
+import tempfile
+
+import _common
+_common.init()
+
+from quodlibet.formats._audio import AudioFile
+from quodlibet.library.libraries import dump_items, load_items
+
+
+def _new(value):
+    """A copy of a string which isn't shared with other songs"""
+
+    return value[:1] + value[1:]
+
+
+def create_songs(count):
+    # tags read from files don't share the tag names or values
+    songs = []
+    for i in xrange(count):
+        song = AudioFile()
+        for key, value in [
+                ("artist", u"Artist %d" % (i // 100)),
+                ("album", u"Album %d" % (i // 10)),
+                ("genre", u"Genre %d" % (i % 20)),
+                ("title", u"Title %d" % i),
+                ("tracknumber", u"%d/10" % (i % 10 + 1)),
+                ("date", u"%d" % (1960 + i % 50)),
+                ("~filename", "/music/%d.ogg" % i),
+                ("~mountpoint", _new("/music")),
+                ("~#added", 1400000000 + i),
+                ("~#length", 200 + i % 100),
+                ("~#bitrate", 192)]:
+            dict.__setitem__(song, _new(key), value)
+        songs.append(song)
+    return songs
+
+
+def _in_child(func, *args):
+    """Runs func in a child process, so that each step starts with
+    the same memory use.
+    """
+
+    pid = os.fork()
+    if not pid:
+        try:
+            func(*args)
+        finally:
+            os._exit(0)
+    os.waitpid(pid, 0)
+
+
+def load(name, filename, compact, save_to=None):
+    before = _common.get_rss()
+    songs = load_items(filename)
+    if compact:
+        for song in songs:
+            song.compact()
+    for song in songs:
+        song.sort_key
+    gc.collect()
+    print "%-28s %4.0fMB  (file: %.1fMB)" % (
+        name, _common.get_rss() - before,
+        os.path.getsize(filename) / 1024.0 ** 2)
+    if save_to is not None:
+        dump_items(save_to, songs)
+
+
+def main(argv):
+    count = int(argv[1]) if len(argv) > 1 else 150000
+
+    temp = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(temp, "songs")
+        compacted = os.path.join(temp, "compacted")
+        _in_child(lambda: dump_items(filename, create_songs(count)))
+        print "%d songs" % count
+        _in_child(load, "not compacted", filename, False)
+        _in_child(load, "compacted", filename, True, compacted)
+        # the next start loads the library saved after compaction
+        _in_child(load, "compacted, saved and loaded", compacted, True)
+    finally:
+        shutil.rmtree(temp)
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -22,12 +22,14 @@ import signal
 import sys
 import tempfile
 import stat
+import time
 
 play = False
 no_plugins = False
 
 
 def main():
+    start = time.time()
     process_arguments()
 
     from quodlibet import const
@@ -50,7 +52,8 @@ def main():
     library = quodlibet.init(library=const.LIBRARY,
                              icon="quodlibet",
                              name="Quod Libet",
-                             title=const.PROCESS_TITLE_QL)
+                             title=const.PROCESS_TITLE_QL,
+                             lazy_library=True)
     app.library = library
 
     from quodlibet.player import PlayerError
@@ -112,6 +115,11 @@ def main():
     from quodlibet.qltk.quodlibetwindow import QuodLibetWindow
     app.window = window = QuodLibetWindow(library, player)
 
+    def first_draw(window, cr):
+        window.disconnect(draw_id)
+        print_d("First paint after %.3f seconds" % (time.time() - start))
+    draw_id = window.connect_after("draw", first_draw)
+
     from quodlibet.plugins.events import EventPluginHandler
     pm.register_handler(EventPluginHandler(library.librarian, player))
 
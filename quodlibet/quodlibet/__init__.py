@@ -297,7 +297,8 @@ def exit(status=None, notify_startup=False):
     raise SystemExit(status)
 
 
-def init(library=None, icon=None, title=None, name=None):
+def init(library=None, icon=None, title=None, name=None,
+         lazy_library=False):
     print_d("Entering quodlibet.init")
 
     _gtk_init(icon)
@@ -327,7 +328,7 @@ def init(library=None, icon=None, title=None, name=None):
             quodlibet.util.path.unexpand(library)))
 
     import quodlibet.library
-    library = quodlibet.library.init(library)
+    library = quodlibet.library.init(library, lazy_library)
 
     _init_debug()
 
@@ -550,6 +551,12 @@ def main(window):
         for window in Window.windows:
             window.destroy()
 
+        # write tags which are still queued, the results get handled
+        # with the pending events below
+        print_d("Quit GTK: Wait for tags to get saved")
+        from quodlibet.qltk import tagwriter
+        tagwriter.wait()
+
         print_d("Quit GTK: Process pending events...")
         while Gtk.events_pending():
             if Gtk.main_iteration_do(False):
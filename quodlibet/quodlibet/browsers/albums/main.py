@@ -34,7 +34,7 @@ from quodlibet.qltk.x import SymbolicIconImage, SeparatorMenuItem
 from quodlibet.qltk.searchbar import SearchBarBox
 from quodlibet.qltk.menubutton import MenuButton
 from quodlibet.util import copool, gobject_weak, thumbnails
-from quodlibet.util.library import background_filter
+from quodlibet.util.library import IncrementalFilter
 from quodlibet.util.collection import Album
 from quodlibet.qltk.cover import get_no_cover_pixbuf
 
@@ -343,6 +343,7 @@ class AlbumList(Browser, Gtk.VBox, util.InstanceTracker, VisibleUpdate):
     __no_cover = None
     __last_render = None
     __last_render_pb = None
+    __restore_pending = False
 
     name = _("Album List")
     accelerated_name = _("_Album List")
@@ -424,8 +425,7 @@ class AlbumList(Browser, Gtk.VBox, util.InstanceTracker, VisibleUpdate):
         model_sort = AlbumSortModel(model=self.__model)
         model_filter = AlbumFilterModel(child_model=model_sort)
 
-        self.__bg_filter = background_filter()
-        self.__filter = None
+        self.__filter = IncrementalFilter()
         model_filter.set_visible_func(self.__parse_query)
 
         render = Gtk.CellRendererPixbuf()
@@ -465,7 +465,7 @@ class AlbumList(Browser, Gtk.VBox, util.InstanceTracker, VisibleUpdate):
                         len(model) - 1) % (len(model) - 1)
                 markup = text
             else:
-                markup = AlbumList._pattern % album
+                markup = AlbumList._pattern.format_cached(album)
 
             if self.__last_render == markup:
                 return
@@ -553,6 +553,7 @@ class AlbumList(Browser, Gtk.VBox, util.InstanceTracker, VisibleUpdate):
 
     def __destroy(self, browser):
         self.disable_row_update()
+        self.__filter.cancel()
 
         self.__inhibit()
         self.view.set_model(None)
@@ -561,44 +562,43 @@ class AlbumList(Browser, Gtk.VBox, util.InstanceTracker, VisibleUpdate):
         if not klass.instances():
             klass._destroy_model()
 
-    def __update_filter(self, entry, text, scroll_up=True, restore=False):
+    def __update_filter(self, entry, text, scroll_up=True, restore=False,
+                        sync=False):
         model = self.view.get_model()
 
-        self.__filter = None
-        if not Query.match_all(text):
-            self.__filter = Query(text, star=["~people", "album"]).search
-        self.__bg_filter = background_filter()
+        def get_all():
+            return self.__library.albums.itervalues()
 
-        self.__inhibit()
+        def get_visible():
+            return (row[0] for row in model if row[0] is not None)
+
+        def refilter():
+            # don't filter on restore if there is nothing to filter
+            if restore and not self.__filter.active:
+                return
+
+            self.__inhibit()
 
-        # We could be smart and try to scroll to a selected album
-        # but that introduces lots of wild scrolling. Feel free to change it.
-        # Without scrolling the TV trys to stay at the same position (40% down)
-        # which makes no sence so always go to the top.
-        if scroll_up:
-            self.view.scroll_to_point(0, 0)
+            # We could be smart and try to scroll to a selected album
+            # but that introduces lots of wild scrolling. Feel free to
+            # change it. Without scrolling the TV trys to stay at the same
+            # position (40% down) which makes no sence so always go to the
+            # top.
+            if scroll_up:
+                self.view.scroll_to_point(0, 0)
 
-        # don't filter on restore if there is nothing to filter
-        if not restore or self.__filter or self.__bg_filter:
             model.refilter()
 
-        self.__uninhibit()
+            self.__uninhibit()
 
-    def __parse_query(self, model, iter_, data):
-        f, b = self.__filter, self.__bg_filter
+        # large libraries get filtered in the background, the current
+        # albums stay visible until the new ones are ready
+        self.__filter.search(text, ["~people", "album"], get_all,
+                             get_visible, refilter, sync=sync)
 
-        if f is None and b is None:
-            return True
-        else:
-            album = model.get_album(iter_)
-            if album is None:
-                return True
-            elif b is None:
-                return f(album)
-            elif f is None:
-                return b(album)
-            else:
-                return b(album) and f(album)
+    def __parse_query(self, model, iter_, data):
+        album = model.get_album(iter_)
+        return album is None or self.__filter.match(album)
 
     def __search_func(self, model, column, key, iter_, data):
         album = model.get_album(iter_)
@@ -682,7 +682,7 @@ class AlbumList(Browser, Gtk.VBox, util.InstanceTracker, VisibleUpdate):
     def filter_text(self, text):
         self.__search.set_text(text)
         if Query.is_parsable(text):
-            self.__update_filter(self.__search, text)
+            self.__update_filter(self.__search, text, sync=True)
             self.__inhibit()
             self.view.set_cursor((0,))
             self.__uninhibit()
@@ -730,8 +730,26 @@ class AlbumList(Browser, Gtk.VBox, util.InstanceTracker, VisibleUpdate):
 
         # update_filter expects a parsable query
         if Query.is_parsable(text):
-            self.__update_filter(entry, text, scroll_up=False, restore=True)
+            self.__update_filter(entry, text, scroll_up=False, restore=True,
+                                 sync=True)
+
+        albums = self.__library.albums
+        if albums.loading:
+            # the saved albums aren't all there yet, select them once
+            # they are and don't overwrite the selection in save()
+            self.__restore_pending = True
+            gobject_weak(albums.connect, "loaded", self.__restore_loaded,
+                         parent=self)
+
+        self.__restore_albums()
+
+    def __restore_loaded(self, albums):
+        if self.__restore_pending:
+            self.__restore_pending = False
+            self.__restore_albums()
+            self.activate()
 
+    def __restore_albums(self):
         keys = config.get("browsers", "albums").split("\n")
 
         # FIXME: If albums is "" then it could be either all albums or
@@ -773,8 +791,9 @@ class AlbumList(Browser, Gtk.VBox, util.InstanceTracker, VisibleUpdate):
         return confval
 
     def save(self):
-        conf = self.__get_config_string()
-        config.set("browsers", "albums", conf)
+        if not self.__restore_pending:
+            conf = self.__get_config_string()
+            config.set("browsers", "albums", conf)
         text = self.__search.get_text().encode("utf-8")
         config.set("browsers", "query_text", text)
 
@@ -28,6 +28,7 @@ from quodlibet.qltk.msg import ErrorMessage
 from quodlibet.qltk.songsmenu import SongsMenu
 from quodlibet.qltk.views import AllTreeView
 from quodlibet.qltk.x import ScrolledWindow, Alignment, Button
+from quodlibet.util.threadpool import ThreadPool
 
 
 FEEDS = os.path.join(const.USERDIR, "feeds")
@@ -42,6 +43,16 @@ class InvalidFeed(ValueError):
 
 
 class Feed(list):
+
+    # don't wait longer than 2 ** MAX_BACKOFF check intervals
+    MAX_BACKOFF = 4
+
+    # defaults for feeds saved by older versions
+    etag = None
+    modified = None
+    failures = 0
+    last_check = 0
+
     def __init__(self, uri):
         self.name = _("Unknown")
         self.uri = uri
@@ -52,6 +63,13 @@ class Feed(list):
     def get_age(self):
         return time.time() - self.__lastgot
 
+    def is_due(self, interval):
+        """If the feed should be checked again. The interval gets doubled
+        for each failed check in a row."""
+
+        delay = interval * 2 ** min(self.failures, self.MAX_BACKOFF)
+        return time.time() - self.last_check >= delay
+
     @staticmethod
     def __fill_af(feed, af):
         try:
@@ -128,17 +146,65 @@ class Feed(list):
                 if value and value not in af.list("genre"):
                     af.add("genre", value)
 
-    def parse(self):
+    def fetch(self):
+        """Downloads and parses the feed document. If the feed was
+        downloaded before, only asks for a new version.
+
+        Doesn't change the feed, so it can be called in a thread.
+        Returns the document or None if the feed hasn't changed.
+        Raises InvalidFeed.
+        """
+
         try:
-            doc = feedparser.parse(self.uri)
-        except:
-            return False
+            doc = feedparser.parse(
+                self.uri, etag=self.etag, modified=self.modified)
+        except Exception, e:
+            raise InvalidFeed(e)
+
+        if doc.get("status") == 304:
+            return None
 
         try:
-            album = doc.channel.title
+            doc.channel.title
         except AttributeError:
+            raise InvalidFeed("%r is not a feed" % self.uri)
+
+        return doc
+
+    def failed(self):
+        """Marks a failed check; the next one gets delayed"""
+
+        self.last_check = time.time()
+        self.failures += 1
+
+    def parse(self):
+        """Fetches and updates the feed. Blocks.
+
+        Returns True if there are new entries.
+        """
+
+        try:
+            doc = self.fetch()
+        except InvalidFeed:
+            self.failed()
+            return False
+        return self.update(doc)
+
+    def update(self, doc):
+        """Updates the entries using a document returned by fetch().
+
+        Returns True if there are new entries.
+        """
+
+        self.last_check = time.time()
+        self.failures = 0
+        if doc is None:
             return False
 
+        self.etag = doc.get("etag")
+        self.modified = doc.get("modified")
+
+        album = doc.channel.title
         if album:
             self.name = album
         else:
@@ -196,6 +262,64 @@ class Feed(list):
         return bool(uris)
 
 
+class FeedRefresher(object):
+    """Checks feeds concurrently using a pool of worker threads.
+
+    Downloading and parsing happens in the workers, the feeds get
+    updated in the main loop once all of them are done.
+    """
+
+    def __init__(self, max_workers=4):
+        self._pool = ThreadPool(max_workers, name="FeedRefresher")
+
+    def refresh(self, feeds, callback):
+        """Checks all feeds and calls callback(changed, updated) in the
+        main loop. changed are the feeds with new entries, updated the
+        ones with a new document, which need to be saved.
+        """
+
+        feeds = list(feeds)
+        results = []
+        lock = threading.Lock()
+
+        def done():
+            changed = []
+            updated = []
+            for feed, doc, error in results:
+                if error is not None:
+                    print_w("Checking feed %r failed: %s" % (feed.uri, error))
+                    feed.failed()
+                    continue
+                if feed.update(doc):
+                    changed.append(feed)
+                if doc is not None:
+                    updated.append(feed)
+            callback(changed, updated)
+            return False
+
+        def fetch(feed):
+            # worker thread
+            try:
+                result = (feed, feed.fetch(), None)
+            except InvalidFeed, e:
+                result = (feed, None, e)
+            with lock:
+                results.append(result)
+                finished = len(results) == len(feeds)
+            if finished:
+                GLib.idle_add(done)
+
+        if not feeds:
+            GLib.idle_add(done)
+        for feed in feeds:
+            self._pool.add(fetch, feed)
+
+    def wait(self):
+        """Block until all feeds are fetched"""
+
+        self._pool.wait()
+
+
 class AddFeedDialog(GetStringDialog):
     def __init__(self, parent):
         super(AddFeedDialog, self).__init__(
@@ -215,6 +339,12 @@ class AudioFeeds(Browser, Gtk.VBox):
     __gsignals__ = Browser.__gsignals__
 
     __feeds = Gtk.ListStore(object)  # unread
+    # the data of the last save or load
+    __written = None
+    __refresher = FeedRefresher()
+
+    # seconds after which a feed gets checked again
+    CHECK_INTERVAL = 2 * 60 * 60
 
     headers = ("title artist performer ~people album date website language "
                "copyright organization license contact").split()
@@ -254,38 +384,44 @@ class AudioFeeds(Browser, Gtk.VBox):
 
     @classmethod
     def write(klass):
+        """Saves all feeds, skipped if nothing changed since the last
+        save or load"""
+
         feeds = [row[0] for row in klass.__feeds]
+        data = pickle.dumps(feeds, pickle.HIGHEST_PROTOCOL)
+        if data == klass.__written:
+            return
         f = file(FEEDS, "wb")
-        pickle.dump(feeds, f, pickle.HIGHEST_PROTOCOL)
+        f.write(data)
         f.close()
+        klass.__written = data
 
     @classmethod
     def init(klass, library):
         try:
-            feeds = pickle.load(file(FEEDS, "rb"))
+            data = file(FEEDS, "rb").read()
+            feeds = pickle.loads(data)
         except (pickle.PickleError, EnvironmentError, EOFError):
             pass
         else:
+            klass.__written = data
             for feed in feeds:
                 klass.__feeds.append(row=[feed])
         GLib.idle_add(klass.__do_check)
 
     @classmethod
     def __do_check(klass):
-        thread = threading.Thread(target=klass.__check, args=())
-        thread.setDaemon(True)
-        thread.start()
+        feeds = [row[0] for row in klass.__feeds
+                 if row[0].is_due(klass.CHECK_INTERVAL)]
+        klass.__refresher.refresh(feeds, klass.__check_done)
+        return False
 
     @classmethod
-    def __check(klass):
-        for row in klass.__feeds:
-            feed = row[0]
-            if feed.get_age() < 2 * 60 * 60:
-                continue
-            elif feed.parse():
-                feed.changed = True
-                row[0] = feed
-        klass.write()
+    def __check_done(klass, changed, updated):
+        if changed:
+            klass.changed(changed)
+        elif updated:
+            klass.write()
         GLib.timeout_add(60 * 60 * 1000, klass.__do_check)
 
     def Menu(self, songs, songlist, library):
@@ -451,8 +587,9 @@ class AudioFeeds(Browser, Gtk.VBox):
         AudioFeeds.write()
 
     def __refresh(self, feeds):
-        changed = filter(Feed.parse, feeds)
-        AudioFeeds.changed(changed)
+        def done(changed, updated):
+            AudioFeeds.changed(changed)
+        self.__refresher.refresh(feeds, done)
 
     def activate(self):
         self.__changed(self.__view.get_selection())
@@ -16,7 +16,7 @@ from quodlibet import util
 
 from quodlibet.browsers.albums import AlbumTagCompletion
 from quodlibet.browsers._base import Browser
-from quodlibet.parse import XMLFromPattern, Query
+from quodlibet.parse import XMLFromPattern
 from quodlibet.qltk.models import ObjectTreeStore, ObjectModelFilter
 from quodlibet.qltk.models import ObjectModelSort
 from quodlibet.qltk.searchbar import SearchBarBox
@@ -24,8 +24,9 @@ from quodlibet.qltk.songsmenu import SongsMenu
 from quodlibet.qltk.tagscombobox import TagsComboBoxEntry
 from quodlibet.qltk.views import AllTreeView, BaseView
 from quodlibet.qltk.x import ScrolledWindow, Alignment, SymbolicIconImage
+from quodlibet.util import gobject_weak
 from quodlibet.util.collection import Album
-from quodlibet.util.library import background_filter
+from quodlibet.util.library import IncrementalFilter
 from quodlibet.util.path import mkdir
 from quodlibet.util.thumbnails import scale
 
@@ -279,17 +280,15 @@ class CollectionModelMixin(object):
     def get_path_for_album(self, album):
         """Returns the path for an album or None"""
 
-        def func(model, path, iter_, result):
-            if model[iter_][0] is album:
-                # pygobject bug: treepath only valid in callback,
-                # so make a copy
-                result[0] = path.copy()
-                return True
-            return False
+        child_model = self.get_model()
+        for path in child_model.get_paths_for_album(album):
+            path = self.convert_child_path_to_path(path)
+            if path is not None:
+                return path
 
-        res = [None]
-        self.foreach(func, res)
-        return res[0]
+    def get_paths_for_album(self, album):
+        path = self.get_path_for_album(album)
+        return [path] if path is not None else []
 
     def get_albums_for_path(self, path):
         return self.get_albums_for_iter(self.get_iter(path))
@@ -312,7 +311,7 @@ class CollectionModelMixin(object):
     def get_markup(self, tags, iter_):
         obj = self.get_value(iter_, 0)
         if isinstance(obj, Album):
-            return PAT % obj
+            return PAT.format_cached(obj)
 
         if isinstance(obj, basestring):
             markup = util.escape(obj)
@@ -340,13 +339,41 @@ class CollectionSortModel(ObjectModelSort, CollectionModelMixin):
     pass
 
 
+def _iter_tree(tree, path=()):
+    """Yields (key path, album) for all albums in a tree"""
+
+    if isinstance(tree, list):
+        for album in tree:
+            yield path, album
+    else:
+        for key, value in tree.iteritems():
+            for entry in _iter_tree(value, path + (key,)):
+                yield entry
+
+
 class CollectionTreeStore(ObjectTreeStore, CollectionModelMixin):
+    """Keeps an index of all rows, so changes only have to touch the
+    affected nodes instead of walking the whole tree.
+
+    Nodes are identified by the keys of the nodes leading to them
+    (the empty tuple being the root); an album can be contained in
+    multiple nodes.
+    """
+
     def __init__(self):
         super(CollectionTreeStore, self).__init__(object)
         self.__tags = []
+        self.__reset()
+
+    def __reset(self):
+        # key path -> {child key or album: iter}
+        self.__children = {(): {}}
+        # album -> [key path of the parent node, ...]
+        self.__parents = {}
 
     def set_albums(self, tags, albums):
         self.clear()
+        self.__reset()
         self.__tags = tags
         self.add_albums(albums)
 
@@ -354,103 +381,77 @@ class CollectionTreeStore(ObjectTreeStore, CollectionModelMixin):
     def tags(self):
         return [t[0] for t in self.__tags]
 
-    def add_albums(self, albums):
-        def _add(tree, iter_=None):
-            # lowest level, add albums
-            if isinstance(tree, list):
-                for album in tree:
-                    self.append(parent=iter_, row=[album])
-                return
-
-            # move into existing nodes and remove them from tree
-            child = self.iter_children(iter_)
-            while child:
-                obj = self[child][0]
-                if obj in tree:
-                    _add(tree[obj], child)
-                    del tree[obj]
-                child = self.iter_next(child)
+    def get_path_for_album(self, album):
+        """Returns the path for an album or None"""
 
-            # add missing ones
-            for key, value in tree.iteritems():
-                _add(value, self.append(parent=iter_, row=[key]))
+        paths = self.get_paths_for_album(album)
+        if paths:
+            return paths[0]
+
+    def get_paths_for_album(self, album):
+        """Returns the paths of all rows containing the album"""
+
+        children = self.__children
+        return [self.get_path(children[path][album])
+                for path in self.__parents.get(album, [])]
+
+    def __get_node(self, path):
+        # returns the child map of a node, creates missing ones
+        nodes = self.__children.get(path)
+        if nodes is None:
+            parent = self.__get_node(path[:-1])
+            parent[path[-1]] = self.append(
+                parent=self.__get_iter(path[:-1]), row=[path[-1]])
+            nodes = self.__children[path] = {}
+        return nodes
+
+    def __get_iter(self, path):
+        if not path:
+            return None
+        return self.__children[path[:-1]][path[-1]]
 
-        _add(build_tree(self.__tags, albums))
+    def add_albums(self, albums):
+        parents = self.__parents
+        for path, album in _iter_tree(build_tree(self.__tags, albums)):
+            nodes = self.__get_node(path)
+            if album in nodes:
+                continue
+            nodes[album] = self.append(
+                parent=self.__get_iter(path), row=[album])
+            parents.setdefault(album, []).append(path)
 
     def remove_albums(self, albums):
-        # We can't get anything from the albums (they have no songs),
-        # so we have to look through everything.
-
-        def _remove_albums(albums, iter_=None):
-            child = self.iter_children(iter_)
-            while child:
-                _remove_albums(albums, child)
-                obj = self[child][0]
-                if isinstance(obj, Album):
-                    # remove albums
-                    if obj in albums:
-                        if not self.remove(child):
-                            child = None
-                        continue
-                    else:
-                        child = self.iter_next(child)
-                else:
-                    # clean up empty containers
-                    if not self.iter_has_child(child):
-                        if not self.remove(child):
-                            child = None
-                        continue
-                    else:
-                        child = self.iter_next(child)
-
-        _remove_albums(set(albums))
+        children = self.__children
+        for album in albums:
+            for path in self.__parents.pop(album, []):
+                nodes = children[path]
+                self.remove(nodes.pop(album))
+                # clean up empty containers
+                while path and not nodes:
+                    del children[path]
+                    nodes = children[path[:-1]]
+                    self.remove(nodes.pop(path[-1]))
+                    path = path[:-1]
 
     def change_albums(self, albums):
-        def _check_albums(tree, iter_=None, not_found=None):
-            if not_found is None:
-                not_found = set()
-
-            if isinstance(tree, list):
-                # save nodes that are not there anymore
-                child = self.iter_children(iter_)
-                while child:
-                    row = self[child]
-                    try:
-                        tree.remove(row[0])
-                    except ValueError:
-                        pass
-                    else:
-                        # it's still in the same position, trigger a redraw
-                        self.row_changed(row.path, row.iter)
-                    child = self.iter_next(child)
-                not_found.update(tree)
-                return not_found
-
-            child = self.iter_children(iter_)
-            while child:
-                obj = self[child][0]
-                if obj in tree:
-                    _check_albums(tree[obj], child, not_found)
-                    del tree[obj]
-                child = self.iter_next(child)
-
-            # everything left over changed
-            def _get_all(sub, found=None):
-                if found is None:
-                    found = set()
-                if isinstance(sub, list):
-                    found.update(sub)
-                    return found
-                for v in sub.itervalues():
-                    _get_all(v, found)
-                return found
-            not_found.update(_get_all(tree))
-
-            return not_found
-
-        not_found = _check_albums(build_tree(self.__tags, albums))
-        self.remove_albums(not_found)
-        self.add_albums(not_found)
+        albums = list(albums)
+        new_parents = {}
+        for path, album in _iter_tree(build_tree(self.__tags, albums)):
+            new_parents.setdefault(album, set()).add(path)
+
+        moved = []
+        for album in albums:
+            paths = self.__parents.get(album)
+            if paths and set(paths) == new_parents.get(album):
+                # it's still in the same position, trigger a redraw
+                for path in paths:
+                    iter_ = self.__children[path][album]
+                    self.row_changed(self.get_path(iter_), iter_)
+            else:
+                moved.append(album)
+
+        self.remove_albums(moved)
+        self.add_albums(moved)
 
 
 class CollectionView(AllTreeView):
@@ -503,6 +504,7 @@ class CollectionBrowser(Browser, Gtk.VBox, util.InstanceTracker):
     priority = 5
 
     __model = None
+    __restore_pending = False
 
     def pack(self, songpane):
         container = qltk.RHPaned()
@@ -569,8 +571,7 @@ class CollectionBrowser(Browser, Gtk.VBox, util.InstanceTracker):
         view.set_headers_visible(False)
         model_sort = CollectionSortModel(model=self.__model)
         model_filter = CollectionFilterModel(child_model=model_sort)
-        self.__filter = None
-        self.__bg_filter = background_filter()
+        self.__filter = IncrementalFilter()
         model_filter.set_visible_func(self.__parse_query)
         view.set_model(model_filter)
 
@@ -685,36 +686,35 @@ class CollectionBrowser(Browser, Gtk.VBox, util.InstanceTracker):
         self.view.get_selection().handler_unblock(self.__sig)
 
     def __parse_query(self, model, iter_, data):
-        f, b = self.__filter, self.__bg_filter
-        if f is None and b is None:
+        if not self.__filter.active:
             return True
 
-        def check_album(obj):
-            if b is None:
-                return f(obj)
-            if f is None:
-                return b(obj)
-            return f(obj) and b(obj)
+        match = self.__filter.match
 
         obj = model[iter_][0]
         if isinstance(obj, Album):
-            return check_album(obj)
+            return match(obj)
         else:
             for album in model.get_albums_for_iter(iter_):
-                if check_album(album):
+                if match(album):
                     return True
             return False
 
     def __update_filter(self, entry, text):
-        self.__filter = None
-        if not Query.match_all(text):
-            tags = self.__model.tags + ["album"]
-            self.__filter = Query(text, star=tags).search
-        self.__bg_filter = background_filter()
+        model = self.view.get_model()
 
-        self.view.get_model().refilter()
+        def get_visible():
+            albums = set()
+            for row in model:
+                albums.update(model.get_albums_for_iter(row.iter))
+            return albums
+
+        tags = self.__model.tags + ["album"]
+        self.__filter.search(text, tags, self.__albums.itervalues,
+                             get_visible, model.refilter)
 
     def __destroy(self, browser):
+        self.__filter.cancel()
         klass = type(browser)
         if not klass.instances():
             klass._destroy_model()
@@ -775,6 +775,14 @@ class CollectionBrowser(Browser, Gtk.VBox, util.InstanceTracker):
         self.view.get_selection().emit('changed')
 
     def restore(self):
+        if self.__albums.loading:
+            # the saved paths would point to the wrong rows, restore once
+            # all albums are there and don't overwrite them in save()
+            self.__restore_pending = True
+            gobject_weak(self.__albums.connect, "loaded",
+                         self.__restore_loaded, parent=self)
+            return
+
         paths = config.get("browsers", "collection", "").split("\t")
         paths = [tuple(map(int, path.split())) for path in paths]
         self.__inhibit()
@@ -792,7 +800,15 @@ class CollectionBrowser(Browser, Gtk.VBox, util.InstanceTracker):
         if album:
             self.view.select_album(album)
 
+    def __restore_loaded(self, albums):
+        if self.__restore_pending:
+            self.__restore_pending = False
+            self.restore()
+            self.activate()
+
     def save(self):
+        if self.__restore_pending:
+            return
         model, paths = self.view.get_selection().get_selected_rows()
         paths = "\t".join([" ".join(map(str, path)) for path in paths])
         config.set("browsers", "collection", paths)
@@ -11,8 +11,9 @@
 # needs them to be there.
 
 import os
+from collections import OrderedDict
 
-from gi.repository import Gtk, Gdk
+from gi.repository import Gtk, Gdk, GLib
 
 from quodlibet import config
 from quodlibet import formats
@@ -24,17 +25,63 @@ from quodlibet.library import SongFileLibrary
 from quodlibet.qltk.filesel import MainDirectoryTree
 from quodlibet.qltk.songsmenu import SongsMenu
 from quodlibet.qltk.x import ScrolledWindow
-from quodlibet.util import copool
 from quodlibet.util.library import get_scan_dirs
+from quodlibet.util.threadpool import ThreadPool
 from quodlibet.util.dprint import print_d
 from quodlibet.util.uri import URI
 from quodlibet.util.path import normalize_path
 
 
+# number of directory listings to keep
+MAX_LISTINGS = 1000
+
+
+def list_songs(dir_, cache, max_size=MAX_LISTINGS):
+    """Returns the normalized paths of all files in `dir_` which look like
+    songs. The result gets cached in `cache` until the directory mtime
+    changes. If `cache` is an OrderedDict, the least recently used of
+    more than `max_size` entries get dropped. Raises OSError.
+
+    The cache isn't locked, only use it from one thread.
+    """
+
+    path = util.fsnative(dir_)
+    mtime = os.path.getmtime(path)
+    entry = cache.pop(path, None)
+    if entry is None or entry[0] != mtime:
+        files = filter(formats.filter, sorted(os.listdir(path)))
+        files = [normalize_path(os.path.join(dir_, f), canonicalise=True)
+                 for f in files]
+        entry = (mtime, files)
+    cache[path] = entry
+    while len(cache) > max_size:
+        del cache[next(iter(cache))]
+    return entry[1]
+
+
+class SongLoad(object):
+    """The songs of a directory selection, collected by a worker"""
+
+    def __init__(self, dirs):
+        self.dirs = dirs
+        self.songs = []
+        self.cancelled = False
+        self.finished = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
 class FileSystem(Browser, Gtk.HBox):
     __gsignals__ = Browser.__gsignals__
 
     __library = None
+    # only used by the pool worker
+    __listings = OrderedDict()
+    __pool = ThreadPool(1, name="FileSystem")
+
+    # emit the first songs early, then in growing batches
+    BATCH_SIZE = 100
 
     name = _("File System")
     accelerated_name = _("_File System")
@@ -83,24 +130,33 @@ class FileSystem(Browser, Gtk.HBox):
                            targets, Gdk.DragAction.COPY)
         dt.connect('drag-data-get', self.__drag_data_get)
 
+        self.__load = None
+        # the last selection, can be reused for drag and drop
+        self.__last_load = None
         sel = dt.get_selection()
         sel.unselect_all()
-        sel.connect_object('changed', copool.add, self.__songs_selected, dt)
+        sel.connect_object('changed', self.__songs_selected, dt)
         if main:
             dt.connect('row-activated', lambda *a: self.emit("activated"))
         sw.add(dt)
         self.pack_start(sw, True, True, 0)
 
+        self.connect("destroy", self.__destroy)
+
         self.show_all()
 
+    def __destroy(self, *args):
+        if self.__load:
+            self.__load.cancel()
+            self.__load = None
+
     def get_child(self):
         return self.get_children()[0].get_child()
 
     def __drag_data_get(self, view, ctx, sel, tid, etime):
         model, rows = view.get_selection().get_selected_rows()
         dirs = [model[row][0] for row in rows]
-        for songs in self.__find_songs(view.get_selection()):
-            pass
+        songs = self.__find_songs(dirs)
         if tid == self.TARGET_QL:
             cant_add = filter(lambda s: not s.can_add, songs)
             if cant_add:
@@ -176,7 +232,7 @@ class FileSystem(Browser, Gtk.HBox):
         config.set("browsers", "filesystem", paths)
 
     def activate(self):
-        copool.add(self.__songs_selected, self.get_child())
+        self.__songs_selected(self.get_child())
 
     def Menu(self, songs, songlist, library):
         menu = SongsMenu(library, songs, remove=self.__remove_songs,
@@ -200,43 +256,107 @@ class FileSystem(Browser, Gtk.HBox):
         songs = filter(self.__glibrary.__contains__, songs)
         self.__library.librarian.move(songs, self.__glibrary, self.__library)
 
-    def __find_songs(self, selection):
-        model, rows = selection.get_selected_rows()
-        dirs = [model[row][0] for row in rows]
-        songs = []
-        to_add = []
-        for dir in dirs:
+    def __scan(self, load):
+        # Yields (filename, song, stale) for all songs in the directories.
+        # song is only set for newly parsed ones, stale if a library
+        # song needs to be reloaded. Doesn't change any library, so it
+        # can be run in a worker.
+
+        glibrary = self.__glibrary
+        library = self.__library
+        for dir_ in load.dirs:
             try:
-                for file in filter(formats.filter,
-                                   sorted(os.listdir(util.fsnative(dir)))):
-                    raw_path = os.path.join(dir, file)
-                    fn = normalize_path(raw_path, canonicalise=True)
-                    if fn in self.__glibrary:
-                        songs.append(self.__glibrary[fn])
-                    elif fn not in self.__library:
-                        song = formats.MusicFile(fn)
-                        if song:
-                            to_add.append(song)
-                            songs.append(song)
-                            yield songs
-                    if fn in self.__library:
-                        song = self.__library[fn]
-                        if not song.valid():
-                            self.__library.reload(song)
-                        if song in self.__library:
-                            songs.append(song)
+                filenames = list_songs(dir_, self.__listings)
             except OSError:
-                pass
-        self.__library.add(to_add)
-        yield songs
+                continue
+            for fn in filenames:
+                if load.cancelled:
+                    return
+                if fn in glibrary:
+                    yield fn, None, False
+                    continue
+                try:
+                    song = library[fn]
+                except KeyError:
+                    song = formats.MusicFile(fn)
+                    if song:
+                        yield fn, song, False
+                else:
+                    yield fn, None, not song.valid()
+
+    def __add_found(self, load, found):
+        # main loop: collect the found songs into the load,
+        # and put new songs into the browser library.
+
+        glibrary = self.__glibrary
+        library = self.__library
+        to_add = []
+        for fn, song, stale in found:
+            if fn in glibrary:
+                song = glibrary[fn]
+            elif fn in library:
+                song = library[fn]
+                if stale:
+                    library.reload(song)
+                    if song not in library:
+                        continue
+            elif song is not None:
+                to_add.append(song)
+            else:
+                continue
+            load.songs.append(song)
+        library.add(to_add)
+
+    def __find_songs(self, dirs):
+        load = self.__last_load
+        if load and load.finished and load.dirs == dirs:
+            return list(load.songs)
+
+        # the listings cache belongs to the pool worker
+        load = SongLoad(dirs)
+        job = self.__pool.add(
+            lambda: list(self.__scan(load)), priority=-1)
+        job.wait()
+        self.__add_found(load, job.result or [])
+        return load.songs
+
+    def __load_songs(self, load):
+        # worker
+        batch = []
+        size = self.BATCH_SIZE
+        for entry in self.__scan(load):
+            batch.append(entry)
+            if len(batch) >= size:
+                GLib.idle_add(self.__load_done, load, batch, False)
+                batch = []
+                size *= 2
+        GLib.idle_add(self.__load_done, load, batch, True)
+
+    def __load_done(self, load, found, finished):
+        if load.cancelled:
+            return
+
+        self.__add_found(load, found)
+        if finished:
+            print_d("Found %d songs in %d directories" % (
+                len(load.songs), len(load.dirs)))
+            load.finished = True
+            self.__load = None
+            if self.get_window():
+                self.get_window().set_cursor(None)
+        elif not found:
+            return
+        self.emit('songs-selected', list(load.songs), None)
 
     def __songs_selected(self, view):
+        if self.__load:
+            self.__load.cancel()
+
+        model, rows = view.get_selection().get_selected_rows()
+        dirs = [model[row][0] for row in rows]
+        self.__load = self.__last_load = load = SongLoad(dirs)
         if self.get_window():
             self.get_window().set_cursor(Gdk.Cursor.new(Gdk.CursorType.WATCH))
-        for songs in self.__find_songs(view.get_selection()):
-            yield True
-        if self.get_window():
-            self.get_window().set_cursor(None)
-        self.emit('songs-selected', songs, None)
+        self.__pool.add(self.__load_songs, load)
 
 browsers = [FileSystem]
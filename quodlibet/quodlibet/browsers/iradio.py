@@ -11,6 +11,8 @@ import bz2
 import urllib2
 import urllib
 import itertools
+import json
+import threading
 
 from gi.repository import Gtk, GLib, Pango
 
@@ -27,7 +29,7 @@ from quodlibet.parse import Query
 from quodlibet.qltk.getstring import GetStringDialog
 from quodlibet.qltk.songsmenu import SongsMenu
 from quodlibet.qltk.notif import Task
-from quodlibet.util import copool, gobject_weak, sanitize_tags
+from quodlibet.util import gobject_weak, sanitize_tags
 from quodlibet.util.string import decode, encode
 from quodlibet.util.uri import URI
 from quodlibet.qltk.views import AllTreeView
@@ -41,9 +43,10 @@ STATION_LIST_URL = \
     "http://bitbucket.org/lazka/quodlibet/downloads/radiolist.bz2"
 STATIONS_FAV = os.path.join(const.USERDIR, "stations")
 STATIONS_ALL = os.path.join(const.USERDIR, "stations_all")
+# HTTP validators of the downloaded list the STATIONS_ALL cache is based on
+STATIONS_ALL_INFO = os.path.join(const.USERDIR, "stations_all_info")
 
-# TODO: - Do the update in a thread
-#       - Ranking: reduce duplicate stations (max 3 URLs per station)
+# TODO: - Ranking: reduce duplicate stations (max 3 URLs per station)
 #                  prefer stations that match a genre?
 
 # Migration path for pickle
@@ -228,56 +231,134 @@ def add_station(uri):
     return irfs
 
 
-def download_taglist(callback, cofuncid, step=1024 * 10):
-    """Generator for loading the bz2 compressed tag list.
+class NotModified(Exception):
+    """Raised by fetch_taglist() if the server reports that the station
+    list hasn't changed since the last download"""
 
-    Calls callback with the decompressed data or None in case of
-    an error."""
 
-    with Task(_("Internet Radio"), _("Downloading station list")) as task:
-        if cofuncid:
-            task.copool(cofuncid)
+def iter_bz2_lines(fileobj, step=1024 * 16, progress=None):
+    """Reads bz2 compressed data from fileobj and yields the decompressed
+    lines without the line ending.
 
-        try:
-            response = urllib2.urlopen(STATION_LIST_URL)
-        except urllib2.URLError:
-            GLib.idle_add(callback, None)
-            return
+    progress gets called with the number of compressed bytes read so far.
+    Raises IOError or EOFError if the data is invalid.
+    """
 
+    decomp = bz2.BZ2Decompressor()
+    rest = ""
+    read = 0
+    while 1:
+        chunk = fileobj.read(step)
+        if not chunk:
+            break
+        read += len(chunk)
+        if progress:
+            progress(read)
+        lines = (rest + decomp.decompress(chunk)).split("\n")
+        rest = lines.pop()
+        for line in lines:
+            yield line
+    if rest:
+        yield rest
+
+
+def fetch_taglist(url=STATION_LIST_URL, etag=None, modified=None,
+                  progress=None):
+    """Downloads and parses the bz2 compressed tag list.
+
+    Blocks, so should be called in a thread. If etag or modified
+    (the ETag/Last-Modified headers of the last download) are given, the
+    request is conditional and NotModified gets raised in case the list
+    hasn't changed.
+
+    progress gets called with a float between 0 and 1 or None if the
+    size isn't known.
+
+    Returns a (stations, etag, modified) tuple.
+    Raises EnvironmentError (e.g. urllib2.URLError), EOFError or
+    NotModified.
+    """
+
+    request = urllib2.Request(url)
+    if etag:
+        request.add_header("If-None-Match", etag)
+    if modified:
+        request.add_header("If-Modified-Since", modified)
+
+    try:
+        response = urllib2.urlopen(request)
+    except urllib2.HTTPError, e:
+        if e.code == 304:
+            raise NotModified
+        raise
+
+    try:
+        info = response.info()
         try:
-            size = int(response.info().get("content-length", 0))
+            size = int(info.get("content-length", 0))
         except ValueError:
             size = 0
 
-        decomp = bz2.BZ2Decompressor()
+        def update(read):
+            if progress:
+                progress(min(float(read) / size, 1.0) if size else None)
 
-        data = ""
-        temp = ""
-        read = 0
-        while temp or not data:
-            read += len(temp)
+        stations = parse_taglist(iter_bz2_lines(response, progress=update))
+    finally:
+        response.close()
 
-            if size:
-                task.update(float(read) / size)
-            else:
-                task.pulse()
-            yield True
+    return stations, info.get("etag"), info.get("last-modified")
 
-            try:
-                data += decomp.decompress(temp)
-                temp = response.read(step)
-            except (IOError, EOFError):
-                data = None
-                break
-        response.close()
 
-        yield True
+def download_taglist(callback, url=STATION_LIST_URL, etag=None,
+                     modified=None):
+    """Downloads and parses the station list in a thread while showing
+    the progress in the status bar.
+
+    Calls callback(stations, etag, modified) in the main loop when done,
+    with stations being None in case of an error. If the list hasn't
+    changed since the download etag/modified belong to, the callback
+    doesn't get called.
+    """
+
+    task = Task(_("Internet Radio"), _("Downloading station list"))
+    # progress updates from the thread, coalesced in the main loop
+    state = {"fraction": None, "pending": False}
 
-        stations = None
-        if data:
-            stations = parse_taglist(data)
+    def show_progress():
+        state["pending"] = False
+        if state["fraction"] is None:
+            task.pulse()
+        else:
+            task.update(state["fraction"])
+        return False
+
+    def progress(fraction):
+        state["fraction"] = fraction
+        if not state["pending"]:
+            state["pending"] = True
+            GLib.idle_add(show_progress)
+
+    def done(result):
+        task.finish()
+        if result is not None:
+            callback(*result)
+        return False
+
+    def run():
+        try:
+            result = fetch_taglist(url, etag, modified, progress)
+        except NotModified:
+            print_d("Station list not modified")
+            result = None
+        except (EnvironmentError, EOFError), e:
+            print_w("Downloading station list failed: %r" % e)
+            result = (None, None, None)
+        GLib.idle_add(done, result)
 
-        GLib.idle_add(callback, stations)
+    thread = threading.Thread(target=run, name="radio-load")
+    thread.daemon = True
+    thread.start()
 
 
 def parse_taglist(data):
@@ -290,43 +371,79 @@ def parse_taglist(data):
     uri=http://...
     ...
 
+    data can be a string or an iterable of lines. If a tag repeats for
+    a station the last value wins.
     """
 
+    if isinstance(data, basestring):
+        data = data.split("\n")
+
     stations = []
     station = None
+    # sanitize_tags results; most genre/format/bitrate lines repeat
+    sanitized = {}
+
+    for line in data:
+        key, sep, value = line.partition("=")
+        if not sep:
+            continue
 
-    for l in data.split("\n"):
-        key = l.split("=")[0]
-        value = l.split("=", 1)[1]
         if key == "uri":
-            if station:
+            if station is not None:
                 stations.append(station)
             station = IRFile(value)
             continue
 
-        value = decode(value)
-        san = sanitize_tags({key: value}, stream=True).items()
-        if not san:
+        if station is None:
             continue
 
-        key, value = san[0]
-        if key == "~listenerpeak":
-            key = "~#listenerpeak"
-            value = int(value)
+        cache_key = (key, value)
+        try:
+            san = sanitized[cache_key]
+        except KeyError:
+            san = sanitize_tags({key: decode(value)}, stream=True).items()
+            if san:
+                key, value = san[0]
+                if key == "~listenerpeak":
+                    key = "~#listenerpeak"
+                    value = int(value)
+                san = (key, value)
+            else:
+                san = None
+            sanitized[cache_key] = san
 
-        if isinstance(value, str):
-            value = value.decode("utf-8")
-            if value not in station.list(key):
-                station.add(key, value)
-        else:
-            station[key] = value
+        if not san:
+            continue
 
-    if station:
+        key, value = san
+        station[key] = value
+
+    if station is not None:
         stations.append(station)
 
     return stations
 
 
+def load_validators(filename):
+    """Returns the (etag, modified) pair saved with save_validators()
+    or (None, None)"""
+
+    try:
+        with open(filename, "rb") as h:
+            data = json.load(h)
+        return data.get("etag"), data.get("modified")
+    except (EnvironmentError, ValueError, AttributeError):
+        return None, None
+
+
+def save_validators(filename, etag, modified):
+    try:
+        with util.atomic_save(filename, ".tmp", "wb") as h:
+            json.dump({"etag": etag, "modified": modified}, h)
+    except EnvironmentError:
+        util.print_exc()
+
+
 class AddNewStation(GetStringDialog):
     def __init__(self, parent):
         super(AddNewStation, self).__init__(
@@ -669,10 +786,17 @@ class InternetRadio(Gtk.VBox, Browser, util.InstanceTracker):
 
     def __update(self, *args):
         self.qbar.hide()
-        copool.add(download_taglist, self.__update_done,
-                   cofuncid="radio-load", funcid="radio-load")
+        etag, modified = None, None
+        if len(self.__stations):
+            # only ask for changes if we have something to compare with
+            etag, modified = load_validators(STATIONS_ALL_INFO)
+        download_taglist(self.__update_done, etag=etag, modified=modified)
+
+    def __update_done(self, stations, etag, modified):
+        if self.__stations is None:
+            # all browsers got closed in the meantime
+            return
 
-    def __update_done(self, stations):
         if not stations:
             print_w("Loading remote station list failed.")
             return
@@ -739,6 +863,10 @@ class InternetRadio(Gtk.VBox, Browser, util.InstanceTracker):
         self.__stations.changed(to_change)
         self.__stations.add(to_add)
 
+        # save the cache now, so the validators always match it
+        self.__stations.save()
+        save_validators(STATIONS_ALL_INFO, etag, modified)
+
     def __filter_changed(self, bar, text, restore=False):
         self.__filter = None
         if not Query.match_all(text):
@@ -481,40 +481,44 @@ class MediaDevices(Gtk.VBox, Browser, util.InstanceTracker):
         wlb.setup(len(songs), _("Copying <b>%(song)s</b>"), {'song': ''})
         wlb.show()
 
-        model = songlist.get_model()
-        for song in songs:
-            label = util.escape(song('~artist~title'))
-            if wlb.step(song=label):
-                wlb.hide()
-                break
-
-            if len(model) > 0:
-                songlist.scroll_to_cell(model[-1].path)
-            while Gtk.events_pending():
-                Gtk.main_iteration()
+        if device.copy_songs:
+            self.__sync_songs(device, songlist, songs)
+        else:
+            model = songlist.get_model()
+            for song in songs:
+                label = util.escape(song('~artist~title'))
+                if wlb.step(song=label):
+                    wlb.hide()
+                    break
 
-            space, free = device.get_space()
-            if free < os.path.getsize(song['~filename']):
-                wlb.hide()
-                qltk.WarningMessage(
-                    self, _("Unable to copy song"),
-                    _("There is not enough free space for this song.")
-                ).run()
-                break
+                if len(model) > 0:
+                    songlist.scroll_to_cell(model[-1].path)
+                while Gtk.events_pending():
+                    Gtk.main_iteration()
+
+                space, free = device.get_space()
+                if free < os.path.getsize(song['~filename']):
+                    wlb.hide()
+                    qltk.WarningMessage(
+                        self, _("Unable to copy song"),
+                        _("There is not enough free space for this song.")
+                    ).run()
+                    break
 
-            status = device.copy(songlist, song)
-            if isinstance(status, AudioFile):
-                model.append([status])
-                try:
-                    self.__cache[device.bid].append(song)
-                except KeyError:
-                    pass
-                self.__refresh_space(device)
-            else:
-                msg = _("<b>%s</b> could not be copied.") % label
-                if type(status) == unicode:
-                    msg += "\n\n" + util.escape(status)
-                qltk.WarningMessage(self, _("Unable to copy song"), msg).run()
+                status = device.copy(songlist, song)
+                if isinstance(status, AudioFile):
+                    model.append([status])
+                    try:
+                        self.__cache[device.bid].append(song)
+                    except KeyError:
+                        pass
+                    self.__refresh_space(device)
+                else:
+                    msg = _("<b>%s</b> could not be copied.") % label
+                    if type(status) == unicode:
+                        msg += "\n\n" + util.escape(status)
+                    qltk.WarningMessage(
+                        self, _("Unable to copy song"), msg).run()
 
         if device.cleanup and not device.cleanup(wlb, 'copy'):
             pass
@@ -524,6 +528,44 @@ class MediaDevices(Gtk.VBox, Browser, util.InstanceTracker):
         self.__busy = False
         return True
 
+    def __sync_songs(self, device, songlist, songs):
+        wlb = self.__statusbar
+        model = songlist.get_model()
+
+        def progress(song, done, total):
+            wlb.count = total
+            if song is not None:
+                if wlb.step(song=util.escape(song('~artist~title'))):
+                    return True
+            while Gtk.events_pending():
+                Gtk.main_iteration()
+            return wlb.quit
+
+        results = device.copy_songs(songlist, songs, progress)
+
+        # replace overwritten songs
+        copies = [r for (s, r) in results if isinstance(r, AudioFile)]
+        filenames = set(c['~filename'] for c in copies)
+        for row in list(model):
+            if row[0]['~filename'] in filenames:
+                model.remove(row.iter)
+        for copy in copies:
+            model.append([copy])
+        if device.bid in self.__cache:
+            cache = self.__cache[device.bid]
+            cache[:] = [s for s in cache if s['~filename'] not in filenames]
+            cache.extend(copies)
+        self.__refresh_space(device)
+
+        failed = [(s, r) for (s, r) in results if not isinstance(r, AudioFile)]
+        if failed:
+            song, status = failed[0]
+            label = util.escape(song('~artist~title'))
+            msg = _("<b>%s</b> could not be copied.") % label
+            if type(status) == unicode:
+                msg += "\n\n" + util.escape(status)
+            qltk.WarningMessage(self, _("Unable to copy song"), msg).run()
+
     def __delete_songs(self, songs):
         model, iter = self.__view.get_selection().get_selected()
         if not iter:
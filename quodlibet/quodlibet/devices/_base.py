@@ -106,6 +106,16 @@ class Device(dict):
     def copy(self, songlist, song):
         raise NotImplementedError
 
+    # Copies a list of songs to the device at once, skipping songs which
+    # are already there. If available it gets used instead of copy().
+    # progress(song, done, total) should be called regularly, song being
+    # None if no new song is done; if it returns True, copying should
+    # stop. Should return a list of (song, result) tuples, with result
+    # being the new AudioFile or a string describing the error.
+    #
+    # def copy_songs(self, songlist, songs, progress): ...
+    copy_songs = None
+
     # Deletes a song from the device. This will be called once for
     # each song. This is not needed if the device is file-based,
     # i.e. the songs returned by list() have is_file set to True. If
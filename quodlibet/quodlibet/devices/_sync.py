@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+# Copyright 2014 Quod Libet contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as
+# published by the Free Software Foundation
+
+"""Copies songs to file based devices.
+
+The songs to copy get compared with the device library first; songs
+already on the device with the same size and not older than the source
+file get skipped. The rest gets copied in a pool of worker threads,
+while library changes and progress reporting stay in the calling thread.
+
+If a Transcoder is passed, songs it handles get transcoded (or taken from
+its cache) in the workers before being copied.
+"""
+
+import os
+import copy
+import shutil
+import Queue
+
+from quodlibet import const
+from quodlibet import formats
+from quodlibet.util.dprint import print_d, print_w
+from quodlibet.util.path import fsencode
+from quodlibet.util.threadpool import ThreadPool
+
+
+class DeviceSync(object):
+    """Syncs songs to a directory.
+
+    library -- the SongFileLibrary of songs on the device
+    get_target -- returns the filename on the device for a song
+    write_cover -- gets called with a song and the target directory
+                   once for each directory songs got copied to
+    transcoder -- an optional Transcoder for songs the device can't play
+    """
+
+    # how often progress() gets called while waiting for a copy to finish
+    POLL_INTERVAL = 0.05
+
+    def __init__(self, library, get_target, write_cover=None,
+                 max_workers=4, transcoder=None):
+        self.library = library
+        self.get_target = get_target
+        self.write_cover = write_cover
+        self.transcoder = transcoder
+        self.max_workers = max_workers
+        self.cancelled = False
+
+    def is_synced(self, song, target):
+        """If the song is already on the device at target"""
+
+        try:
+            copied = self.library[target]
+        except KeyError:
+            return False
+
+        if self._needs_transcode(song):
+            # sizes differ, but a newer copy means the source didn't change
+            return copied("~#mtime") >= song("~#mtime")
+        return (copied("~#filesize") == song("~#filesize") and
+                copied("~#mtime") >= song("~#mtime"))
+
+    def diff(self, songs):
+        """Returns a list of (song, target) tuples for all songs which
+        need to be copied.
+        """
+
+        to_copy = []
+        seen = set()
+        for song in songs:
+            target = self.get_target(song)
+            if self._needs_transcode(song):
+                target = self.transcoder.get_target(target)
+            if target in seen:
+                continue
+            seen.add(target)
+            if not self.is_synced(song, target):
+                to_copy.append((song, target))
+
+        print_d("%d of %d songs need to be copied" % (
+            len(to_copy), len(songs)))
+        return to_copy
+
+    def _needs_transcode(self, song):
+        return bool(self.transcoder and self.transcoder.needs_transcode(song))
+
+    def get_size(self, items):
+        """The number of bytes needed for copying (song, target) items.
+        Transcoded songs are assumed to not get bigger.
+        """
+
+        return sum(s("~#filesize") for s, t in items)
+
+    def cancel(self):
+        """Skip all files which aren't copied yet"""
+
+        self.cancelled = True
+
+    def copy(self, items, progress=None):
+        """Copy all (song, target) items and add the copies to the
+        device library.
+
+        progress(song, done, total) gets called after each copied song
+        and with song=None while waiting. If it returns True, all songs
+        not copied yet get skipped.
+
+        Returns a list of (song, result) tuples, with result being the
+        new AudioFile or an error message. Skipped songs are not
+        included.
+        """
+
+        results = Queue.Queue()
+        pool = ThreadPool(self.max_workers, name="DeviceSync")
+        for song, target in items:
+            pool.add(self._copy_song, song, target, results)
+
+        copied = []
+        done = []
+        total = len(items)
+        while len(done) < total:
+            try:
+                song, target, result = results.get(
+                    timeout=self.POLL_INTERVAL)
+            except Queue.Empty:
+                song = None
+            else:
+                if result is not None:
+                    done.append((song, result))
+                    if not isinstance(result, basestring):
+                        copied.append((song, target, result))
+                else:
+                    total -= 1
+
+            if progress and progress(song, len(done), total):
+                self.cancel()
+        pool.stop()
+
+        self._add_copies(copied)
+        if self.write_cover:
+            self._write_covers(copied)
+
+        print_d("Copied %d songs" % len(copied))
+        return done
+
+    def _copy_song(self, song, target, results):
+        # worker thread
+        if self.cancelled:
+            results.put((song, target, None))
+            return
+
+        try:
+            dirname = os.path.dirname(target)
+            try:
+                os.makedirs(dirname)
+            except OSError:
+                # might have been created by another worker
+                if not os.path.isdir(dirname):
+                    raise
+            if self._needs_transcode(song):
+                source = self.transcoder.transcode(song)
+                shutil.copyfile(source, target)
+                # the tags are written already, but not all stream info
+                # is known to the source song
+                result = formats.MusicFile(target)
+                if result is None:
+                    raise IOError("Can't load %r" % target)
+            else:
+                shutil.copyfile(fsencode(song["~filename"]), target)
+                result = copy.deepcopy(song)
+                result.sanitize(target)
+        except Exception as e:
+            # (OSError, IOError) mostly, but the caller waits for a result
+            result = str(e).decode(const.ENCODING, "replace")
+        results.put((song, target, result))
+
+    def _add_copies(self, copied):
+        library = self.library
+        library.remove([library[t] for s, t, c in copied if t in library])
+        library.add([c for s, t, c in copied])
+
+    def _write_covers(self, copied):
+        # one cover per target directory, taken from the source song
+        dirs = {}
+        for song, target, result in copied:
+            dirs.setdefault(os.path.dirname(target), song)
+
+        for dirname, song in dirs.iteritems():
+            try:
+                self.write_cover(song, dirname)
+            except Exception as e:
+                print_w("Writing cover to %r failed: %r" % (dirname, e))
@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+# Copyright 2014 Quod Libet contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as
+# published by the Free Software Foundation
+
+"""Transcodes songs to a format a device can play, using GStreamer.
+
+Transcoded files get stored in a cache, named after a hash of the source
+file content and the encoder pipeline, so syncing again or syncing the
+same song to another device reuses them. The tags get copied using the
+format classes.
+
+Transcoding blocks, so it should be done in a worker thread.
+"""
+
+import os
+import hashlib
+import threading
+
+from gi.repository import GLib
+
+from quodlibet import const
+from quodlibet import formats
+from quodlibet.util.dprint import print_d
+from quodlibet.util.path import fsencode, mkdir
+
+try:
+    from gi.repository import Gst
+except ImportError:
+    Gst = None
+else:
+    from quodlibet.player.gstbe.util import make_decodebin
+
+
+CACHE = os.path.join(const.USERDIR, "cache", "transcode")
+
+# bytes kept in the cache after a sync
+MAX_CACHE_SIZE = 2 * 1024 ** 3
+
+# name -> (encoder pipeline, file extension)
+ENCODERS = {
+    "mp3": ("audioconvert ! audioresample ! "
+            "lamemp3enc target=quality quality=2 ! xingmux", "mp3"),
+    "ogg": ("audioconvert ! audioresample ! vorbisenc quality=0.5 ! oggmux",
+            "ogg"),
+    "flac": ("audioconvert ! flacenc", "flac"),
+}
+
+# extensions of files most portable players can't play
+DEFAULT_SOURCES = "flac opus wv ape wav aif aiff mpc"
+
+
+class TranscodeError(Exception):
+    pass
+
+
+def get_file_hash(filename, _cache={}):
+    """A sha1 hex digest of the file content. The result is cached as long
+    as the file size and mtime don't change.
+    """
+
+    stat = os.stat(filename)
+    key = (filename, stat.st_size, stat.st_mtime)
+    if key not in _cache:
+        digest = hashlib.sha1()
+        with open(filename, "rb") as h:
+            for block in iter(lambda: h.read(2 ** 20), ""):
+                digest.update(block)
+        _cache[key] = digest.hexdigest()
+    return _cache[key]
+
+
+class Transcoder(object):
+    """Transcodes songs with one of the ENCODERS.
+
+    encoder -- a key of ENCODERS
+    sources -- the file extensions which should get transcoded
+    cache -- the cache directory
+    """
+
+    def __init__(self, encoder, sources=DEFAULT_SOURCES, cache=CACHE):
+        self.pipeline, self.extension = ENCODERS[encoder]
+        if isinstance(sources, basestring):
+            sources = sources.replace(",", " ").split()
+        self.sources = set(e.lower().lstrip(".") for e in sources)
+        self.cache = cache
+        self._lock = threading.Lock()
+
+    def is_available(self):
+        """If GStreamer and all elements of the pipeline are available"""
+
+        if Gst is None:
+            return False
+        try:
+            Gst.parse_bin_from_description(self.pipeline, True)
+        except GLib.GError:
+            return False
+        return True
+
+    def needs_transcode(self, song):
+        """If the song should be transcoded"""
+
+        ext = os.path.splitext(song["~filename"])[-1].lower().lstrip(".")
+        return ext in self.sources and ext != self.extension
+
+    def get_target(self, target):
+        """Changes the extension of a device filename"""
+
+        return os.path.splitext(target)[0] + "." + self.extension
+
+    def get_cache_path(self, song):
+        source = fsencode(song["~filename"])
+        digest = hashlib.sha1(get_file_hash(source))
+        digest.update(self.pipeline)
+        name = "%s.%s" % (digest.hexdigest(), self.extension)
+        return os.path.join(self.cache, name)
+
+    def transcode(self, song):
+        """Returns the filename of the transcoded song, transcoding it
+        first if it isn't in the cache. Raises TranscodeError.
+        """
+
+        path = self.get_cache_path(song)
+        if os.path.exists(path):
+            # keep track of the last use for clean()
+            os.utime(path, None)
+            return path
+
+        with self._lock:
+            mkdir(self.cache)
+        temp = self._get_temp_path(path)
+        try:
+            self._encode(fsencode(song["~filename"]), temp)
+            self._copy_tags(song, temp)
+            os.rename(temp, path)
+        except EnvironmentError as e:
+            raise TranscodeError(str(e))
+        finally:
+            if os.path.exists(temp):
+                os.unlink(temp)
+
+        print_d("Transcoded %r" % song["~filename"])
+        return path
+
+    def _get_temp_path(self, path):
+        # keeps the extension, the format classes get picked by it
+        base, ext = os.path.splitext(path)
+        return "%s.%d.tmp%s" % (base, threading.current_thread().ident, ext)
+
+    def _encode(self, source, target):
+        if Gst is None:
+            raise TranscodeError("GStreamer missing")
+
+        pipe = Gst.Pipeline()
+        filesrc = Gst.ElementFactory.make("filesrc", None)
+        filesrc.set_property("location", source)
+        try:
+            encode = Gst.parse_bin_from_description(self.pipeline, True)
+        except GLib.GError as e:
+            raise TranscodeError(e.message)
+        decode = make_decodebin(encode)
+        filesink = Gst.ElementFactory.make("filesink", None)
+        filesink.set_property("location", target)
+
+        for element in [filesrc, decode, encode, filesink]:
+            pipe.add(element)
+        filesrc.link(decode)
+        encode.link(filesink)
+
+        bus = pipe.get_bus()
+        pipe.set_state(Gst.State.PLAYING)
+        try:
+            message = bus.timed_pop_filtered(
+                Gst.CLOCK_TIME_NONE,
+                Gst.MessageType.EOS | Gst.MessageType.ERROR)
+            if message.type == Gst.MessageType.ERROR:
+                gerror, debug = message.parse_error()
+                raise TranscodeError(gerror.message)
+        finally:
+            pipe.set_state(Gst.State.NULL)
+
+    def _copy_tags(self, song, filename):
+        encoded = formats.MusicFile(filename)
+        if encoded is None:
+            raise TranscodeError("Can't load %r" % filename)
+        for key in song.realkeys():
+            if encoded.can_change(key):
+                encoded[key] = song[key]
+        encoded.write()
+
+    def clean(self, max_size):
+        """Remove the least recently used files until the cache is smaller
+        than `max_size` bytes.
+        """
+
+        try:
+            names = os.listdir(self.cache)
+        except OSError:
+            return
+
+        entries = []
+        total = 0
+        for name in names:
+            path = os.path.join(self.cache, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+
+        entries.sort()
+        while entries and total > max_size:
+            mtime, size, path = entries.pop(0)
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+            total -= size
@@ -16,15 +16,28 @@ from quodlibet import util
 from quodlibet import const
 
 from quodlibet.devices._base import Device
+from quodlibet.devices._sync import DeviceSync
+from quodlibet.devices._transcode import (Transcoder, ENCODERS,
+    DEFAULT_SOURCES, MAX_CACHE_SIZE)
 from quodlibet.library import SongFileLibrary
 from quodlibet.parse import FileFromPattern
 from quodlibet.qltk import ConfirmAction
 from quodlibet.util.path import (fsencode, mtime, escape_filename,
     strip_win32_incompat)
+from quodlibet.util.dprint import print_w
+from quodlibet.util.threadpool import get_num_workers
 
 CACHE = os.path.join(const.USERDIR, 'cache')
 
 
+def _write_cover(song, dirname):
+    coverfile = os.path.join(dirname, 'folder.jpg')
+    cover = song.find_cover()
+    if cover and mtime(cover.name) > mtime(coverfile):
+        image = GdkPixbuf.Pixbuf.new_from_file_at_size(cover.name, 200, 200)
+        image.savev(coverfile, "jpeg", [], [])
+
+
 class StorageDevice(Device):
     protocol = 'storage'
 
@@ -32,6 +45,8 @@ class StorageDevice(Device):
         'pattern': '<artist>/<album>/<title>',
         'covers': True,
         'unclutter': True,
+        'transcode': '',
+        'transcode_from': DEFAULT_SOURCES,
     }
 
     __library = None
@@ -64,6 +79,18 @@ class StorageDevice(Device):
         props.append((_("_Remove unused covers and directories"),
             check, 'unclutter'))
 
+        entry = Gtk.Entry()
+        entry.set_text(self['transcode'])
+        entry.set_tooltip_text(
+            _("Convert songs to this format when copying: %s") %
+            ", ".join(sorted(ENCODERS)))
+        props.append((_("_Transcode to:"), entry, 'transcode'))
+
+        entry = Gtk.Entry()
+        entry.set_text(self['transcode_from'])
+        entry.set_tooltip_text(_("File extensions of songs to transcode"))
+        props.append((_("Transcode _from:"), entry, 'transcode_from'))
+
         return props
 
     def list(self, wlb):
@@ -85,6 +112,49 @@ class StorageDevice(Device):
         self.__save_library()
         return self.__library.values()
 
+    def __get_target(self, song):
+        if not self.__pattern:
+            self.__set_pattern()
+        return fsencode(strip_win32_incompat(self.__pattern.format(song)))
+
+    def __get_transcoder(self):
+        encoder = self['transcode'].strip().lower()
+        if not encoder:
+            return
+        if encoder not in ENCODERS:
+            print_w("Unknown transcode format %r" % encoder)
+            return
+        transcoder = Transcoder(encoder, self['transcode_from'])
+        if not transcoder.is_available():
+            print_w("GStreamer elements for %r missing" % encoder)
+            return
+        return transcoder
+
+    def copy_songs(self, songlist, songs, progress):
+        self.__load_library()
+
+        write_cover = self['covers'] and _write_cover or None
+        transcoder = self.__get_transcoder()
+        if transcoder:
+            # encoding is CPU bound, copying mostly IO bound
+            sync = DeviceSync(self.__library, self.__get_target, write_cover,
+                              max_workers=get_num_workers(),
+                              transcoder=transcoder)
+        else:
+            sync = DeviceSync(self.__library, self.__get_target, write_cover)
+        items = sync.diff(songs)
+
+        space, free = self.get_space()
+        if free < sync.get_size(items):
+            error = _("There is not enough free space for this song.")
+            return [(song, error) for song, target in items]
+
+        results = sync.copy(items, progress)
+        self.__save_library()
+        if transcoder:
+            transcoder.clean(MAX_CACHE_SIZE)
+        return results
+
     def copy(self, songlist, song):
         if not self.__pattern:
             self.__set_pattern()
@@ -116,12 +186,7 @@ class StorageDevice(Device):
             shutil.copyfile(fsencode(song['~filename']), target)
 
             if self['covers']:
-                coverfile = os.path.join(dirname, 'folder.jpg')
-                cover = song.find_cover()
-                if cover and mtime(cover.name) > mtime(coverfile):
-                    image = GdkPixbuf.Pixbuf.new_from_file_at_size(
-                        cover.name, 200, 200)
-                    image.savev(coverfile, "jpeg", [], [])
+                _write_cover(song, dirname)
 
             song = copy.deepcopy(song)
             song.sanitize(target)
@@ -24,21 +24,51 @@ except ImportError as e:
 
 
 from quodlibet import print_d
+from quodlibet import formats
 from quodlibet.plugins.events import EventPlugin
 from quodlibet.util.library import get_scan_dirs
+from quodlibet.util.threadpool import ThreadPool
 from quodlibet import app
 from gi.repository import GLib
 import os
+import threading
+import time
+
+
+def _remove_nested(paths):
+    """Returns the paths which aren't below one of the others"""
+
+    result = []
+    for path in sorted(paths):
+        if not result or not path.startswith(result[-1] + os.sep):
+            result.append(path)
+    return result
 
 
 class LibraryEvent(ProcessEvent):
-    """pynotify event handler for library changes"""
+    """pynotify event handler for library changes.
+
+    Events only get recorded per path. Once no new events came in for
+    DELAY milliseconds (or MAX_DELAY passed), all of them get applied
+    at once: new files get walked and loaded in a worker thread and the
+    library gets a single 'added', 'removed' and 'changed' signal.
+    """
+
+    DELAY = 500
+    MAX_DELAY = 5000
 
     # Slightly dodgy state mechanism for updates
     _being_created = set()
 
     def __init__(self, library):
         self._library = library
+        self._lock = threading.Lock()
+        self._added = set()
+        self._removed = set()
+        self._first_event = None
+        self._last_event = None
+        # one worker, so batches get applied in order
+        self._pool = ThreadPool(1, name="AutoLibraryUpdate")
 
     def process_default(self, event):
         print_d('Uncaught event for %s' % (event.maskname if event else "??"))
@@ -47,80 +77,149 @@ class LibraryEvent(ProcessEvent):
         path = os.path.join(event.path, event.name)
         # No need to add files for modifications only
         if path in self._being_created:
-            GLib.idle_add(self.add, event)
+            self._queue(added=path)
             self._being_created.remove(path)
         elif event.path in self._being_created:
             # The first file per new-directory gets missed for me (bug?)
             # TODO: so work out how/when to remove parent path properly
-            GLib.idle_add(self.add, event)
+            self._queue(added=path)
             self._being_created.remove(event.path)
         else:
             print_d("Ignoring modification on %s" % path)
 
     def process_IN_MOVED_TO(self, event):
         print_d('Triggered for "%s"' % event.name)
-        GLib.idle_add(self.add, event)
+        self._queue(added=os.path.join(event.path, event.name))
 
     def process_IN_CREATE(self, event):
         #print_d('Triggered for "%s"' % event.name)
         # Just remember that they've been created, process in further updates
         path = os.path.join(event.path, event.name)
         self._being_created.add(path)
+        if event.dir:
+            # files copied before the watch got added only show up here
+            self._queue(added=path)
 
     def process_IN_DELETE(self, event):
         print_d('Triggered for "%s"' % event.name)
-        GLib.idle_add(self.update, event)
+        self._queue(removed=os.path.join(event.path, event.name))
 
     def process_IN_MOVED_FROM(self, event):
         print_d('Triggered for "%s"' % event.name)
-        GLib.idle_add(self.update, event)
+        self._queue(removed=os.path.join(event.path, event.name))
+
+    def _queue(self, added=None, removed=None):
+        """Record a changed path and start the timer for the batch"""
+
+        with self._lock:
+            # the last event for a path wins
+            if added is not None:
+                self._removed.discard(added)
+                self._added.add(added)
+            if removed is not None:
+                self._added.discard(removed)
+                self._removed.add(removed)
+
+            self._last_event = time.time()
+            if self._first_event is None:
+                self._first_event = self._last_event
+                GLib.timeout_add(self.DELAY, self._check)
+
+    def _check(self):
+        """Starts processing the batch if there were no new events for
+        DELAY milliseconds. Returns True to be called again."""
+
+        with self._lock:
+            now = time.time()
+            if (now - self._last_event < self.DELAY / 1000.0 and
+                    now - self._first_event < self.MAX_DELAY / 1000.0):
+                return True
+            added = _remove_nested(self._added)
+            removed = _remove_nested(self._removed)
+            self._added = set()
+            self._removed = set()
+            self._first_event = None
+
+        self.flush(added, removed)
+        return False
+
+    def flush(self, added, removed):
+        """Process a batch of added and removed paths (files or
+        directories)"""
+
+        print_d("Processing %d added, %d removed path(s)" % (
+            len(added), len(removed)))
 
-    def add(self, event):
-        """Add a library file / folder based on an incoming event"""
         lib = self._library
-        path = os.path.join(event.path, event.name)
-        if event.dir:
-            print_d('Scanning directories...')
-            songs = []
-            for path, dnames, fnames in os.walk(path):
-                print_d('Found %d file(s) in "%s"' % (len(fnames), path))
-                for filename in (os.path.join(path, fn) for fn in fnames):
-                    song = lib.add_filename(filename, add=False)
-                    if song:
+        to_check = []
+        for path in removed:
+            # removed paths can't be checked for being a directory
+            item = lib.get(path)
+            if item is not None:
+                to_check.append(item)
+            to_check.extend(lib.path_index.iter_subtree(path))
+        if to_check:
+            print_d('Reloading %d matching songs(s)' % len(to_check))
+
+        self._pool.add(self._scan, added, to_check)
+
+    def _scan(self, paths, to_check):
+        # worker thread
+        lib = self._library
+        songs = []
+        stale = []
+        for path in paths:
+            if os.path.isdir(path):
+                print_d('Scanning directories...')
+                filenames = (os.path.join(root, fn)
+                             for root, dnames, fnames in os.walk(path)
+                             for fn in fnames)
+            else:
+                filenames = [path]
+
+            for filename in filenames:
+                song = lib.get(filename)
+                if song is not None:
+                    # replaced by another file
+                    if not song.valid():
+                        stale.append(song)
+                elif formats.filter(filename):
+                    song = formats.MusicFile(filename)
+                    if song is not None:
                         songs.append(song)
-            lib.add(songs)
-        else:
-            lib.add_filename(path)
-        return False
 
-    def update(self, event):
-        """Update a library / file. Typically this means deleting it"""
+        GLib.idle_add(self._apply, songs, to_check + stale)
+
+    def _apply(self, songs, to_check):
         lib = self._library
-        path = os.path.join(event.path, event.name)
-        if event.dir:
-            print_d('Checking directory %s...' % path)
-            to_reload = []
-            for filename in lib._contents:
-                if filename.startswith(path):
-                    item = lib.get(filename, None)
-                    if item:
-                        # Don't modify whilst iterating...
-                        to_reload.append(item)
-            print_d('Reloading %d matching songs(s)' % len(to_reload))
-            for item in to_reload:
-                lib.reload(item)
-        else:
-            item = lib.get(path, None)
-            if item:
-                lib.reload(item)
+        changed, removed = set(), set()
+        for item in to_check:
+            lib.reload(item, changed, removed)
+        if removed:
+            lib.emit('removed', removed)
+        if changed:
+            lib.changed(changed)
+        new = [s for s in songs if s.key not in lib]
+        if new:
+            lib.add(new)
+        print_d("Added %d, removed %d, changed %d song(s)" % (
+            len(new), len(removed), len(changed)))
         return False
 
+    def wait(self):
+        """Block until all batches are loaded"""
+
+        self._pool.wait()
+
+    def destroy(self):
+        self._pool.stop()
+
 
 class AutoLibraryUpdate(EventPlugin):
     PLUGIN_ID = "Automatic library update"
     PLUGIN_DESC = _("Keep your library up to date with inotify. "
                     "Requires %s.") % "pyinotify"
-    PLUGIN_VERSION = "0.3"
+    PLUGIN_VERSION = "0.4"
 
     # TODO: make a config option
     USE_THREADS = True
@@ -176,3 +275,5 @@ class AutoLibraryUpdate(EventPlugin):
         if self.notifier:
             print_d("Stopping inotify watch...")
             self.notifier.stop()
+        if self.event_handler:
+            self.event_handler.destroy()
@@ -10,7 +10,11 @@ if os.name == "nt":
     from quodlibet.plugins import PluginNotSupportedError
     raise PluginNotSupportedError
 
+import re
+import bisect
+import hashlib
 import tempfile
+import itertools
 
 from gi.repository import Gtk, GdkPixbuf
 
@@ -19,7 +23,8 @@ import dbus.service
 
 from quodlibet import app
 from quodlibet.plugins.events import EventPlugin
-from quodlibet.parse import Pattern
+from quodlibet.parse import Pattern, Query
+from quodlibet.util.dprint import print_d
 from quodlibet.util.uri import URI
 from quodlibet.util.dbusutils import DBusIntrospectable, DBusProperty
 from quodlibet.util.dbusutils import dbus_unicode_validate as unival
@@ -27,6 +32,218 @@ from quodlibet.util.dbusutils import dbus_unicode_validate as unival
 BASE_PATH = "/org/gnome/UPnP/MediaServer2"
 BUS_NAME = "org.gnome.UPnP.MediaServer2.QuodLibet"
 
+# the UPnP classes matching the "Type" we report for albums and songs
+ALBUM_CLASS = "object.container"
+SONG_CLASS = "object.item.audioItem.musicTrack"
+
+
+def get_object_id(key):
+    """Returns an ID for an album key or a song key which is usable as
+    an object path element and stays the same across restarts.
+    """
+
+    if not isinstance(key, basestring):
+        key = repr(key)
+    elif isinstance(key, unicode):
+        key = key.encode("utf-8")
+    return hashlib.md5(key).hexdigest()[:16]
+
+
+# UPnP property -> tag, per type of object
+STRING_PROPERTIES = {
+    ALBUM_CLASS: {
+        "dc:title": "album",
+        "upnp:album": "album",
+        "upnp:artist": "albumartist",
+        "dc:creator": "albumartist",
+        "upnp:genre": "genre",
+        "dc:date": "date",
+    },
+    SONG_CLASS: {
+        "dc:title": "title",
+        "upnp:album": "album",
+        "upnp:artist": "artist",
+        "dc:creator": "artist",
+        "upnp:genre": "genre",
+        "dc:date": "date",
+    },
+}
+
+NUMERIC_PROPERTIES = {
+    SONG_CLASS: {
+        "upnp:originalTrackNumber": "track",
+    },
+}
+
+_SEARCH_TOKEN = re.compile(
+    r'\s*(?:(\()|(\))|"((?:[^"\\]|\\.)*)"|([^\s()"]+))')
+
+
+def parse_search_criteria(text):
+    """Parses a UPnP ContentDirectory search criteria string.
+
+    Returns a tree of ("and"/"or", left, right) and
+    (property, operator, value) tuples or None for "*".
+    Raises ValueError if the string can't be parsed.
+    """
+
+    if text.strip() == "*":
+        return None
+
+    tokens = []
+    pos = 0
+    text = text.rstrip()
+    while pos < len(text):
+        m = _SEARCH_TOKEN.match(text, pos)
+        if not m:
+            raise ValueError("Invalid search criteria %r" % text)
+        pos = m.end()
+        if m.group(3) is not None:
+            value = re.sub(r"\\(.)", r"\1", m.group(3))
+            tokens.append(("value", value))
+        else:
+            tokens.append(("token", m.group(1) or m.group(2) or m.group(4)))
+
+    def next_token(kind=None):
+        if not tokens:
+            raise ValueError("Unexpected end of search criteria")
+        token = tokens.pop(0)
+        if kind is not None and token[0] != kind:
+            raise ValueError("Unexpected %r in search criteria" % token[1])
+        return token[1]
+
+    def peek():
+        return tokens and tokens[0][0] == "token" and tokens[0][1]
+
+    def parse_or():
+        node = parse_and()
+        while peek() == "or":
+            next_token()
+            node = ("or", node, parse_and())
+        return node
+
+    def parse_and():
+        node = parse_rel()
+        while peek() == "and":
+            next_token()
+            node = ("and", node, parse_rel())
+        return node
+
+    def parse_rel():
+        if peek() == "(":
+            next_token()
+            node = parse_or()
+            if next_token("token") != ")":
+                raise ValueError("Missing ')' in search criteria")
+            return node
+        prop = next_token("token")
+        op = next_token("token")
+        if op == "exists":
+            value = next_token("token")
+            if value not in ("true", "false"):
+                raise ValueError("Invalid exists value %r" % value)
+            return (prop, op, value == "true")
+        if op not in ("=", "!=", "<", "<=", ">", ">=", "contains",
+                      "doesNotContain", "derivedfrom"):
+            raise ValueError("Unknown operator %r" % op)
+        return (prop, op, next_token("value"))
+
+    node = parse_or()
+    if tokens:
+        raise ValueError("Unexpected %r in search criteria" % tokens[0][1])
+    return node
+
+
+def _criteria_to_query(node, upnp_class):
+    # returns a query string or True/False if it doesn't depend on
+    # the object itself
+
+    if node is None:
+        return True
+
+    if node[0] in ("and", "or"):
+        is_and = node[0] == "and"
+        parts = []
+        for child in node[1:]:
+            part = _criteria_to_query(child, upnp_class)
+            if part is (not is_and):
+                return part
+            elif part is not is_and:
+                parts.append(part)
+        if not parts:
+            return is_and
+        elif len(parts) == 1:
+            return parts[0]
+        return "%s(%s)" % ("&" if is_and else "|", ", ".join(parts))
+
+    prop, op, value = node
+
+    if prop == "upnp:class":
+        if op == "exists":
+            return value
+        elif op == "=":
+            return upnp_class == value
+        elif op == "!=":
+            return upnp_class != value
+        elif op == "derivedfrom":
+            return (upnp_class + ".").startswith(value + ".")
+        return False
+
+    tag = STRING_PROPERTIES[upnp_class].get(prop)
+    if tag is not None:
+        if op == "exists":
+            query = "%s=/./" % tag
+            return query if value else "!" + query
+        regexp = re.escape(value)
+        if op in ("=", "!="):
+            regexp = "^%s$" % regexp
+        elif op not in ("contains", "doesNotContain"):
+            return False
+        query = "%s=/%s/" % (tag, regexp)
+        if op in ("!=", "doesNotContain"):
+            query = "!" + query
+        return query
+
+    tag = NUMERIC_PROPERTIES.get(upnp_class, {}).get(prop)
+    if tag is not None:
+        if op == "exists":
+            return value
+        try:
+            number = int(value)
+        except ValueError:
+            return False
+        if op not in ("=", "!=", "<", "<=", ">", ">="):
+            return False
+        return "#(%s %s %d)" % (tag, op, number)
+
+    # we don't have that property
+    return op == "exists" and not value
+
+
+def compile_search_criteria(text):
+    """Translates a UPnP search criteria string into queries.
+
+    Returns a (album_query, song_query) tuple, where each is a Query
+    or None if no object of that type can match.
+    Raises ValueError if the string can't be parsed.
+    """
+
+    node = parse_search_criteria(text)
+
+    queries = []
+    for upnp_class in [ALBUM_CLASS, SONG_CLASS]:
+        query = _criteria_to_query(node, upnp_class)
+        if query is False:
+            queries.append(None)
+        elif query is True:
+            queries.append(Query(""))
+        else:
+            try:
+                queries.append(Query(query))
+            except Query.error:
+                raise ValueError("Invalid search criteria %r" % text)
+    return tuple(queries)
+
 
 class MediaServer(EventPlugin):
     PLUGIN_ID = "mediaserver"
@@ -34,7 +251,7 @@ class MediaServer(EventPlugin):
     PLUGIN_DESC = _("Exposes all albums to the Rygel UPnP Media Server "
                     "through the MediaServer2 D-Bus interface")
     PLUGIN_ICON = Gtk.STOCK_CONNECT
-    PLUGIN_VERSION = "0.1"
+    PLUGIN_VERSION = "0.2"
 
     def enabled(self):
         try:
@@ -155,7 +372,9 @@ class MediaContainer(object):
     @dbus.service.method(IFACE, in_signature="suuas", out_signature="aa{sv}",
                          rel_path_keyword="path")
     def SearchObjects(self, query, offset, max_, filter_, path):
-        return []
+        if self.SUPPORTS_MULTIPLE_OBJECT_PATHS:
+            return self.search_objects(query, offset, max_, filter_, path)
+        return self.search_objects(query, offset, max_, filter_)
 
     @dbus.service.signal(IFACE, rel_path_keyword="rel")
     def Updated(self, rel=""):
@@ -239,7 +458,7 @@ class EntryObject(MediaContainer, MediaObject, DBusPropertyFilter,
             elif name == "ContainerCount":
                 return len(self.__sub)
             elif name == "Searchable":
-                return False
+                return True
             elif name == "Icon":
                 return Icon.PATH
         elif interface == MediaObject.IFACE:
@@ -276,6 +495,18 @@ class EntryObject(MediaContainer, MediaObject, DBusPropertyFilter,
     def list_items(self, offset, max_, filter_):
         return []
 
+    def search_objects(self, query, offset, max_, filter_):
+        try:
+            queries = compile_search_criteria(query)
+        except ValueError as e:
+            print_d(str(e))
+            return []
+
+        results = itertools.chain(*[
+            sub.iter_search(queries, filter_) for sub in self.__sub])
+        end = (max_ and offset + max_) or None
+        return list(itertools.islice(results, offset, end))
+
 SUPPORTED_SONG_PROPERTIES = ("Size", "Artist", "Album", "Date", "Genre",
                              "Duration", "TrackNumber")
 
@@ -292,7 +523,7 @@ class DummySongObject(MediaItem, MediaObject, DBusPropertyFilter,
     This lets us reconstruct the original parent path:
     /org/gnome/UPnP/MediaServer2/<PREFIX>
 
-    atm. a prefix can look like "Albums/123456"
+    atm. a prefix can look like "Albums/0123456789abcdef"
     """
 
     SUPPORTS_MULTIPLE_OBJECT_PATHS = False
@@ -317,7 +548,8 @@ class DummySongObject(MediaItem, MediaObject, DBusPropertyFilter,
                 return "music"
             elif name == "Path":
                 path = SongObject.PATH
-                path += "/" + self.__prefix + "/" + str(id(self.__song))
+                path += "/" + self.__prefix + "/"
+                path += get_object_id(self.__song.key)
                 return path
             elif name == "DisplayName":
                 return unival(self.__song.comma("title"))
@@ -349,20 +581,22 @@ class DummyAlbumObject(MediaContainer, MediaObject, DBusPropertyFilter,
     SUPPORTS_MULTIPLE_OBJECT_PATHS = False
     __pattern = Pattern("<albumartist|<~albumartist~album>|<~artist~album>>")
 
-    def __init__(self, parent):
+    def __init__(self, parent, index):
         DBusIntrospectable.__init__(self)
         DBusPropertyFilter.__init__(self)
         MediaObject.__init__(self, parent)
         MediaContainer.__init__(self)
         self.__song = DummySongObject(self)
+        self.__index = index
 
     def get_dummy(self, song):
-        self.__song.set_song(song, "Albums/" + str(id(self.__album)))
+        self.__song.set_song(song, "Albums/" + self.__id)
         return self.__song
 
     def set_album(self, album):
         self.__album = album
-        self.PATH = self.parent.PATH + "/" + str(id(album))
+        self.__id = get_object_id(album.key)
+        self.PATH = self.parent.PATH + "/" + self.__id
 
     def get_property(self, interface, name):
         if interface == MediaContainer.IFACE:
@@ -371,7 +605,7 @@ class DummyAlbumObject(MediaContainer, MediaObject, DBusPropertyFilter,
             elif name == "ContainerCount":
                 return 0
             elif name == "Searchable":
-                return False
+                return True
         elif interface == MediaObject.IFACE:
             if name == "Parent":
                 return self.parent.PATH
@@ -386,7 +620,7 @@ class DummyAlbumObject(MediaContainer, MediaObject, DBusPropertyFilter,
         return []
 
     def list_items(self, offset, max_, filter_):
-        songs = sorted(self.__album.songs, key=lambda s: s.sort_key)
+        songs = self.__index.get_songs(self.__album)
         dummy = self.get_dummy(None)
         props = dummy.get_properties_for_filter(MediaItem.IFACE, filter_)
         end = (max_ and offset + max_) or None
@@ -398,6 +632,17 @@ class DummyAlbumObject(MediaContainer, MediaObject, DBusPropertyFilter,
 
     list_children = list_items
 
+    def iter_search(self, song_query, filter_):
+        """Yields the properties of all songs of the album
+        matching the query
+        """
+
+        props = self.get_dummy(None).get_properties_for_filter(
+            MediaItem.IFACE, filter_)
+        for song in self.__index.get_songs(self.__album):
+            if song_query.search(song):
+                yield self.get_dummy(song).get_values(props)
+
 
 class SongObject(MediaItem, MediaObject, DBusProperty, DBusIntrospectable,
                  dbus.service.FallbackObject):
@@ -414,8 +659,9 @@ class SongObject(MediaItem, MediaObject, DBusProperty, DBusIntrospectable,
         dbus.service.FallbackObject.__init__(self, bus, self.PATH)
 
         self.__library = library
-        self.__map = dict((id(v), v) for v in self.__library.itervalues())
-        self.__reverse = dict((v, k) for k, v in self.__map.iteritems())
+        self.__map = {}
+        self.__reverse = {}
+        self.__songs_added(library, library.itervalues())
 
         self.__song = DummySongObject(self)
 
@@ -433,12 +679,17 @@ class SongObject(MediaItem, MediaObject, DBusProperty, DBusIntrospectable,
         props = [p[1] for p in self.get_properties(MediaItem.IFACE)]
 
         for song in songs:
-            song_id = str(id(song))
             # https://code.google.com/p/quodlibet/issues/detail?id=1127
             # XXX: Something is emitting wrong changed events..
-            # ignore song_ids we don't know for now
-            if song_id not in self.__map:
+            # ignore songs we don't know for now
+            if song not in self.__reverse:
                 continue
+            song_id = get_object_id(song.key)
+            if self.__reverse[song] != song_id:
+                # renamed
+                del self.__map[self.__reverse[song]]
+                self.__map[song_id] = song
+                self.__reverse[song] = song_id
             for user in self.__users:
                 # ask the user for the prefix whith which the song is used
                 prefix = user.get_prefix(song)
@@ -447,7 +698,7 @@ class SongObject(MediaItem, MediaObject, DBusProperty, DBusIntrospectable,
 
     def __songs_added(self, lib, songs):
         for song in songs:
-            new_id = id(song)
+            new_id = get_object_id(song.key)
             self.__map[new_id] = song
             self.__reverse[song] = new_id
 
@@ -467,10 +718,79 @@ class SongObject(MediaItem, MediaObject, DBusProperty, DBusIntrospectable,
     def get_property(self, interface, name, path):
         # extract the prefix
         prefix, song_id = path[1:].rsplit("/", 1)
-        song = self.__map[int(song_id)]
+        song = self.__map[song_id]
         return self.get_dummy(song, prefix).get_property(interface, name)
 
 
+class AlbumIndex(object):
+    """Keeps albums sorted by their key and addressable by their object ID.
+
+    The sorted songs of an album get cached until the album changes.
+    """
+
+    def __init__(self, albums=tuple()):
+        self.__keys = []
+        self.__albums = {}
+        self.__ids = {}
+        self.__songs = {}
+        self.add(albums)
+
+    def __len__(self):
+        return len(self.__keys)
+
+    def __iter__(self):
+        albums = self.__albums
+        return (albums[k] for k in self.__keys)
+
+    def add(self, albums):
+        albums = [a for a in albums if a.key not in self.__albums]
+        for album in albums:
+            self.__albums[album.key] = album
+            self.__ids[get_object_id(album.key)] = album
+
+        if len(albums) > 1:
+            self.__keys.extend(a.key for a in albums)
+            self.__keys.sort()
+        else:
+            for album in albums:
+                bisect.insort(self.__keys, album.key)
+
+    def remove(self, albums):
+        keys = self.__keys
+        for album in albums:
+            if self.__albums.get(album.key) is not album:
+                continue
+            del self.__albums[album.key]
+            del self.__ids[get_object_id(album.key)]
+            self.__songs.pop(album.key, None)
+            del keys[bisect.bisect_left(keys, album.key)]
+
+    def changed(self, albums):
+        for album in albums:
+            self.__songs.pop(album.key, None)
+
+    def get(self, album_id):
+        """Returns the album for an object ID or None"""
+
+        return self.__ids.get(album_id)
+
+    def get_slice(self, offset, max_):
+        """Returns up to max_ albums (all if 0) starting at offset"""
+
+        end = (max_ and offset + max_) or None
+        albums = self.__albums
+        return [albums[k] for k in self.__keys[offset:end]]
+
+    def get_songs(self, album):
+        """Returns the songs of the album sorted by track"""
+
+        songs = self.__songs.get(album.key)
+        if songs is None:
+            songs = sorted(album.songs, key=lambda s: s.sort_key)
+            self.__songs[album.key] = songs
+        return songs
+
+
 class AlbumsObject(MediaContainer, MediaObject, DBusPropertyFilter,
                    DBusIntrospectable, dbus.service.FallbackObject):
     PATH = BASE_PATH + "/Albums"
@@ -491,8 +811,7 @@ class AlbumsObject(MediaContainer, MediaObject, DBusPropertyFilter,
         self.__library = library.albums
         self.__library.load()
 
-        self.__map = dict((id(v), v) for v in self.__library.itervalues())
-        self.__reverse = dict((v, k) for k, v in self.__map.iteritems())
+        self.__index = AlbumIndex(self.__library.itervalues())
 
         signals = [
             ("changed", self.__albums_changed),
@@ -501,18 +820,22 @@ class AlbumsObject(MediaContainer, MediaObject, DBusPropertyFilter,
         ]
         self.__sigs = map(lambda (s, f): self.__library.connect(s, f), signals)
 
-        self.__dummy = DummyAlbumObject(self)
+        self.__dummy = DummyAlbumObject(self, self.__index)
 
     def get_dummy(self, album):
         self.__dummy.set_album(album)
         return self.__dummy
 
     def get_path_dummy(self, path):
-        return self.get_dummy(self.__map[int(path[1:])])
+        album = self.__index.get(path[1:])
+        if album is None:
+            raise KeyError(path)
+        return self.get_dummy(album)
 
     def __albums_changed(self, lib, albums):
+        self.__index.changed(albums)
         for album in albums:
-            rel_path = "/" + str(id(album))
+            rel_path = "/" + get_object_id(album.key)
             self.emit_updated(rel_path)
             self.emit_properties_changed(
                 MediaContainer.IFACE,
@@ -520,25 +843,19 @@ class AlbumsObject(MediaContainer, MediaObject, DBusPropertyFilter,
                 rel_path)
 
     def __albums_added(self, lib, albums):
-        for album in albums:
-            new_id = id(album)
-            self.__map[new_id] = album
-            self.__reverse[album] = new_id
+        self.__index.add(albums)
         self.emit_updated()
         self.emit_properties_changed(MediaContainer.IFACE,
                                      ["ChildCount", "ContainerCount"])
 
     def __albums_removed(self, lib, albums):
-        for album in albums:
-            del self.__map[self.__reverse[album]]
-            del self.__reverse[album]
+        self.__index.remove(albums)
         self.emit_updated()
         self.emit_properties_changed(MediaContainer.IFACE,
                                      ["ChildCount", "ContainerCount"])
 
     def get_prefix(self, song):
-        album = self.__library[song.album_key]
-        return "Albums/" + str(id(album))
+        return "Albums/" + get_object_id(song.album_key)
 
     def destroy(self):
         for signal_id in self.__sigs:
@@ -553,7 +870,7 @@ class AlbumsObject(MediaContainer, MediaObject, DBusPropertyFilter,
             elif name == "ContainerCount":
                 return len(self.__library)
             elif name == "Searchable":
-                return False
+                return True
         elif interface == MediaObject.IFACE:
             if name == "Parent":
                 return self.parent.PATH
@@ -572,14 +889,53 @@ class AlbumsObject(MediaContainer, MediaObject, DBusPropertyFilter,
 
     def __list_albums(self, offset, max_, filter_):
         props = self.get_properties_for_filter(MediaContainer.IFACE, filter_)
-        albums = sorted(self.__library, key=lambda a: a.sort)
-        end = (max_ and offset + max_) or None
 
         result = []
-        for album in albums[offset:end]:
+        for album in self.__index.get_slice(offset, max_):
             result.append(self.get_dummy(album).get_values(props))
         return result
 
+    def iter_search(self, queries, filter_, path="/"):
+        """Yields the properties of all matching albums followed by all
+        matching songs, in browsing order.
+
+        queries -- (album_query, song_query) as returned by
+                   compile_search_criteria()
+        """
+
+        album_query, song_query = queries
+
+        if path != "/":
+            if song_query is not None:
+                for values in self.get_path_dummy(path).iter_search(
+                        song_query, filter_):
+                    yield values
+            return
+
+        if album_query is not None:
+            props = self.get_properties_for_filter(
+                MediaContainer.IFACE, filter_)
+            for album in self.__index:
+                if album_query.search(album):
+                    yield self.get_dummy(album).get_values(props)
+
+        if song_query is not None:
+            for album in self.__index:
+                for values in self.get_dummy(album).iter_search(
+                        song_query, filter_):
+                    yield values
+
+    def search_objects(self, query, offset, max_, filter_, path):
+        try:
+            queries = compile_search_criteria(query)
+        except ValueError as e:
+            print_d(str(e))
+            return []
+
+        results = self.iter_search(queries, filter_, path)
+        end = (max_ and offset + max_) or None
+        return list(itertools.islice(results, offset, end))
+
     def list_containers(self, offset, max_, filter_, path):
         if path == "/":
             return self.__list_albums(offset, max_, filter_)
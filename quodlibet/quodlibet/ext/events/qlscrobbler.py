@@ -10,11 +10,13 @@
 
 from httplib import HTTPException
 import cPickle as pickle
+import httplib
+import json
 import os
 import threading
 import time
 import urllib
-import urllib2
+import urlparse
 
 from gi.repository import Gtk, GLib
 
@@ -23,13 +25,13 @@ try:
 except ImportError:
     from md5 import md5
 
-import quodlibet
 from quodlibet import config, const, app, parse, util, qltk
 from quodlibet.plugins.events import EventPlugin
 from quodlibet.plugins import PluginConfigMixin
 from quodlibet.qltk.entry import ValidatingEntry, UndoEntry
 from quodlibet.qltk.msg import Message
 from quodlibet.util.dprint import print_d
+from quodlibet.util.threadpool import ThreadPool
 
 
 SERVICES = {
@@ -42,6 +44,73 @@ DEFAULT_TITLEPAT = '<title><version| (<version>)>'
 DEFAULT_ARTISTPAT = '<artist|<artist>|<composer|<composer>|<performer>>>'
 
 
+def get_backoff(failures, base, maximum):
+    """Seconds to wait after `failures` failed attempts in a row"""
+
+    return min(base * 2 ** max(failures - 1, 0), maximum)
+
+
+class ScrobbleJournal(object):
+    """Keeps pending scrobbles on disk, one JSON object per line.
+
+    New entries get appended and synced, so they survive crashes.
+    Submitted ones get removed by rewriting the file. Both happen in a
+    worker thread in the order they were requested, so callers in the
+    main loop don't wait for the disk.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._pool = ThreadPool(1, name="ScrobbleJournal")
+
+    def load(self):
+        """Returns the list of pending entries"""
+
+        entries = []
+        try:
+            with open(self.filename, "rb") as h:
+                for line in h:
+                    try:
+                        entries.append(json.loads(line))
+                    except ValueError:
+                        # incomplete last line after a crash
+                        print_d("Skipping broken journal line %r" % line)
+        except EnvironmentError:
+            pass
+        return entries
+
+    def wait(self):
+        """Block until all requested writes are done"""
+
+        self._pool.wait()
+
+    def append(self, entries):
+        self._pool.add(self._append, list(entries))
+
+    def rewrite(self, entries):
+        """Replace the content with the still pending entries"""
+
+        self._pool.add(self._rewrite, list(entries))
+
+    def _append(self, entries):
+        try:
+            with open(self.filename, "ab") as h:
+                for entry in entries:
+                    h.write(json.dumps(entry) + "\n")
+                h.flush()
+                os.fsync(h.fileno())
+        except EnvironmentError:
+            util.print_exc()
+
+    def _rewrite(self, entries):
+        try:
+            with util.atomic_save(self.filename, ".tmp", "wb") as h:
+                for entry in entries:
+                    h.write(json.dumps(entry) + "\n")
+        except EnvironmentError:
+            util.print_exc()
+
+
 def config_get(key, default=''):
     """Returns value for 'key' from config. If key is missing *or empty*,
     return default."""
@@ -59,14 +128,26 @@ class QLSubmitQueue(PluginConfigMixin):
 
     CLIENT = "qlb"
     PROTOCOL_VERSION = "1.2"
+    # Pickled queue of older versions
     DUMP = os.path.join(const.USERDIR, "scrobbler_cache")
+    JOURNAL = os.path.join(const.USERDIR, "scrobbler_journal")
     # This must be the kept the same as `QLScrobbler`
     CONFIG_SECTION = "scrobbler"
 
+    # Songs per submission, the protocol limit
+    MAX_SUBMIT = 50
+    # Oldest scrobbles get dropped if more are pending
+    MAX_QUEUE = 10000
+    TIMEOUT = 30
+
     # These objects are shared across instances, to allow other plugins to
     # queue scrobbles in future versions of QL
     queue = []
+    journal = None
+    queue_lock = threading.Lock()
     changed_event = threading.Event()
+    # held by run(), a stopped queue might still be sending
+    run_lock = threading.Lock()
 
     def config_get_url(self):
         """Gets the URL for the currently configured service.
@@ -100,7 +181,14 @@ class QLSubmitQueue(PluginConfigMixin):
         else:
             # TODO: Forging timestamps for submission from PMPs
             return
-        self.queue.append(formatted)
+        with self.queue_lock:
+            self.queue.append(formatted)
+            self.journal.append([formatted])
+            if len(self.queue) > self.MAX_QUEUE:
+                print_d("Dropping %d old scrobble(s)" % (
+                    len(self.queue) - self.MAX_QUEUE))
+                del self.queue[:-self.MAX_QUEUE]
+                self.journal.rewrite(self.queue)
         self.changed()
 
     def _format_song(self, song):
@@ -134,26 +222,31 @@ class QLSubmitQueue(PluginConfigMixin):
         self.artpat = parse.Pattern(
             self.config_get('artistpat', "") or DEFAULT_ARTISTPAT)
 
+        self._connections = {}
+        self._stop_event = threading.Event()
+
+        with self.queue_lock:
+            if QLSubmitQueue.journal is None:
+                QLSubmitQueue.journal = ScrobbleJournal(self.JOURNAL)
+                self.queue += self.journal.load()
+                self._migrate_dump()
+
+    def _migrate_dump(self):
+        """Move the queue saved by older versions to the journal"""
+
         try:
-            disk_queue_file = open(self.DUMP, 'r')
-            disk_queue = pickle.load(disk_queue_file)
-            disk_queue_file.close()
-            os.unlink(self.DUMP)
-            self.queue += disk_queue
+            with open(self.DUMP, 'rb') as disk_queue_file:
+                disk_queue = pickle.load(disk_queue_file)
         except Exception:
+            return
+        self.queue += disk_queue
+        self.journal.append(disk_queue)
+        self.journal.wait()
+        try:
+            os.unlink(self.DUMP)
+        except EnvironmentError:
             pass
 
-    @classmethod
-    def dump_queue(klass):
-        if klass.queue:
-            try:
-                disk_queue_file = open(klass.DUMP, 'w')
-                pickle.dump(klass.queue, disk_queue_file)
-                disk_queue_file.close()
-            except IOError:
-                pass
-        return 0
-
     def _check_config(self):
         user = self.config_get('username')
         passw = md5(self.config_get('password')).hexdigest()
@@ -184,30 +277,40 @@ class QLSubmitQueue(PluginConfigMixin):
             return
         self.changed_event.clear()
 
+    def stop(self):
+        """Make run() return"""
+
+        self._stop_event.set()
+        self.changed_event.set()
+
     def run(self):
         """Submit songs from the queue. Call from a daemon thread."""
+
+        with self.run_lock:
+            self._run()
+
+    def _run(self):
         # The spec calls for exponential backoff of failed handshakes, with a
         # minimum of 1m and maximum of 120m delay between attempts.
         self.handshake_sent = False
-        self.handshake_event = threading.Event()
-        self.handshake_event.set()
-        self.handshake_delay = 1
+        self.handshake_failures = 0
 
         self.failures = 0
 
-        while True:
+        stop = self._stop_event
+        while not stop.is_set():
             self.changed_event.wait()
+            if stop.is_set():
+                break
             if not self.handshake_sent:
-                self.handshake_event.wait()
                 if self.send_handshake():
                     self.failures = 0
-                    self.handshake_delay = 1
+                    self.handshake_failures = 0
                     self.handshake_sent = True
                 else:
-                    self.handshake_event.clear()
-                    self.handshake_delay = min(self.handshake_delay * 2, 120)
-                    GLib.timeout_add(self.handshake_delay * 60 * 1000,
-                                     self.handshake_event.set)
+                    self.handshake_failures += 1
+                    stop.wait(get_backoff(
+                        self.handshake_failures, 60, 120 * 60))
                     continue
             self.changed_event.wait()
             if self.queue:
@@ -215,8 +318,11 @@ class QLSubmitQueue(PluginConfigMixin):
                     self.failures = 0
                 else:
                     self.failures += 1
+                    # Spec: handshake again after three failures in a row
                     if self.failures >= 3:
                         self.handshake_sent = False
+                    else:
+                        stop.wait(get_backoff(self.failures, 15, 60))
             elif self.nowplaying_song and not self.nowplaying_sent:
                 self.send_nowplaying()
                 self.nowplaying_sent = True
@@ -224,6 +330,56 @@ class QLSubmitQueue(PluginConfigMixin):
                 # Nothing left to do; wait until something changes
                 self.changed_event.clear()
 
+    def _request(self, url, data=None):
+        """Sends a GET request or a POST one if data is given and returns
+        the response body. Connections get kept open and reused.
+
+        Raises IOError, HTTPException or ValueError for invalid URLs.
+        """
+
+        parts = urlparse.urlsplit(url)
+        if parts.scheme not in ("http", "https") or not parts.netloc:
+            raise ValueError("Invalid URL %r" % url)
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+
+        headers = {}
+        if data is None:
+            method, body = "GET", None
+        else:
+            method, body = "POST", urllib.urlencode(data)
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+
+        key = (parts.scheme, parts.netloc)
+        while 1:
+            conn = self._connections.get(key)
+            reused = conn is not None
+            if not reused:
+                if parts.scheme == "https":
+                    conn = httplib.HTTPSConnection(
+                        parts.netloc, timeout=self.TIMEOUT)
+                else:
+                    conn = httplib.HTTPConnection(
+                        parts.netloc, timeout=self.TIMEOUT)
+                self._connections[key] = conn
+            try:
+                conn.request(method, path, body, headers)
+                resp = conn.getresponse()
+                content = resp.read()
+            except (IOError, HTTPException):
+                conn.close()
+                del self._connections[key]
+                if reused:
+                    # the server might have closed it, try a new one
+                    continue
+                raise
+            break
+
+        if resp.status != 200:
+            raise IOError("HTTP status %d" % resp.status)
+        return content
+
     def send_handshake(self, show_dialog=False):
         # construct url
         stamp = int(time.time())
@@ -234,7 +390,7 @@ class QLSubmitQueue(PluginConfigMixin):
         print_d("Sending handshake to service.")
 
         try:
-            resp = urllib2.urlopen(url)
+            content = self._request(url)
         except (IOError, HTTPException):
             if show_dialog:
                 self.quick_dialog(
@@ -250,7 +406,7 @@ class QLSubmitQueue(PluginConfigMixin):
             return False
 
         # check response
-        lines = resp.read().rstrip().split("\n")
+        lines = content.rstrip().split("\n")
         status = lines.pop(0)
         print_d("Handshake status: %s" % status)
 
@@ -278,15 +434,13 @@ class QLSubmitQueue(PluginConfigMixin):
         return False
 
     def _check_submit(self, url, data):
-        data_str = urllib.urlencode(data)
         try:
-            resp = urllib2.urlopen(url, data_str)
-        except (IOError, HTTPException):
+            content = self._request(url, data)
+        except (IOError, HTTPException, ValueError):
             print_d("Audioscrobbler server not responding, will try later.")
             return False
 
-        resp_save = resp.read()
-        status = resp_save.rstrip().split("\n")[0]
+        status = content.rstrip().split("\n")[0]
         print_d("Submission status: %s" % status)
 
         if status == "OK":
@@ -299,7 +453,8 @@ class QLSubmitQueue(PluginConfigMixin):
 
     def send_submission(self):
         data = {'s': self.session_id}
-        to_submit = self.queue[:min(len(self.queue), 50)]
+        with self.queue_lock:
+            to_submit = self.queue[:self.MAX_SUBMIT]
         for idx, song in enumerate(to_submit):
             for key, val in song.items():
                 data['%s[%d]' % (key, idx)] = val.encode('utf-8')
@@ -310,7 +465,11 @@ class QLSubmitQueue(PluginConfigMixin):
             ('\n\t'.join(['%s - %s' % (s['a'], s['t']) for s in to_submit])))
 
         if self._check_submit(self.submit_url, data):
-            del self.queue[:len(to_submit)]
+            with self.queue_lock:
+                # old ones might have been dropped in the meantime
+                done = set(map(id, to_submit))
+                self.queue[:] = [e for e in self.queue if id(e) not in done]
+                self.journal.rewrite(self.queue)
             return True
         else:
             return False
@@ -345,10 +504,8 @@ class QLScrobbler(EventPlugin, PluginConfigMixin):
 
     def __init__(self):
         self.__enabled = False
-        self.queue = QLSubmitQueue()
-        queue_thread = threading.Thread(None, self.queue.run)
-        queue_thread.setDaemon(True)
-        queue_thread.start()
+        self.queue = None
+        self.__thread = None
 
         self.start_time = 0
         self.unpaused_time = 0
@@ -357,9 +514,6 @@ class QLScrobbler(EventPlugin, PluginConfigMixin):
 
         self.exclude = self.config_get('exclude')
 
-        # Set up exit hook to dump queue
-        quodlibet.quit_add(0, self.queue.dump_queue)
-
     def config_get_url(self):
         """Gets the URL for the currently configured service.
         This logic was used often enough to be split out from generic config"""
@@ -426,10 +580,21 @@ class QLScrobbler(EventPlugin, PluginConfigMixin):
 
     def enabled(self):
         self.__enabled = True
+        # a stopped queue can't be restarted
+        self.queue = QLSubmitQueue()
+        # the shared event is still set by stop()
+        self.queue.changed()
+        self.__thread = threading.Thread(None, self.queue.run)
+        self.__thread.setDaemon(True)
+        self.__thread.start()
         print_d("Plugin enabled - accepting new songs.")
 
     def disabled(self):
         self.__enabled = False
+        if self.queue is not None:
+            self.queue.stop()
+            # also called on quit, don't lose the last scrobbles
+            self.queue.journal.wait()
         print_d("Plugin disabled - not accepting any new songs.")
 
     def PluginPreferences(self, parent):
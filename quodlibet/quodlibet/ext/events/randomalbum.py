@@ -42,6 +42,13 @@ class RandomAlbum(EventPlugin):
             ]
 
     def __init__(self):
+        # album -> {key: aggregate value}
+        self._values = {}
+        # the album library gets connected on first use, so enabling
+        # doesn't force it to be built
+        self.__albums = None
+        self.__sigs = []
+
         for (key, text, func) in self.keys:
             val = config.getfloat("plugins", "randomalbum_%s" % key, 0.0)
             self.weights[key] = val
@@ -51,6 +58,24 @@ class RandomAlbum(EventPlugin):
         delay = config.getint("plugins", "randomalbum_delay", 0)
         self.delay = delay
 
+    def disabled(self):
+        if self.__albums is not None:
+            for sig in self.__sigs:
+                self.__albums.disconnect(sig)
+        self.__albums = None
+        self.__sigs = []
+        self._values.clear()
+
+    def __get_albums(self):
+        albums = app.library.albums
+        if albums is not self.__albums:
+            self.disabled()
+            self.__albums = albums
+            self.__sigs = [
+                albums.connect("changed", self.__albums_changed),
+                albums.connect("removed", self.__albums_changed)]
+        return albums
+
     def PluginPreferences(self, song):
         def changed_cb(hscale, key):
             val = hscale.get_value()
@@ -132,6 +157,24 @@ class RandomAlbum(EventPlugin):
 
         return vbox
 
+    def _get_values(self, album):
+        """The aggregate values of an album for all keys, cached"""
+
+        try:
+            return self._values[album]
+        except KeyError:
+            values = {}
+            for (tag, text, func) in self.keys:
+                tag_key = ("~#%s:%s" % (tag, func) if func
+                           else "~#%s" % tag)
+                values[tag] = album.get(tag_key)
+            self._values[album] = values
+            return values
+
+    def __albums_changed(self, library, albums):
+        for album in albums:
+            self._values.pop(album, None)
+
     def _score(self, albums):
         """Score each album. Returns a list of (score, name) tuples."""
 
@@ -139,19 +182,15 @@ class RandomAlbum(EventPlugin):
         # Rank ordering is more resistant to clustering than weighting
         # based on normalized means, and also normalizes the scale of each
         # weight slider in the prefs pane.
-        ranked = {}
+        values = [(album, self._get_values(album)) for album in albums]
+        scores = dict.fromkeys(albums, 0)
         for (tag, text, func) in self.keys:
-            tag_key = ("~#%s:%s" % (tag, func) if func
-                       else "~#%s" % tag)
-            ranked[tag] = sorted(albums,
-                                 key=lambda al: al.get(tag_key))
-
-        scores = {}
-        for album in albums:
-            scores[album] = 0
-            for (tag, text, func) in self.keys:
-                rank = ranked[tag].index(album)
-                scores[album] += rank * self.weights[tag]
+            weight = self.weights[tag]
+            if not weight:
+                continue
+            ranked = sorted(values, key=lambda (al, v): v[tag])
+            for rank, (album, v) in enumerate(ranked):
+                scores[album] += rank * weight
 
         return [(score, name) for name, score in scores.items()]
 
@@ -163,7 +202,7 @@ class RandomAlbum(EventPlugin):
             if not browser.can_filter('album'):
                 return
 
-            albumlib = app.library.albums
+            albumlib = self.__get_albums()
             albumlib.load()
 
             if browser.can_filter_albums():
@@ -28,6 +28,76 @@ from quodlibet.qltk.songsmenu import SongsMenu
 from quodlibet.qltk.views import RCMHintedTreeView
 
 
+class DuplicateIndex(object):
+    """Maps duplicate keys to all library songs having them.
+
+    The index gets built for one key function and is kept up to date
+    through the library signals until destroy() is called.
+    """
+
+    def __init__(self, library, get_key, settings=None):
+        self.settings = settings
+        self.library = library
+        self.__get_key = get_key
+        self.__keys = {}
+        self.__groups = {}
+
+        self.__sigs = [
+            library.connect('added', self.__added),
+            library.connect('removed', self.__removed),
+            library.connect('changed', self.__changed),
+        ]
+
+        print_d("Building duplicates index...", self)
+        self.__added(library, library.values())
+
+    def destroy(self):
+        for sig in self.__sigs:
+            self.library.disconnect(sig)
+        self.__sigs = []
+        self.__keys.clear()
+        self.__groups.clear()
+
+    def get_key(self, song):
+        """The duplicate key of song, cached for library songs"""
+
+        try:
+            return self.__keys[song]
+        except KeyError:
+            return self.__get_key(song)
+
+    def get_songs(self, key):
+        """A set of all library songs with the given key"""
+
+        return set(self.__groups.get(key, []))
+
+    def __added(self, library, songs):
+        get_key = self.__get_key
+        keys = self.__keys
+        groups = self.__groups
+        for song in songs:
+            key = get_key(song)
+            if key:
+                keys[song] = key
+                groups.setdefault(key, set()).add(song)
+
+    def __removed(self, library, songs):
+        keys = self.__keys
+        groups = self.__groups
+        for song in songs:
+            key = keys.pop(song, None)
+            if key is None:
+                continue
+            group = groups[key]
+            group.discard(song)
+            if not group:
+                del groups[key]
+
+    def __changed(self, library, songs):
+        self.__removed(library, songs)
+        self.__added(library, songs)
+
+
 class DuplicateSongsView(RCMHintedTreeView):
     """Allows full tree-like functionality on top of underlying features"""
 
@@ -94,8 +164,9 @@ class DuplicateSongsView(RCMHintedTreeView):
         model = self.get_model()
         if not model:
             return
+        index = Duplicates.get_index()
         for song in songs:
-            key = Duplicates.get_key(song)
+            key = index.get_key(song)
             model.add_to_existing_group(key, song)
             # TODO: handle creation of new groups based on songs that were
             #       in original list but not as a duplicate
@@ -104,8 +175,9 @@ class DuplicateSongsView(RCMHintedTreeView):
         model = self.get_model()
         if not model:  # Keeps happening on next song - bug / race condition?
             return
+        index = Duplicates.get_index()
         for song in songs:
-            key = Duplicates.get_key(song)
+            key = index.get_key(song)
             row = model.find_row(song)
             if row:
                 print_d("Changed duplicated file \"%s\" (Row=%s)" %
@@ -370,6 +442,9 @@ class Duplicates(SongsMenuPlugin, PluginConfigMixin):
     PLUGIN_DESC = _('Find and browse similarly tagged versions of songs.')
     PLUGIN_ICON = Gtk.STOCK_MEDIA_PLAY
     PLUGIN_VERSION = "0.7"
+    # the plugin manager keeps an instance without songs and
+    # calls disabled() on it
+    PLUGIN_INSTANCE = True
 
     MIN_GROUP_SIZE = 2
     _CFG_KEY_KEY = "key_expression"
@@ -382,11 +457,14 @@ class Duplicates(SongsMenuPlugin, PluginConfigMixin):
 
     # Cached values
     key_expression = None
-    __cfg_cache = {}
+    __index = None
 
     # Faster than a speeding bullet
     __trans = string.maketrans("", "")
 
+    def __init__(self, songs=None, library=None, window=None):
+        super(Duplicates, self).__init__(songs, library, window)
+
     @classmethod
     def get_key_expression(cls):
         if not cls.key_expression:
@@ -441,38 +519,82 @@ class Duplicates(SongsMenuPlugin, PluginConfigMixin):
         return filter(lambda c: not unicodedata.combining(c),
                       unicodedata.normalize('NFKD', unicode(s)))
 
+    @classmethod
+    def get_key_settings(cls):
+        """The key expression and the enabled normalisation options"""
+
+        flags = (cls._CFG_REMOVE_DIACRITICS, cls._CFG_CASE_INSENSITIVE,
+                 cls._CFG_REMOVE_PUNCTUATION, cls._CFG_REMOVE_WHITESPACE)
+        return (cls.get_key_expression(),) + tuple(
+            cls.config_get_bool(f) for f in flags)
+
+    @classmethod
+    def get_key_func(cls, settings=None):
+        """Returns a function computing the duplicate key for a song"""
+
+        if settings is None:
+            settings = cls.get_key_settings()
+        expression, diacritics, insensitive, punctuation, whitespace = \
+            settings
+        remove_accents = cls.remove_accents
+        trans = cls.__trans
+
+        def get_key(song):
+            key = song(expression)
+            if diacritics:
+                key = remove_accents(key)
+            if insensitive:
+                key = key.lower()
+            if punctuation:
+                key = str(key).translate(trans, string.punctuation)
+            if whitespace:
+                key = "_".join(key.split())
+            return key
+        return get_key
+
     @classmethod
     def get_key(cls, song):
-        key = song(cls.get_key_expression())
-        if cls.config_get_bool(cls._CFG_REMOVE_DIACRITICS):
-            key = cls.remove_accents(key)
-        if cls.config_get_bool(cls._CFG_CASE_INSENSITIVE):
-            key = key.lower()
-        if cls.config_get_bool(cls._CFG_REMOVE_PUNCTUATION):
-            key = str(key).translate(cls.__trans, string.punctuation)
-        if cls.config_get_bool(cls._CFG_REMOVE_WHITESPACE):
-            key = "_".join(key.split())
-        return key
+        return cls.get_key_func()(song)
+
+    @classmethod
+    def get_index(cls, library=None):
+        """Returns a DuplicateIndex for the current settings, kept up to
+        date with the main library until the settings change.
+        """
+
+        if library is None:
+            library = app.library
+        settings = cls.get_key_settings()
+        index = cls.__index
+        if index is None or index.settings != settings or \
+                index.library is not library:
+            if index is not None:
+                index.destroy()
+            index = DuplicateIndex(
+                library, cls.get_key_func(settings), settings)
+            Duplicates.__index = index
+        return index
+
+    def disabled(self):
+        # stop following the library
+        if Duplicates.__index is not None:
+            Duplicates.__index.destroy()
+            Duplicates.__index = None
 
     def plugin_songs(self, songs):
         model = DuplicatesTreeModel()
-        self.__cfg_cache = {}
+        index = self.get_index()
 
-        # Index all songs by our custom key
-        # TODO: make this cache-friendly
         print_d("Calculating duplicates...", self)
         groups = {}
         for song in songs:
-            key = self.get_key(song)
-            if key and key in groups:
-                groups[key].add(song._song)
-            elif key:
-                groups[key] = set([song._song])
-
-        for song in app.library:
-            key = self.get_key(song)
-            if key in groups:
-                groups[key].add(song)
+            song = song._song
+            key = index.get_key(song)
+            if key:
+                groups.setdefault(key, set()).add(song)
+
+        for key, children in groups.iteritems():
+            children.update(index.get_songs(key))
 
         # Now display the grouped duplicates
         for (key, children) in groups.items():
@@ -10,14 +10,20 @@ if not Gst.ElementFactory.find("chromaprint"):
     from quodlibet import plugins
     raise plugins.MissingGstreamerElementPluginException("chromaprint")
 
+import time
+
+from .analyze import FingerPrintThreadPool, get_cache
 from .submit import FingerprintDialog
 from .util import get_api_key, get_write_mb_tags
 
+from quodlibet import app
 from quodlibet import config
 from quodlibet import util
 from quodlibet.qltk import Button, Frame
 from quodlibet.qltk.entry import UndoEntry
 from quodlibet.qltk.msg import ErrorMessage
+from quodlibet.qltk.notif import Task
+from quodlibet.plugins.events import EventPlugin
 from quodlibet.plugins.songsmenu import SongsMenuPlugin
 from quodlibet.qltk.ccb import ConfigCheckButton
 
@@ -98,3 +104,80 @@ class AcoustidSubmit(SongsMenuPlugin):
                        child=key_box), True, True, 0)
 
         return box
+
+
+class AcoustidFingerprintLibrary(EventPlugin):
+    PLUGIN_ID = "AcoustidFingerprintLibrary"
+    PLUGIN_NAME = _("Fingerprint Library")
+    PLUGIN_DESC = _("Generates acoustic fingerprints of all songs in the "
+                    "library in the background, so later lookups and "
+                    "submissions don't have to analyze them again.")
+    PLUGIN_ICON = Gtk.STOCK_CONNECT
+    PLUGIN_VERSION = "0.1"
+
+    SAVE_INTERVAL = 60
+
+    _pool = None
+    _task = None
+
+    def enabled(self):
+        self._cache = cache = get_cache()
+        self._last_save = time.time()
+        self._done = 0
+        self._total = 0
+
+        self._pool = pool = FingerPrintThreadPool()
+        pool.connect('fingerprint-done', self.__fp_done_cb)
+        pool.connect('fingerprint-error', self.__fp_error_cb)
+        self.__push([s for s in app.library.values() if s.is_file and
+                     cache.get(s) is None])
+
+    def disabled(self):
+        # __stop() forgets the task, Task.stop() finishes it by itself
+        if self._task is not None:
+            self._task.finish()
+        self.__stop()
+
+    def plugin_on_added(self, songs):
+        self.__push([s._song for s in songs if s and s.is_file])
+
+    def __push(self, songs):
+        if songs and self._task is None:
+            self._task = Task(_("Fingerprints"), _("Fingerprinting library"),
+                              stop=self.__stop)
+        self._total += len(songs)
+        for song in songs:
+            self._pool.push(song)
+        self.__check_done()
+
+    def __stop(self):
+        self._task = None
+        if self._pool is not None:
+            self._pool.stop()
+        self._cache.save()
+
+    def __fp_done_cb(self, pool, result):
+        # the pool without a cache doesn't store them itself
+        if result.chromaprint:
+            self._cache.set(result)
+        self.__inc_done()
+
+    def __fp_error_cb(self, pool, song, error):
+        self.__inc_done()
+
+    def __inc_done(self):
+        self._done += 1
+        if self._task is not None:
+            self._task.update(float(self._done) / max(self._total, 1))
+        if time.time() - self._last_save > self.SAVE_INTERVAL:
+            self._last_save = time.time()
+            self._cache.save()
+        self.__check_done()
+
+    def __check_done(self):
+        if self._pool.pending:
+            return
+        if self._task is not None:
+            self._task.finish()
+            self._task = None
+        self._cache.save()
@@ -27,8 +27,9 @@ class AcoustidSubmissionThread(threading.Thread):
     URL = "http://api.acoustid.org/v2/submit"
     SONGS_PER_SUBMISSION = 50
 
-    def __init__(self, results, progress_cb, done_cb):
+    def __init__(self, results, progress_cb, done_cb, url=None):
         super(AcoustidSubmissionThread, self).__init__()
+        self.__url = url or self.URL
         self.__callback = done_cb
         self.__results = results
         self.__stopped = False
@@ -67,7 +68,7 @@ class AcoustidSubmissionThread(threading.Thread):
             "Content-Encoding": "gzip",
             "Content-type": "application/x-www-form-urlencoded"
         }
-        req = urllib2.Request(self.URL, urldata, headers)
+        req = urllib2.Request(self.__url, urldata, headers)
 
         error = None
         try:
@@ -259,8 +260,11 @@ def parse_acoustid_response(json_data):
 class AcoustidLookupThread(threading.Thread):
     URL = "http://api.acoustid.org/v2/lookup"
 
-    def __init__(self, progress_cb):
+    def __init__(self, progress_cb, url=None):
+        """url defaults to the Acoustid web service"""
+
         super(AcoustidLookupThread, self).__init__()
+        self.__url = url or self.URL
         self.__progress_cb = progress_cb
         self.__queue = Queue.Queue()
         self.__stopped = False
@@ -297,7 +301,7 @@ class AcoustidLookupThread(threading.Thread):
             "Content-Encoding": "gzip",
             "Content-type": "application/x-www-form-urlencoded"
         }
-        req = urllib2.Request(self.URL, urldata, headers)
+        req = urllib2.Request(self.__url, urldata, headers)
 
         releases = []
         error = ""
@@ -4,11 +4,19 @@
 # it under the terms of the GNU General Public License version 2 as
 # published by the Free Software Foundation
 
+import os
+import zlib
 import threading
-import multiprocessing
+import collections
+import cPickle as pickle
 
 from gi.repository import Gst, GLib, GObject
 
+from quodlibet import const
+from quodlibet import util
+from quodlibet.util.path import mtime
+from quodlibet.util.threadpool import get_num_workers
+
 
 class FingerPrintResult(object):
 
@@ -18,6 +26,76 @@ class FingerPrintResult(object):
         self.length = length
 
 
+class FingerPrintCache(object):
+    """Chromaprints and lengths of analyzed files.
+
+    Results are stored per filename together with the file's mtime
+    and are only returned as long as the file hasn't changed. The cache
+    gets saved as a zlib compressed pickle.
+    """
+
+    def __init__(self, filename=None):
+        self.filename = filename
+        self.dirty = False
+        self._entries = {}
+
+    def load(self):
+        if not self.filename or not os.path.exists(self.filename):
+            return
+        try:
+            with open(self.filename, "rb") as h:
+                self._entries = pickle.loads(zlib.decompress(h.read()))
+        except Exception:
+            # just a cache, start over
+            util.print_exc()
+            self._entries = {}
+
+    def save(self):
+        if not self.filename or not self.dirty:
+            return
+        print_d("Saving %d fingerprints" % len(self._entries))
+        data = zlib.compress(
+            pickle.dumps(self._entries, pickle.HIGHEST_PROTOCOL))
+        try:
+            with util.atomic_save(self.filename, ".tmp", "wb") as h:
+                h.write(data)
+        except EnvironmentError:
+            util.print_exc()
+        else:
+            self.dirty = False
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, song):
+        """Returns a FingerPrintResult or None"""
+
+        filename = song("~filename")
+        entry = self._entries.get(filename)
+        if entry is not None and entry[0] == mtime(filename):
+            return FingerPrintResult(song, entry[1], entry[2])
+
+    def set(self, result):
+        filename = result.song("~filename")
+        self._entries[filename] = (
+            mtime(filename), result.chromaprint, result.length)
+        self.dirty = True
+
+
+_cache = None
+
+
+def get_cache():
+    """The shared, persistent FingerPrintCache"""
+
+    global _cache
+    if _cache is None:
+        _cache = FingerPrintCache(
+            os.path.join(const.USERDIR, "fingerprint_cache"))
+        _cache.load()
+    return _cache
+
+
 class FingerPrintPipeline(threading.Thread):
     def __init__(self, pool, song):
         super(FingerPrintPipeline, self).__init__()
@@ -185,17 +263,35 @@ class FingerPrintThreadPool(GObject.GObject):
             GObject.SignalFlags.RUN_LAST, None, (object, object)),
         }
 
-    def __init__(self, max_workers=None):
+    def __init__(self, max_workers=None, cache=None):
+        """If a FingerPrintCache is passed, cached results are used
+        instead of analyzing the files again and new ones get added.
+        """
+
         super(FingerPrintThreadPool, self).__init__()
         self.__threads = []
-        self.__queued = []
+        self.__queued = collections.deque()
         if max_workers is None:
-            max_workers = int(multiprocessing.cpu_count() * 1.5)
+            max_workers = get_num_workers()
         self.__max_workers = max_workers
         self.__stopped = False
+        self.__cache = cache
+
+    @property
+    def pending(self):
+        """Number of songs queued or being analyzed"""
+
+        return len(self.__queued) + len(self.__threads)
 
     def push(self, song):
         self.__stopped = False
+
+        if self.__cache is not None:
+            result = self.__cache.get(song)
+            if result is not None:
+                GLib.idle_add(self.__cached_done, result)
+                return
+
         if len(self.__threads) < self.__max_workers:
             self.__threads.append(FingerPrintPipeline(self, song))
             self.emit("fingerprint-started", song)
@@ -204,11 +300,18 @@ class FingerPrintThreadPool(GObject.GObject):
 
     def stop(self):
         self.__stopped = True
+        self.__queued.clear()
         for thread in self.__threads:
             thread.stop()
         for thread in self.__threads:
             thread.join()
 
+    def __cached_done(self, result):
+        if self.__stopped:
+            return
+        self.emit("fingerprint-started", result.song)
+        self.emit("fingerprint-done", result)
+
     def _callback(self, song, result, error, thread):
         # make sure everythin is gone before starting new ones.
         thread.join()
@@ -218,10 +321,12 @@ class FingerPrintThreadPool(GObject.GObject):
         if not error:
             chromaprint = result.get("chromaprint")
             res = FingerPrintResult(song, chromaprint, result["length"])
+            if self.__cache is not None and chromaprint:
+                self.__cache.set(res)
             self.emit("fingerprint-done", res)
         else:
             self.emit("fingerprint-error", song, error)
         if self.__queued:
-            song = self.__queued.pop(0)
+            song = self.__queued.popleft()
             self.__threads.append(FingerPrintPipeline(self, song))
             self.emit("fingerprint-started", song)
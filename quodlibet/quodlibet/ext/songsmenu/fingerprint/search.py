@@ -8,7 +8,7 @@ from contextlib import contextmanager
 
 from gi.repository import Gtk, Pango, Gdk
 
-from .analyze import FingerPrintThreadPool
+from .analyze import FingerPrintThreadPool, get_cache
 from .acoustid import AcoustidLookupThread
 from .util import get_write_mb_tags
 from quodlibet.qltk.models import ObjectStore
@@ -247,7 +247,7 @@ class SearchWindow(Window):
 
         sw.add(view)
 
-        self.pool = pool = FingerPrintThreadPool()
+        self.pool = pool = FingerPrintThreadPool(cache=get_cache())
         pool.connect('fingerprint-done', self.__fp_done_cb)
         pool.connect('fingerprint-error', self.__fp_error_cb)
         pool.connect('fingerprint-started', self.__fp_started_cb)
@@ -306,6 +306,7 @@ class SearchWindow(Window):
     def __destroy(self, *args):
         self.pool.stop()
         self._thread.stop()
+        get_cache().save()
 
     def __on_save(self, *args):
         write_mb = get_write_mb_tags()
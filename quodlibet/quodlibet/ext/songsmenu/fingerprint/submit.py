@@ -9,7 +9,7 @@ from gi.repository import Gtk, Pango, GLib
 from quodlibet.qltk import Button, Window
 
 from .acoustid import AcoustidSubmissionThread
-from .analyze import FingerPrintThreadPool
+from .analyze import FingerPrintThreadPool, get_cache
 
 
 def get_stats(results):
@@ -75,7 +75,7 @@ class FingerprintDialog(Window):
 
         self.__update_stats()
 
-        pool = FingerPrintThreadPool()
+        pool = FingerPrintThreadPool(cache=get_cache())
 
         bbox = Gtk.HButtonBox()
         bbox.set_layout(Gtk.ButtonBoxStyle.END)
@@ -161,6 +161,7 @@ class FingerprintDialog(Window):
 
         def idle_cancel():
             pool.stop()
+            get_cache().save()
             if self.__acoustid_thread:
                 self.__acoustid_thread.stop()
         # pool.stop can block a short time because the CV might be locked
@@ -181,5 +182,6 @@ class FingerprintDialog(Window):
 
     def __acoustid_done(self):
         self.__acoustid_thread.join()
+        get_cache().save()
         self.__set_fraction(1.0)
         GLib.timeout_add(500, self.destroy)
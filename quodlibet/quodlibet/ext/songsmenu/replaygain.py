@@ -10,16 +10,32 @@
 #    published by the Free Software Foundation.
 #
 
+import os
+import time
+import cPickle as pickle
+
 from gi.repository import Gtk
 from gi.repository import GObject
 from gi.repository import Pango
 from gi.repository import Gst
 from gi.repository import GLib
 
+from quodlibet import app
+from quodlibet import const
+from quodlibet import util
+from quodlibet.qltk.notif import Task
+from quodlibet.qltk.tagwriter import write_songs
 from quodlibet.qltk.views import HintedTreeView
+from quodlibet.plugins.events import EventPlugin
 from quodlibet.plugins.songsmenu import SongsMenuPlugin
+from quodlibet.player.gstbe.util import make_decodebin
+from quodlibet.util.path import mtime
+
+__all__ = ['ReplayGain', 'ReplayGainScanner']
 
-__all__ = ['ReplayGain']
+# the tags RGAlbum.write() sets
+RG_KEYS = ["replaygain_track_gain", "replaygain_track_peak",
+           "replaygain_album_gain", "replaygain_album_peak"]
 
 
 def get_num_threads():
@@ -85,6 +101,22 @@ class RGAlbum(object):
     def from_songs(self, songs):
         return RGAlbum([RGSong(s) for s in songs])
 
+    @classmethod
+    def from_cache(cls, songs, cache):
+        """Returns a finished RGAlbum if all songs have valid cached
+        results, or None.
+        """
+
+        album = cls.from_songs(songs)
+        for rgsong in album.songs:
+            entry = cache.get(rgsong.song)
+            if entry is None:
+                return None
+            rgsong.gain, rgsong.peak, album.gain, album.peak = entry
+            rgsong.progress = 1.0
+            rgsong.done = True
+        return album
+
 
 class RGSong(object):
     def __init__(self, song):
@@ -145,29 +177,12 @@ class ReplayGainPipeline(GObject.Object):
         self.filesrc = Gst.ElementFactory.make("filesrc", "source")
         self.pipe.add(self.filesrc)
 
-        self.decode = Gst.ElementFactory.make("decodebin", "decode")
-
-        def new_decoded_pad(dbin, pad):
-            pad.link(self.convert.get_static_pad("sink"))
-
-        def removed_decoded_pad(dbin, pad):
-            pad.unlink(self.convert.get_static_pad("sink"))
-
-        def sort_decoders(decode, pad, caps, factories):
-            def set_prio(x):
-                i, f = x
-                i = {"mad": -1, "mpg123audiodec": -2}.get(f.get_name(), i)
-                return (i, f)
-            return zip(*sorted(map(set_prio, enumerate(factories))))[1]
-
-        self.decode.connect("autoplug-sort", sort_decoders)
+        self.convert = Gst.ElementFactory.make("audioconvert", "convert")
 
-        self.decode.connect("pad-added", new_decoded_pad)
-        self.decode.connect("pad-removed", removed_decoded_pad)
+        self.decode = make_decodebin(self.convert, "decode")
         self.pipe.add(self.decode)
         self.filesrc.link(self.decode)
 
-        self.convert = Gst.ElementFactory.make("audioconvert", "convert")
         self.pipe.add(self.convert)
 
         self.resample = Gst.ElementFactory.make("audioresample", "resample")
@@ -270,6 +285,211 @@ class ReplayGainPipeline(GObject.Object):
             self._next_song()
 
 
+class RGCache(object):
+    """Persistent analysis results.
+
+    Results are stored per filename together with the file's mtime
+    and are only returned as long as the file hasn't changed.
+    """
+
+    def __init__(self, filename=None):
+        self.filename = filename
+        self.dirty = False
+        self._entries = {}
+
+    def load(self):
+        if not self.filename or not os.path.exists(self.filename):
+            return
+        try:
+            with open(self.filename, "rb") as h:
+                self._entries = pickle.load(h)
+        except Exception:
+            # just a cache, start over
+            util.print_exc()
+            self._entries = {}
+
+    def save(self):
+        if not self.filename or not self.dirty:
+            return
+        print_d("Saving %d ReplayGain results" % len(self._entries))
+        try:
+            with util.atomic_save(self.filename, ".tmp", "wb") as h:
+                pickle.dump(self._entries, h, pickle.HIGHEST_PROTOCOL)
+        except EnvironmentError:
+            util.print_exc()
+        else:
+            self.dirty = False
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, song):
+        """Returns (track_gain, track_peak, album_gain, album_peak)
+        or None.
+        """
+
+        filename = song("~filename")
+        entry = self._entries.get(filename)
+        if entry is not None and entry[0] == mtime(filename):
+            return entry[1:]
+
+    def set_album(self, album):
+        for rgsong in album.songs:
+            if rgsong.error or not rgsong.done:
+                continue
+            filename = rgsong.filename
+            self._entries[filename] = (mtime(filename), rgsong.gain,
+                                       rgsong.peak, album.gain, album.peak)
+        self.dirty = True
+
+    def touch(self, song):
+        """Take over the new mtime after the results got written to the
+        file.
+        """
+
+        filename = song("~filename")
+        entry = self._entries.get(filename)
+        if entry is not None:
+            self._entries[filename] = (mtime(filename),) + entry[1:]
+            self.dirty = True
+
+
+class RGLibraryScanner(GObject.Object):
+    """Analyzes albums which lack ReplayGain tags or changed since they
+    were last analyzed, using one pipeline per CPU core.
+
+    Works without any UI, results are reported through the signals and
+    stored in the passed RGCache; writing them to the files is up to the
+    user.
+    """
+
+    __gsignals__ = {
+        # album-done(self, album)
+        'album-done': (GObject.SignalFlags.RUN_LAST, None, (object,)),
+        # progress(self, done_albums, total_albums)
+        'progress': (GObject.SignalFlags.RUN_LAST, None, (int, int)),
+        'finished': (GObject.SignalFlags.RUN_LAST, None, ()),
+    }
+
+    def __init__(self, cache, num_pipes=None):
+        super(RGLibraryScanner, self).__init__()
+
+        if num_pipes is None:
+            num_pipes = get_num_threads()
+
+        self.cache = cache
+        self.done = 0
+        self.total = 0
+        self._todo = []
+        self._queued = set()
+        self._idle = [ReplayGainPipeline() for i in xrange(num_pipes)]
+        self._sigs = {}
+        for pipe in self._idle:
+            self._sigs[pipe] = pipe.connect("done", self.__done)
+        self._running = []
+
+    @staticmethod
+    def needs_analysis(song, cache):
+        """If the song is missing results in its tags or the cache has
+        results which are outdated.
+        """
+
+        if "replaygain_track_gain" not in song or \
+                "replaygain_album_gain" not in song:
+            return True
+        filename = song("~filename")
+        entry = cache._entries.get(filename)
+        return entry is not None and entry[0] != mtime(filename)
+
+    @staticmethod
+    def get_album_key(song):
+        if not song("album"):
+            return song.key
+        return song.album_key
+
+    @property
+    def active(self):
+        return bool(self._todo or self._running)
+
+    def add_songs(self, songs):
+        """Queue all albums of songs which need to be (re)analyzed"""
+
+        get_key = self.get_album_key
+        albums = {}
+        for song in songs:
+            if song.is_file:
+                albums.setdefault(get_key(song), []).append(song)
+
+        cache = self.cache
+        needs_analysis = self.needs_analysis
+        for key, album_songs in albums.iteritems():
+            if key in self._queued:
+                continue
+            if any(needs_analysis(s, cache) for s in album_songs):
+                self._queued.add(key)
+                self._todo.append((key, album_songs))
+                self.total += 1
+
+        self.__fill()
+
+    def prioritize(self, song):
+        """Analyze the album of song next if it is queued"""
+
+        key = self.get_album_key(song)
+        if key not in self._queued:
+            return
+        for i, (album_key, songs) in enumerate(self._todo):
+            if album_key == key:
+                self._todo.insert(0, self._todo.pop(i))
+                break
+
+    def stop(self):
+        """Stop after the currently analyzed albums are done"""
+
+        del self._todo[:]
+        self._queued.clear()
+
+    def destroy(self):
+        """Abort everything and free all pipelines"""
+
+        self.stop()
+        for pipe in self._idle + self._running:
+            pipe.disconnect(self._sigs.pop(pipe))
+            pipe.quit()
+        self._idle = []
+        self._running = []
+
+    def __fill(self):
+        while self._todo and self._idle:
+            key, songs = self._todo.pop(0)
+            self._queued.discard(key)
+
+            album = RGAlbum.from_cache(songs, self.cache)
+            if album is not None:
+                self.__finish_album(album)
+                continue
+
+            pipe = self._idle.pop(0)
+            self._running.append(pipe)
+            pipe.start(RGAlbum.from_songs(songs))
+
+        if not self.active:
+            self.emit("finished")
+
+    def __finish_album(self, album):
+        self.done += 1
+        if not album.error:
+            self.cache.set_album(album)
+        self.emit("album-done", album)
+        self.emit("progress", self.done, self.total)
+
+    def __done(self, pipe, album):
+        self._running.remove(pipe)
+        self._idle.append(pipe)
+        self.__finish_album(album)
+        self.__fill()
+
+
 class RGDialog(Gtk.Dialog):
 
     def __init__(self, albums, parent):
@@ -464,7 +684,102 @@ class ReplayGain(SongsMenuPlugin):
         self.plugin_finish()
 
 
+class ReplayGainScanner(EventPlugin):
+    PLUGIN_ID = 'ReplayGainScanner'
+    PLUGIN_NAME = _('Replay Gain Library Scanner')
+    PLUGIN_DESC = _('Analyzes ReplayGain of all albums in the library '
+                    'in the background and saves the results. Albums '
+                    'are only analyzed if they lack ReplayGain tags or '
+                    'have changed since.')
+    PLUGIN_ICON = Gtk.STOCK_MEDIA_PLAY
+
+    CACHE_PATH = os.path.join(const.USERDIR, "replaygain_cache")
+    SAVE_INTERVAL = 60
+
+    _scanner = None
+    _task = None
+    # set by the stop button, until the scanner is idle or gets new songs
+    _stopped = False
+
+    def enabled(self):
+        self._stopped = False
+        self._cache = RGCache(self.CACHE_PATH)
+        self._cache.load()
+        self._last_save = time.time()
+
+        self._scanner = scanner = RGLibraryScanner(self._cache)
+        self._sigs = [
+            scanner.connect("album-done", self.__album_done),
+            scanner.connect("progress", self.__progress),
+            scanner.connect("finished", self.__finished),
+        ]
+        song = app.player.song
+        scanner.add_songs(app.library.values())
+        if song is not None:
+            scanner.prioritize(song)
+
+    def disabled(self):
+        for sig in self._sigs:
+            self._scanner.disconnect(sig)
+        self._scanner.destroy()
+        self._scanner = None
+        self.__finished(None)
+
+    def plugin_on_song_started(self, song):
+        if song is not None:
+            self._scanner.prioritize(song._song)
+
+    def plugin_on_added(self, songs):
+        self._stopped = False
+        self._scanner.add_songs([s._song for s in songs if s])
+
+    def __stop(self):
+        # the task finishes itself
+        self._task = None
+        self._stopped = True
+        self._scanner.stop()
+
+    def __album_done(self, scanner, album):
+        cache = self._cache
+
+        def get_tags(song):
+            return [song.get(key) for key in RG_KEYS]
+
+        old = [get_tags(rgsong.song) for rgsong in album.songs]
+        album.write()
+        # only save songs where the results differ from the tags
+        songs = [rgsong.song for rgsong, tags in zip(album.songs, old)
+                 if not rgsong.error and get_tags(rgsong.song) != tags]
+
+        def written(batch):
+            for song in batch.written:
+                cache.touch(song)
+
+        write_songs(None, app.librarian, songs, written)
+
+        if time.time() - self._last_save > self.SAVE_INTERVAL:
+            self._last_save = time.time()
+            cache.save()
+
+    def __progress(self, scanner, done, total):
+        # albums analyzed when stop was pressed still report progress
+        if self._stopped:
+            return
+        if self._task is None:
+            self._task = Task(_("Replay Gain"), _("Analyzing library"),
+                              stop=self.__stop)
+        self._task.update(float(done) / max(total, 1))
+
+    def __finished(self, scanner):
+        self._stopped = False
+        if self._task is not None:
+            self._task.finish()
+            self._task = None
+        self._cache.save()
+
+
 if not Gst.Registry.get().find_plugin("replaygain"):
     __all__ = []
     del ReplayGain
+    del ReplayGainScanner
     raise ImportError("GStreamer replaygain plugin not found")
@@ -7,11 +7,13 @@
 
 import os
 import sys
+import time
+import threading
 
 from quodlibet.util.importhelper import load_dir_modules
 from quodlibet import util
 from quodlibet import const
-from quodlibet.util.dprint import print_w
+from quodlibet.util.dprint import print_d, print_w
 from quodlibet.const import MinVersions
 
 mimes = set()
@@ -61,31 +63,174 @@ def init():
 init()
 
 
-_extensions = tuple(_infos.keys())
+def _get_extension(filename):
+    """The lower case extension including the dot or an empty string"""
+
+    index = filename.rfind(".")
+    if index < 0:
+        return ""
+    return filename[index:].lower()
+
+
+# (magic, offset, extensions). Files starting with magic at offset
+# can be loaded by the types for the extensions, if the extension
+# list is empty they aren't audio files at all.
+_MAGIC = [
+    ("fLaC", 0, [".flac"]),
+    ("MAC ", 0, [".ape"]),
+    ("MP+", 0, [".mpc", ".mp+"]),
+    ("MPCK", 0, [".mpc", ".mp+"]),
+    ("wvpk", 0, [".wv"]),
+    ("TTA1", 0, [".tta"]),
+    ("WAVE", 8, [".wav"]),
+    ("0&\xb2u\x8ef\xcf\x11", 0, [".wma"]),
+    ("ftyp", 4, [".m4a", ".mp4", ".m4v"]),
+    ("MThd", 0, [".mid"]),
+    ("SNES-SPC700", 0, [".spc"]),
+    ("Vgm ", 0, [".vgm"]),
+    # ID3v2 can be in front of anything, so only pick MP3 if the
+    # extension doesn't match another format using it
+    ("ID3", 0, [".mp3", ".mp2", ".flac", ".tta", ".ape", ".mpc"]),
+    ("\xff\xd8\xff", 0, []),
+    ("\x89PNG", 0, []),
+    ("GIF8", 0, []),
+    ("%PDF", 0, []),
+    ("PK\x03\x04", 0, []),
+]
+
+# codec identification in the first Ogg packet
+_OGG_MAGIC = [
+    ("\x01vorbis", [".ogg", ".oga"]),
+    ("\x7fFLAC", [".oggflac"]),
+    ("Speex   ", [".spx"]),
+    ("OpusHead", [".opus"]),
+    ("\x80theora", [".ogv"]),
+]
+
+_OGG_EXTENSIONS = [".ogg", ".oga", ".oggflac", ".spx", ".opus", ".ogv"]
+
+
+def sniff(filename):
+    """Reads the first bytes of a file and returns a list of extensions
+    of types which can load it, an empty list if it isn't an audio file
+    or None if it can't be determined.
+    """
+
+    try:
+        with open(filename, "rb") as h:
+            header = h.read(64)
+    except EnvironmentError:
+        return
 
+    if not header:
+        return []
 
-def MusicFile(filename):
-    """Returns a AudioFile instance or None"""
+    if header.startswith("OggS") and len(header) > 27:
+        start = 27 + ord(header[26])
+        for magic, extensions in _OGG_MAGIC:
+            if header.startswith(magic, start):
+                return extensions
+        return _OGG_EXTENSIONS
 
-    lower = filename.lower()
-    for ext in _extensions:
-        if lower.endswith(ext):
-            try:
-                return _infos[ext](filename)
-            except:
-                print_w("Error loading %r" % filename)
-                if const.DEBUG:
-                    util.print_exc()
-                return
-    else:
+    for magic, offset, extensions in _MAGIC:
+        if header.startswith(magic, offset):
+            return extensions
+
+
+class LoadStats(object):
+    """Counts loaded files, failures and the time spent per format
+    module (e.g. "mp3" or "xiph")
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._stats = {}
+            self._rejected = 0
+
+    def add(self, name, seconds, failed=False):
+        with self._lock:
+            stats = self._stats.setdefault(name, [0, 0, 0.0])
+            stats[0] += 1
+            stats[1] += failed
+            stats[2] += seconds
+
+    def reject(self):
+        with self._lock:
+            self._rejected += 1
+
+    @property
+    def rejected(self):
+        """Number of files skipped because they weren't audio files"""
+
+        return self._rejected
+
+    def get(self):
+        """Returns a dict of module name -> (files, failures, seconds)"""
+
+        with self._lock:
+            return dict((k, tuple(v)) for k, v in self._stats.iteritems())
+
+    def __str__(self):
+        lines = ["%s: %d files, %d failed, %.2f seconds" % (
+            (name,) + stats) for name, stats in sorted(self.get().items())]
+        lines.append("%d files rejected" % self.rejected)
+        return "\n".join(lines)
+
+
+load_stats = LoadStats()
+
+
+def MusicFile(filename, sniff_type=True):
+    """Returns a AudioFile instance or None.
+
+    If sniff_type is True, the first bytes of the file decide which type
+    gets used if the extension doesn't match the content, and files
+    which aren't audio files get skipped without trying to load them.
+    """
+
+    ext = _get_extension(filename)
+    kind = _infos.get(ext)
+    if kind is None:
         print_w("Unknown file extension %r" % filename)
         return
 
+    if sniff_type:
+        extensions = sniff(filename)
+        if extensions is not None:
+            if not extensions:
+                print_w("Not an audio file %r" % filename)
+                load_stats.reject()
+                return
+            elif ext not in extensions:
+                for other in extensions:
+                    if other in _infos:
+                        print_d("Loading %r as %r file" % (filename, other))
+                        kind = _infos[other]
+                        break
+
+    name = kind.__module__.rsplit(".", 1)[-1]
+    start = time.time()
+    try:
+        song = kind(filename)
+    except:
+        load_stats.add(name, time.time() - start, failed=True)
+        print_w("Error loading %r" % filename)
+        if const.DEBUG:
+            util.print_exc()
+        return
+    load_stats.add(name, time.time() - start)
+    song.compact()
+    return song
+
 
 def filter(filename):
     """Returns true if the file extension is supported"""
 
-    return filename.lower().endswith(_extensions)
+    return _get_extension(filename) in _infos
 
 
 from quodlibet.formats._audio import USEFUL_TAGS, MACHINE_TAGS, PEOPLE
@@ -22,7 +22,7 @@ from quodlibet import const
 from quodlibet import util
 from quodlibet import config
 from quodlibet.util.path import mkdir, fsdecode, fsencode, mtime, expanduser
-from quodlibet.util.path import normalize_path
+from quodlibet.util.path import normalize_path, find_mount_point, ismount
 from quodlibet.util.string import encode
 
 from quodlibet.util.uri import URI
@@ -66,6 +66,57 @@ PEOPLE_SORT = [TAG_TO_SORT.get(k, k) for k in PEOPLE]
 
 FILESYSTEM_TAGS = "~filename ~basename ~dirname".split()
 
+# Tags with values which repeat across many songs. compact() makes
+# songs share one object for each distinct value of them.
+SHARED_TAGS = frozenset(PEOPLE + PEOPLE_SORT + (
+    "album albumsort discnumber tracknumber date originaldate genre "
+    "language labelid organization musicbrainz_albumid "
+    "musicbrainz_artistid musicbrainz_albumartistid ~mountpoint "
+    "~#bitrate ~#channels ~#rating ~#playcount ~#skipcount").split())
+
+# (type, value) -> value
+_shared_values = {}
+
+# Distinct values kept for sharing. Values of removed or edited songs
+# stay in the table, so it gets cleared once it reaches this size.
+# Songs keep the values they share so far.
+MAX_SHARED_VALUES = 50000
+
+
+# (albumsort, albumartistsort, grouping key) -> album key. Songs of the
+# same album share their key and human() runs once per album.
+# It gets cleared when full and after bulk operations, see
+# clear_album_keys().
+_album_keys = {}
+MAX_ALBUM_KEYS = 20000
+
+# Increase if the album key changes, so keys pickled with the library
+# get computed again
+ALBUM_KEY_VERSION = 1
+
+
+def clear_album_keys():
+    """Forget the album keys shared between songs. Songs keep their
+    own key until they change.
+    """
+
+    _album_keys.clear()
+
+
+def share_value(value):
+    """Returns an object equal to and of the same type as value, which
+    is shared by all callers asking for it.
+    """
+
+    key = (type(value), value)
+    try:
+        return _shared_values[key]
+    except KeyError:
+        if len(_shared_values) >= MAX_SHARED_VALUES:
+            _shared_values.clear()
+        _shared_values[key] = value
+        return value
+
 
 class AudioFile(dict, ImageContainer):
     """An audio file. It looks like a dict, but implements synthetic
@@ -91,7 +142,13 @@ class AudioFile(dict, ImageContainer):
     format = "Unknown Audio File"
     mimes = []
 
-    @util.cached_property
+    # The sort key caches. With slots the instance __dict__ of subclasses
+    # only gets allocated if something sets other attributes, which most
+    # songs never do. They are None after the song has changed and
+    # unset after unpickling, except for the album key, which gets
+    # pickled.
+    __slots__ = ("_album_key", "_sort_key")
+
     def __song_key(self):
         return (self("~#disc"), self("~#track"),
             human(self("artistsort")),
@@ -99,16 +156,34 @@ class AudioFile(dict, ImageContainer):
             human(self.get("title", "")),
             self.get("~filename"))
 
-    @util.cached_property
+    @property
     def album_key(self):
-        return (human(self("albumsort", "")),
-                human(self("albumartistsort", "")),
-                self.get("album_grouping_key") or self.get("labelid") or
-                self.get("musicbrainz_albumid") or "")
+        try:
+            if self._album_key is not None:
+                return self._album_key
+        except AttributeError:
+            pass
+        values = (self("albumsort", ""), self("albumartistsort", ""),
+                  self.get("album_grouping_key") or self.get("labelid") or
+                  self.get("musicbrainz_albumid") or "")
+        key = _album_keys.get(values)
+        if key is None:
+            if len(_album_keys) >= MAX_ALBUM_KEYS:
+                _album_keys.clear()
+            key = _album_keys[values] = (
+                human(values[0]), human(values[1]), values[2])
+        self._album_key = key
+        return key
 
-    @util.cached_property
+    @property
     def sort_key(self):
-        return [self.album_key, self.__song_key]
+        try:
+            if self._sort_key is not None:
+                return self._sort_key
+        except AttributeError:
+            pass
+        self._sort_key = key = [self.album_key, self.__song_key()]
+        return key
 
     @staticmethod
     def sort_by_func(tag):
@@ -128,30 +203,46 @@ class AudioFile(dict, ImageContainer):
         return lambda song: human(song(tag))
 
     def __getstate__(self):
-        """Don't pickle anything from __dict__"""
-        pass
+        """Only pickle the album key, to save computing it on load.
+        Pickling shares it between the songs of an album.
+        """
+        return (ALBUM_KEY_VERSION, self.album_key)
 
     def __setstate__(self, state):
-        """Needed because we have defined getstate"""
-        pass
+        # older versions pickled no state
+        if state and state[0] == ALBUM_KEY_VERSION:
+            self._album_key = state[1]
 
     def __setitem__(self, key, value):
         dict.__setitem__(self, key, value)
-        if not self.__dict__:
-            return
-        pop = self.__dict__.pop
-        pop("album_key", None)
-        pop("sort_key", None)
-        pop("__song_key", None)
+        self._album_key = self._sort_key = None
 
     def __delitem__(self, key):
         dict.__delitem__(self, key)
-        if not self.__dict__:
-            return
-        pop = self.__dict__.pop
-        pop("album_key", None)
-        pop("sort_key", None)
-        pop("__song_key", None)
+        self._album_key = self._sort_key = None
+
+    def compact(self):
+        """Reduce the memory used by this song.
+
+        Interns all tag names and replaces values of SHARED_TAGS
+        with ones shared by all songs. Doesn't change the content.
+
+        Only call it on songs no other thread uses, like when they get
+        loaded or scanned. Keys which aren't interned yet are missing
+        for a moment.
+        """
+
+        setitem = dict.__setitem__
+        for key, value in dict.items(self):
+            if type(key) is str:
+                interned = intern(key)
+                if interned is not key:
+                    # setting an equal key keeps the old key object
+                    dict.__delitem__(self, key)
+                    key = interned
+            if key in SHARED_TAGS:
+                value = share_value(value)
+            setitem(self, key, value)
 
     @property
     def key(self):
@@ -488,7 +579,7 @@ class AudioFile(dict, ImageContainer):
     def mounted(self):
         """Return true if the disk the file is on is mounted, or
         the file is not on a disk."""
-        return os.path.ismount(self.get("~mountpoint", "/"))
+        return ismount(self.get("~mountpoint", "/"))
 
     def can_change(self, k=None):
         """See if this file supports changing the given tag. This may
@@ -581,14 +672,10 @@ class AudioFile(dict, ImageContainer):
             self["~filename"] = normalize_path(
                 self["~filename"], canonicalise=True)
             # Find mount point (terminating at "/" if necessary)
-            head = self["~filename"]
-            while "~mountpoint" not in self:
-                head, tail = os.path.split(head)
-                # Prevent infinite loop without a fully-qualified filename
-                # (the unit tests use these).
-                head = head or "/"
-                if os.path.ismount(head):
-                    self["~mountpoint"] = head
+            if "~mountpoint" not in self:
+                # Unit tests use filenames which aren't fully-qualified
+                head = os.path.dirname(self["~filename"]) or "/"
+                self["~mountpoint"] = find_mount_point(head)
         else:
             self["~mountpoint"] = "/"
 
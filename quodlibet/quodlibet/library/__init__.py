@@ -21,21 +21,25 @@ from quodlibet.const import LIBRARY_SAVE_PERIOD_SECONDS
 
 from quodlibet.library.libraries import SongFileLibrary, SongLibrary
 from quodlibet.library.librarians import SongLibrarian
+from quodlibet.parse import format_cache
 from quodlibet.util.path import mtime
 
 
-def init(cache_fn=None):
+def init(cache_fn=None, lazy=False):
     """Set up the library and return the main one.
 
     Return a main library, and set a librarian for
-    all future SongLibraries.
+    all future SongLibraries. If lazy is True, loading
+    finishes in the main loop (see SongLibrary.load).
     """
     s = ", ".join(formats.modules)
     print_d("Supported formats: %s" % s)
-    SongFileLibrary.librarian = SongLibrary.librarian = SongLibrarian()
+    librarian = SongLibrarian()
+    SongFileLibrary.librarian = SongLibrary.librarian = librarian
+    format_cache.connect(librarian)
     library = SongFileLibrary("main")
     if cache_fn:
-        library.load(cache_fn)
+        library.load(cache_fn, lazy)
     return library
 
 
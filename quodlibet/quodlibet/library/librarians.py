@@ -13,6 +13,7 @@ import itertools
 
 from gi.repository import GObject
 
+from quodlibet.library.libraries import SongLibrary, SongStats
 from quodlibet.util.dprint import print_d
 
 
@@ -145,6 +146,18 @@ class SongLibrarian(Librarian):
             tags.update(library.tag_values(tag))
         return list(tags)
 
+    def get_stats(self, songs):
+        """Returns a SongStats for the songs (see SongLibrary.get_stats)"""
+
+        if not isinstance(songs, list):
+            songs = list(songs)
+        # the whole library shown, use its totals
+        for library in self.libraries.itervalues():
+            if len(library) == len(songs) and \
+                    isinstance(library, SongLibrary):
+                return library.get_stats(songs)
+        return SongStats.from_songs(songs)
+
     def rename(self, song, newname, changed=None):
         """Rename the song in all libraries it belongs to.
 
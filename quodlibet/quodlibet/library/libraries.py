@@ -16,19 +16,23 @@ import cPickle as pickle
 import os
 import shutil
 import threading
+from itertools import imap, izip, repeat
 
 from gi.repository import GObject
 
 from quodlibet.formats import MusicFile
-from quodlibet.parse import Query
+from quodlibet.formats._audio import clear_album_keys
+from quodlibet.parse import Query, format_cache
 from quodlibet.qltk.notif import Task
 from quodlibet.util.collection import Album
 from quodlibet.util.collections import DictMixin
 from quodlibet import util
+from quodlibet.util import copool
 from quodlibet import const
 from quodlibet import formats
 from quodlibet.util.dprint import print_d, print_w
 from quodlibet.util.path import fsdecode, expanduser, unexpand, mkdir
+from quodlibet.util.path import ismount, filesize
 
 
 class Library(GObject.GObject, DictMixin):
@@ -151,14 +155,23 @@ class Library(GObject.GObject, DictMixin):
         self.dirty = True
         self._contents[item.key] = item
 
-    def _load_init(self, items):
-        """Load many items into the library (on start)"""
+    def _load_init(self, items, lazy=False):
+        """Load many items into the library (on start)
+
+        If lazy is True, everything not needed for accessing the items
+        should be left to _load_later().
+        """
         # Subclasses should override this if they want to check
         # item validity; see `FileLibrary`.
         content = self._contents
         for item in items:
             content[item.key] = item
 
+    def _load_later(self, items):
+        """Finishes a lazy _load_init() in steps, yielding after each"""
+
+        return iter([])
+
     def add(self, items):
         """Add items. This causes an 'added' signal.
 
@@ -263,13 +276,23 @@ class PicklingMixin(object):
 
     filename = None
 
+    # True while a lazy load continues in the main loop
+    loading = False
+
+    # items to process per main loop iteration after a lazy load
+    LOAD_CHUNK_SIZE = 500
+
     def __init__(self):
         self._save_lock = threading.Lock()
 
-    def load(self, filename):
+    def load(self, filename, lazy=False):
         """Load a library from a file, containing a picked list.
 
         Loading does not cause added, changed, or removed signals.
+
+        If lazy is True, the items are available right away but work
+        like memory compaction and indexing continues in the main loop
+        afterwards, for a faster start.
         """
 
         self.filename = filename
@@ -279,10 +302,22 @@ class PicklingMixin(object):
 
         # this loads all items without checking their validity, but makes
         # sure that non-mounted items are masked
-        self._load_init(items)
+        self._load_init(items, lazy)
+
+        if lazy:
+            self.loading = True
+            # not a bound method, copool would repr() the whole library
+            self._load_routine = lambda: self._finish_load(items)
+            copool.add(self._load_routine)
 
         print_d("Done loading contents of %r." % filename, self)
 
+    def _finish_load(self, items):
+        for step in self._load_later(items):
+            yield step
+        self.loading = False
+        print_d("Finished lazy loading of %r." % self.filename, self)
+
     def save(self, filename=None):
         """Save the library to the given filename, or the default if `None`"""
 
@@ -307,6 +342,12 @@ class PicklingLibrary(Library, PicklingMixin):
         PicklingMixin.__init__(self)
         Library.__init__(self, name)
 
+    def destroy(self):
+        super(PicklingLibrary, self).destroy()
+        if self.loading:
+            copool.remove(self._load_routine)
+            self.loading = False
+
 
 class AlbumLibrary(Library):
     """An AlbumLibrary listens to a SongLibrary and sorts its songs into
@@ -314,9 +355,20 @@ class AlbumLibrary(Library):
 
     The library behaves like a dictionary: the keys are album_keys of
     AudioFiles, the values are Album objects.
+
+    If lazy is True, the existing songs get sorted into albums in the
+    main loop, emitting signals like for newly added songs. 'loaded' gets
+    emitted once all of them are sorted in.
     """
 
-    def __init__(self, library):
+    __gsignals__ = {
+        'loaded': (GObject.SignalFlags.RUN_LAST, None, ()),
+    }
+
+    # songs to sort in per main loop iteration if lazy
+    CHUNK_SIZE = 500
+
+    def __init__(self, library, lazy=False):
         self.librarian = None
         print_d("Initializing Album Library to watch %r" % library._name)
 
@@ -327,7 +379,16 @@ class AlbumLibrary(Library):
         self._asig = library.connect('added', self.__added)
         self._rsig = library.connect('removed', self.__removed)
         self._csig = library.connect('changed', self.__changed)
-        self.__added(library, library.values(), signal=False)
+        format_cache.connect(self)
+        self.loading = lazy
+        if lazy:
+            songs = library.values()
+            self._load_routine = lambda: self.__add_later(songs)
+            copool.add(self._load_routine)
+        else:
+            self.__added(library, library.values(), signal=False)
+            # all songs have their key now
+            clear_album_keys()
 
     def refresh(self, items):
         """Refresh albums after a manual change."""
@@ -340,26 +401,45 @@ class AlbumLibrary(Library):
     def destroy(self):
         for sig in [self._asig, self._rsig, self._csig]:
             self._library.disconnect(sig)
+        if self.loading:
+            copool.remove(self._load_routine)
+            self.loading = False
 
     def _get(self, item):
         return self._contents.get(item)
 
     def __add(self, items):
-        changed = set()
+        # album key -> album, for all albums touched
+        albums = {}
         new = set()
+        contents = self._contents
         for song in items:
             key = song.album_key
-            if key in self._contents:
-                changed.add(self._contents[key])
-            else:
-                album = Album(song)
-                self._contents[key] = album
-                new.add(album)
-            self._contents[key].songs.add(song)
-
+            album = albums.get(key)
+            if album is None:
+                album = contents.get(key)
+                if album is None:
+                    album = contents[key] = Album(song)
+                    new.add(album)
+                albums[key] = album
+            album.songs.add(song)
+
+        changed = set(albums.itervalues())
         changed -= new
         return changed, new
 
+    def __add_later(self, songs):
+        library = self._library
+        size = self.CHUNK_SIZE
+        for i in xrange(0, len(songs), size):
+            # skip songs removed in the meantime
+            chunk = [s for s in songs[i:i + size] if library.get(s.key) is s]
+            self.__added(library, chunk)
+            yield True
+        self.loading = False
+        clear_album_keys()
+        self.emit("loaded")
+
     def __added(self, library, items, signal=True):
         changed, new = self.__add(items)
 
@@ -377,7 +457,10 @@ class AlbumLibrary(Library):
         removed = set()
         for song in items:
             key = song.album_key
-            album = self._contents[key]
+            album = self._contents.get(key)
+            if album is None or song not in album.songs:
+                # not sorted in yet, see __add_later
+                continue
             album.songs.remove(song)
             changed.add(album)
             if not album.songs:
@@ -438,6 +521,74 @@ class AlbumLibrary(Library):
             self.emit("added", new)
 
 
+def _sum_songs(songs):
+    """Returns the total length and file size of a list of songs"""
+
+    # dict.get skips the attribute lookup and call per song
+    get = dict.get
+    length = sum(imap(get, songs, repeat("~#length"), repeat(0)))
+    sizes = map(get, songs, ["~#filesize"] * len(songs))
+    if None in sizes:
+        # not sanitized, e.g. from an old library
+        sizes = [filesize(song["~filename"]) if size is None else size
+                 for song, size in izip(songs, sizes)]
+    return length, sum(sizes)
+
+
+def _count_values(counts, songs, tag, delta):
+    """Adds delta to the number of songs per value of tag in counts,
+    values reaching zero get removed. Returns counts.
+    """
+
+    get = counts.get
+    for value in imap(dict.get, songs, repeat(tag)):
+        if not value:
+            continue
+        for value in (set(value.split("\n")) if "\n" in value else [value]):
+            num = get(value, 0) + delta
+            if num:
+                counts[value] = num
+            else:
+                del counts[value]
+    return counts
+
+
+class SongStats(object):
+    """The number of songs, their total length in seconds, their
+    total file size in bytes and the number of different artists and
+    albums.
+    """
+
+    __slots__ = ("count", "length", "size", "artists", "albums")
+
+    def __init__(self, count=0, length=0, size=0, artists=0, albums=0):
+        self.count = count
+        self.length = length
+        self.size = size
+        self.artists = artists
+        self.albums = albums
+
+    @classmethod
+    def from_songs(cls, songs):
+        """Sums up the values of all songs at once"""
+
+        if not isinstance(songs, list):
+            songs = list(songs)
+        length, size = _sum_songs(songs)
+        artists = len(_count_values({}, songs, "artist", 1))
+        albums = len(_count_values({}, songs, "album", 1))
+        return cls(len(songs), length, size, artists, albums)
+
+    def copy(self):
+        return type(self)(self.count, self.length, self.size,
+                          self.artists, self.albums)
+
+    def __repr__(self):
+        return "<%s count=%r length=%r size=%r artists=%r albums=%r>" % (
+            type(self).__name__, self.count, self.length, self.size,
+            self.artists, self.albums)
+
+
 class SongLibrary(PicklingLibrary):
     """A library for songs.
 
@@ -447,13 +598,102 @@ class SongLibrary(PicklingLibrary):
 
     def __init__(self, *args, **kwargs):
         super(SongLibrary, self).__init__(*args, **kwargs)
+        # SongStats for all songs and the number of songs per artist
+        # and album, None if they need to be recomputed
+        self.__totals = None
+        self.__values = None
+        self.__stat_sigs = [
+            self.connect("added", self.__stats_added),
+            self.connect("removed", self.__stats_removed),
+            self.connect("changed", self.__stats_changed),
+        ]
+
+    def __update_totals(self, items, delta):
+        if self.__totals is None:
+            return
+        items = list(items)
+        length, size = _sum_songs(items)
+        totals = self.__totals
+        totals.count += delta * len(items)
+        totals.length += delta * length
+        totals.size += delta * size
+        values = self.__values
+        totals.artists = len(_count_values(
+            values["artist"], items, "artist", delta))
+        totals.albums = len(_count_values(
+            values["album"], items, "album", delta))
+
+    def __stats_added(self, library, items):
+        self.__update_totals(items, 1)
+
+    def __stats_removed(self, library, items):
+        self.__update_totals(items, -1)
+
+    def __stats_changed(self, library, items):
+        # the old values are gone, recompute on the next access
+        self.__totals = None
+
+    def __is_all(self, songs):
+        if not isinstance(songs, list) or len(songs) != len(self):
+            return False
+        get = self._contents.get
+        for song in songs:
+            if get(song.key) is not song:
+                return False
+        return True
+
+    def get_stats(self, songs=None):
+        """Returns a SongStats for the passed songs, or for the whole
+        library if None.
+
+        The library totals are kept up to date on additions and
+        removals and also get used if the songs are the whole library,
+        other selections get summed up in bulk.
+        """
+
+        if songs is not None and not self.__is_all(songs):
+            return SongStats.from_songs(songs)
+
+        if self.__totals is None:
+            songs = self.values()
+            length, size = _sum_songs(songs)
+            self.__values = {
+                "artist": _count_values({}, songs, "artist", 1),
+                "album": _count_values({}, songs, "album", 1),
+            }
+            self.__totals = SongStats(
+                len(songs), length, size, len(self.__values["artist"]),
+                len(self.__values["album"]))
+        return self.__totals.copy()
+
+    def _load_init(self, items, lazy=False):
+        # loading doesn't emit signals
+        self.__totals = None
+
+        if not lazy:
+            for item in items:
+                item.compact()
+        super(SongLibrary, self)._load_init(items, lazy)
+
+    def _load_later(self, items):
+        size = self.LOAD_CHUNK_SIZE
+        for i in xrange(0, len(items), size):
+            for item in items[i:i + size]:
+                item.compact()
+            yield True
+        for step in super(SongLibrary, self)._load_later(items):
+            yield step
 
     @util.cached_property
     def albums(self):
-        return AlbumLibrary(self)
+        # while loading lazily, fill it in the background as well
+        return AlbumLibrary(self, lazy=self.loading)
 
     def destroy(self):
         super(SongLibrary, self).destroy()
+        for sig in self.__stat_sigs:
+            self.disconnect(sig)
+        self.__stat_sigs = []
         if "albums" in self.__dict__:
             self.albums.destroy()
 
@@ -497,6 +737,219 @@ class SongLibrary(PicklingLibrary):
         return songs
 
 
+def _get_mountpoint(item):
+    try:
+        return item.mountpoint
+    except (AttributeError, KeyError):
+        return None
+
+
+class PathIndex(object):
+    """Indexes library items by directory and mount point.
+
+    Lookups of the items below a directory or on a mount point take
+    time proportional to the size of the result. Items with non-path
+    keys are only indexed by their mount point.
+    """
+
+    def __init__(self):
+        # directory -> {key: item} of the items directly in it
+        self._files = {}
+        # directory -> set of subdirectories containing items
+        self._children = {}
+        # directory -> number of items below it
+        self._counts = {}
+        # mount point -> {key: item}
+        self._mounts = {}
+
+    def add(self, key, item):
+        self._mounts.setdefault(_get_mountpoint(item), {})[key] = item
+        if not isinstance(key, basestring):
+            return
+
+        path = os.path.dirname(key)
+        self._files.setdefault(path, {})[key] = item
+        while 1:
+            count = self._counts.get(path, 0)
+            self._counts[path] = count + 1
+            parent = os.path.dirname(path)
+            if parent == path:
+                break
+            if not count:
+                self._children.setdefault(parent, set()).add(path)
+            path = parent
+
+    def remove(self, key, item):
+        point = _get_mountpoint(item)
+        items = self._mounts.get(point)
+        if items is None or key not in items:
+            # the mount point changed since it was added
+            for point, items in self._mounts.iteritems():
+                if key in items:
+                    break
+            else:
+                items = None
+        if items is not None:
+            del items[key]
+            if not items:
+                del self._mounts[point]
+
+        if not isinstance(key, basestring):
+            return
+
+        path = os.path.dirname(key)
+        files = self._files[path]
+        del files[key]
+        if not files:
+            del self._files[path]
+        while 1:
+            count = self._counts[path] - 1
+            parent = os.path.dirname(path)
+            if count:
+                self._counts[path] = count
+            else:
+                del self._counts[path]
+                if parent != path:
+                    children = self._children[parent]
+                    children.discard(path)
+                    if not children:
+                        del self._children[parent]
+            if parent == path:
+                break
+            path = parent
+
+    def clear(self):
+        self._files.clear()
+        self._children.clear()
+        self._counts.clear()
+        self._mounts.clear()
+
+    def count(self, path):
+        """Number of items below the directory path"""
+
+        return self._counts.get(os.path.normpath(path), 0)
+
+    def get_files(self, path):
+        """List of items directly in the directory path"""
+
+        return self._files.get(os.path.normpath(path), {}).values()
+
+    def get_subdirs(self, path):
+        """Sorted list of the subdirectories of path containing items"""
+
+        return sorted(self._children.get(os.path.normpath(path), []))
+
+    def iter_subtree(self, path):
+        """Yields all items below the directory path"""
+
+        stack = [os.path.normpath(path)]
+        while stack:
+            path = stack.pop()
+            for item in self._files.get(path, {}).itervalues():
+                yield item
+            stack.extend(self._children.get(path, []))
+
+    def get_subtree(self, path):
+        """List of all items below the directory path"""
+
+        return list(self.iter_subtree(path))
+
+    def get_mount_point(self, point):
+        """List of items on the mount point"""
+
+        return self._mounts.get(point, {}).values()
+
+    @property
+    def mount_points(self):
+        """List of mount points containing items"""
+
+        return self._mounts.keys()
+
+
+class _IndexedContents(dict):
+    """A key to item dict which keeps a PathIndex up to date"""
+
+    def __init__(self, index):
+        super(_IndexedContents, self).__init__()
+        self._index = index
+        # keys of items not added to the index yet
+        self._unindexed = set()
+
+    def _unindex(self, key, item):
+        if key in self._unindexed:
+            self._unindexed.remove(key)
+        else:
+            self._index.remove(key, item)
+
+    def load(self, items):
+        """Add items without indexing them, see index()"""
+
+        unindexed = self._unindexed
+        setitem = dict.__setitem__
+        for item in items:
+            key = item.key
+            if key in self:
+                self[key] = item
+            else:
+                setitem(self, key, item)
+                unindexed.add(key)
+
+    def index(self, count=None):
+        """Index up to count (or all) unindexed items.
+        Returns True if some are left.
+        """
+
+        unindexed = self._unindexed
+        if count is None:
+            count = len(unindexed)
+        add = self._index.add
+        getitem = dict.__getitem__
+        for i in xrange(min(count, len(unindexed))):
+            key = unindexed.pop()
+            add(key, getitem(self, key))
+        return bool(unindexed)
+
+    def __setitem__(self, key, item):
+        old = self.get(key)
+        if old is not None:
+            self._unindex(key, old)
+        dict.__setitem__(self, key, item)
+        self._index.add(key, item)
+
+    def __delitem__(self, key):
+        item = self[key]
+        dict.__delitem__(self, key)
+        self._unindex(key, item)
+
+    def update(self, *args, **kwargs):
+        for key, item in dict(*args, **kwargs).iteritems():
+            self[key] = item
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def pop(self, key, *args):
+        if key in self:
+            item = self[key]
+            del self[key]
+            return item
+        elif args:
+            return args[0]
+        raise KeyError(key)
+
+    def popitem(self):
+        key, item = dict.popitem(self)
+        self._unindex(key, item)
+        return key, item
+
+    def clear(self):
+        dict.clear(self)
+        self._unindexed.clear()
+        self._index.clear()
+
+
 class FileLibrary(PicklingLibrary):
     """A library containing items on a local(-ish) filesystem.
 
@@ -507,8 +960,18 @@ class FileLibrary(PicklingLibrary):
     def __init__(self, name=None):
         super(FileLibrary, self).__init__(name)
         self._masked = {}
+        self._path_index = PathIndex()
+        self._contents = _IndexedContents(self._path_index)
+
+    @property
+    def path_index(self):
+        """The PathIndex of all visible items"""
+
+        # finish a lazy load early if needed
+        self._contents.index()
+        return self._path_index
 
-    def _load_init(self, items):
+    def _load_init(self, items, lazy=False):
         """Add many items to the library, check if the
         mountpoints are available and mark items as masked if not.
 
@@ -516,24 +979,38 @@ class FileLibrary(PicklingLibrary):
         """
 
         mounts = {}
-        contents = self._contents
+        visible = []
         masked = self._masked
 
         for item in items:
             mountpoint = item.mountpoint
 
             if mountpoint not in mounts:
-                is_mounted = os.path.ismount(mountpoint)
+                is_mounted = ismount(mountpoint)
                 mounts[mountpoint] = is_mounted
                 # at least one not mounted, make sure masked has an entry
                 if not is_mounted:
                     masked.setdefault(mountpoint, {})
 
             if mounts[mountpoint]:
-                contents[item.key] = item
+                visible.append(item)
             else:
                 masked[mountpoint][item.key] = item
 
+        if lazy:
+            # indexing gets done in _load_later()
+            self._contents.load(visible)
+        else:
+            contents = self._contents
+            for item in visible:
+                contents[item.key] = item
+
+    def _load_later(self, items):
+        for step in super(FileLibrary, self)._load_later(items):
+            yield step
+        while self._contents.index(self.LOAD_CHUNK_SIZE):
+            yield True
+
     def _load_item(self, item, force=False):
         """Add an item, or refresh it if it's already in the library.
         No signals will be fired.
@@ -627,7 +1104,7 @@ class FileLibrary(PicklingLibrary):
         if cofuncid:
             task.copool(cofuncid)
         for i, (point, items) in task.list(enumerate(self._masked.items())):
-            if os.path.ismount(point):
+            if ismount(point):
                 self._contents.update(items)
                 del(self._masked[point])
                 self.emit('added', items.values())
@@ -671,6 +1148,7 @@ class FileLibrary(PicklingLibrary):
     def scan(self, paths, exclude=[], cofuncid=None):
         added = []
         exclude = [expanduser(path) for path in exclude if path]
+        formats.load_stats.reset()
         for fullpath in paths:
             print_d("Scanning %r." % fullpath, self)
             desc = _("Scanning %s") % (unexpand(fsdecode(fullpath)))
@@ -707,6 +1185,8 @@ class FileLibrary(PicklingLibrary):
                         task.pulse()
                         yield True
 
+        print_d("Scan done:\n%s" % formats.load_stats, self)
+
     def get_content(self):
         """Return visible and masked items"""
 
@@ -743,9 +1223,8 @@ class FileLibrary(PicklingLibrary):
     def mask(self, point):
         print_d("Masking %r." % point, self)
         removed = {}
-        for item in self.itervalues():
-            if item.mountpoint == point:
-                removed[item.key] = item
+        for item in self.path_index.get_mount_point(point):
+            removed[item.key] = item
         if removed:
             self.remove(removed.values())
             self._masked.setdefault(point, {}).update(removed)
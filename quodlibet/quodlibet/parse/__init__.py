@@ -1,3 +1,3 @@
 from quodlibet.parse._query import Query
 from quodlibet.parse._pattern import (Pattern, FileFromPattern, XMLFromPattern,
-    XMLFromMarkupPattern, pattern_from_markup)
+    XMLFromMarkupPattern, pattern_from_markup, FormatCache, format_cache)
@@ -11,6 +11,8 @@
 
 import os
 import re
+import sys
+import weakref
 
 from quodlibet import util
 from quodlibet.parse._scanner import Scanner
@@ -249,9 +251,100 @@ class PatternFormatter(object):
 
         return set(vals)
 
+    def format_cached(self, song):
+        """Like format(), but returns a result from format_cache if
+        possible. The cache gets invalidated by the 'changed' signals of
+        the connected libraries, songs or albums outside of them get
+        formatted on each call.
+        """
+
+        return format_cache.format(self, song)
+
     __mod__ = format
 
 
+class FormatCache(object):
+    """Caches formatted patterns per (formatter, song) pair.
+
+    Keeps two generations of entries: hits in the old one move to the
+    new one, and once the new one holds about half of max_size bytes the
+    old one gets dropped. Close to LRU, without work for most hits.
+
+    Once libraries are connected, only their items get cached, since
+    nothing would invalidate the results for others.
+    """
+
+    # estimated bytes per entry, besides the formatted text
+    ENTRY_SIZE = 150
+
+    def __init__(self, max_size=32 * 1024 ** 2):
+        self.max_size = max_size
+        self._new = {}
+        self._old = {}
+        self._size = 0
+        # all formatters with cached results
+        self._formatters = set()
+        self._libraries = weakref.WeakSet()
+
+    def format(self, formatter, song):
+        key = (formatter, song)
+        try:
+            return self._new[key]
+        except KeyError:
+            pass
+
+        value = self._old.pop(key, None)
+        if value is None:
+            value = formatter.format(song)
+            if self._libraries and not self.__tracked(song):
+                return value
+            self._formatters.add(formatter)
+        self._new[key] = value
+
+        self._size += sys.getsizeof(value) + self.ENTRY_SIZE
+        if self._size > self.max_size // 2:
+            self._old = self._new
+            self._new = {}
+            self._size = 0
+            self._formatters = set(f for f, s in self._old)
+        return value
+
+    def __tracked(self, song):
+        key = getattr(song, "key", None)
+        for library in self._libraries:
+            if library.get(key) is song:
+                return True
+        return False
+
+    def invalidate(self, songs):
+        """Forget the results for songs"""
+
+        for formatter in self._formatters:
+            for song in songs:
+                key = (formatter, song)
+                self._new.pop(key, None)
+                self._old.pop(key, None)
+
+    def clear(self):
+        self._new.clear()
+        self._old.clear()
+        self._size = 0
+        self._formatters.clear()
+
+    def connect(self, library):
+        """Invalidate songs on 'changed' and 'removed' of library"""
+
+        def invalidate(library, songs):
+            self.invalidate(songs)
+
+        self._libraries.add(library)
+        for signal in ["changed", "removed"]:
+            library.connect(signal, invalidate)
+
+
+format_cache = FormatCache()
+
+
 class PatternCompiler(object):
     def __init__(self, root):
         self.__root = root.node
@@ -368,6 +368,28 @@ def is_parsable(string):
 Query.is_parsable = is_parsable
 
 
+def is_refinement(old, new):
+    """Whether everything matched by `new` is also matched by `old`.
+
+    Only detects the common case of a plain text search getting more
+    specific while typing, e.g. "foo" -> "foob" or "foo" -> "foo bar".
+    """
+
+    if match_all(old):
+        return True
+
+    if _get_query_type(old) != STRING or _get_query_type(new) != STRING:
+        return False
+
+    # every old word has to be part of a new one
+    new_words = new.lower().split()
+    for word in old.lower().split():
+        if not [w for w in new_words if word in w]:
+            return False
+    return True
+Query.is_refinement = is_refinement
+
+
 def is_valid_color(string):
     """Returns True/False for a query, None for a text only query"""
 
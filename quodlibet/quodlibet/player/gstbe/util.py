@@ -45,6 +45,37 @@ def iter_to_list(func):
     return objects
 
 
+def sort_decoders(decode, pad, caps, factories):
+    """An 'autoplug-sort' handler for decodebin which prefers mad and
+    mpg123 over other mp3 decoders.
+    """
+
+    def set_prio(x):
+        i, f = x
+        i = {"mad": -1, "mpg123audiodec": -2}.get(f.get_name(), i)
+        return (i, f)
+    return zip(*sorted(map(set_prio, enumerate(factories))))[1]
+
+
+def make_decodebin(element, name=None):
+    """Returns a decodebin which links its decoded pad to the sink pad
+    of `element` once it's available.
+    """
+
+    decode = Gst.ElementFactory.make("decodebin", name)
+
+    def new_decoded_pad(dbin, pad):
+        pad.link(element.get_static_pad("sink"))
+
+    def removed_decoded_pad(dbin, pad):
+        pad.unlink(element.get_static_pad("sink"))
+
+    decode.connect("autoplug-sort", sort_decoders)
+    decode.connect("pad-added", new_decoded_pad)
+    decode.connect("pad-removed", removed_decoded_pad)
+    return decode
+
+
 def GStreamerSink(pipeline):
     """Try to create a GStreamer pipeline:
     * Try making the pipeline (defaulting to gconfaudiosink or
@@ -6,6 +6,8 @@
 # it under the terms of the GNU General Public License version 2 as
 # published by the Free Software Foundation
 
+import time
+
 from gi.repository import GObject
 
 from quodlibet import util
@@ -69,14 +71,23 @@ def _map_signals(obj, prefix="plugin_on_", blacklist=None):
 
 
 class EventPluginHandler(PluginHandler):
+    """Dispatches librarian and player signals to enabled event plugins.
+
+    A table mapping each event to the plugin methods handling it gets
+    rebuilt whenever a plugin is enabled or disabled, so song lists
+    only get wrapped if at least one plugin handles the event.
+    """
 
     def __init__(self, librarian=None, player=None):
+        self.__events = set()
+
         if librarian:
             sigs = _map_signals(librarian, blacklist=("notify",))
             for event, handle in sigs:
                 def handler(librarian, *args):
                     self.__invoke(librarian, args[-1], *args[:-1])
                 librarian.connect(event, handler, event)
+                self.__events.add(event)
 
         if librarian and player:
             sigs = _map_signals(player, blacklist=("notify", "error"))
@@ -84,24 +95,45 @@ class EventPluginHandler(PluginHandler):
                 def cb_handler(librarian, *args):
                     self.__invoke(librarian, args[-1], *args[:-1])
                 player.connect_object(event, cb_handler, librarian, event)
+                self.__events.add(event)
 
         self.__plugins = {}
+        self.__handlers = {}
+        self.__timings = {}
+
+    def __update_handlers(self):
+        handlers = {}
+        for event in self.__events:
+            method_name = 'plugin_on_' + event.replace('-', '_')
+            for cls, plugin in self.__plugins.iteritems():
+                handler = getattr(plugin, method_name, None)
+                if handler is not None:
+                    handlers.setdefault(event, []).append((cls, handler))
+        self.__handlers = handlers
 
     def __invoke(self, librarian, event, *args):
+        handlers = self.__handlers.get(event, [])
+
         args = list(args)
         if args and args[0]:
             if isinstance(args[0], dict):
                 args[0] = SongWrapper(args[0])
             elif isinstance(args[0], (set, list)):
+                # wrapping large song lists is expensive, so only do it
+                # if someone is interested
+                if not handlers:
+                    return
                 args[0] = ListWrapper(args[0])
-        for plugin in self.__plugins.itervalues():
-            method_name = 'plugin_on_' + event.replace('-', '_')
-            handler = getattr(plugin, method_name, None)
-            if handler is not None:
-                try:
-                    handler(*args)
-                except Exception:
-                    util.print_exc()
+
+        for cls, handler in handlers:
+            start = time.time()
+            try:
+                handler(*args)
+            except Exception:
+                util.print_exc()
+            timing = self.__timings.setdefault(cls.PLUGIN_ID, [0, 0.0])
+            timing[0] += 1
+            timing[1] += time.time() - start
 
         if event not in ["removed", "changed"] and args:
             from quodlibet import app
@@ -111,11 +143,20 @@ class EventPluginHandler(PluginHandler):
             songs = filter(None, songs)
             check_wrapper_changed(librarian, app.window, songs)
 
+    def get_timings(self):
+        """Returns a dict mapping plugin IDs to (calls, seconds) tuples,
+        the number of handled events and the time spent handling them.
+        """
+
+        return dict((k, tuple(v)) for k, v in self.__timings.iteritems())
+
     def plugin_handle(self, plugin):
         return issubclass(plugin.cls, EventPlugin)
 
     def plugin_enable(self, plugin):
         self.__plugins[plugin.cls] = plugin.get_instance()
+        self.__update_handlers()
 
     def plugin_disable(self, plugin):
         self.__plugins.pop(plugin.cls)
+        self.__update_handlers()
@@ -59,7 +59,7 @@ class LibraryBrowser(Window, util.InstanceTracker, PersistentWindowMixin):
         self.add(Gtk.VBox(spacing=6))
 
         view = SongList(library, update=True)
-        view.info.connect("changed", self.__set_time)
+        view.info.connect("changed", self.__set_time, library)
         self.songlist = view
 
         sw = Gtk.ScrolledWindow()
@@ -146,9 +146,10 @@ class LibraryBrowser(Window, util.InstanceTracker, PersistentWindowMixin):
             view.popup_menu(menu, 0, Gtk.get_current_event_time())
         return True
 
-    def __set_time(self, info, songs):
-        i = len(songs)
-        length = sum(song.get("~#length", 0) for song in songs)
-        t = self.browser.statusbar(i) % {
-            'count': i, 'time': util.format_time_long(length)}
+    def __set_time(self, info, songs, library):
+        # uses the running library totals if the whole library is shown
+        stats = library.get_stats(songs)
+        t = self.browser.statusbar(stats.count) % {
+            'count': stats.count,
+            'time': util.format_time_long(stats.length)}
         self.__statusbar.set_text(t)
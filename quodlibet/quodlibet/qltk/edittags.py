@@ -20,11 +20,10 @@ from quodlibet.util import massagers
 from quodlibet.qltk.completion import LibraryValueCompletion
 from quodlibet.qltk.tagscombobox import TagsComboBox, TagsComboBoxEntry
 from quodlibet.qltk.views import RCMHintedTreeView, TreeViewColumn
-from quodlibet.qltk.wlw import WritingWindow
+from quodlibet.qltk.tagwriter import write_songs
 from quodlibet.qltk.x import SeparatorMenuItem
 from quodlibet.qltk._editpane import EditingPluginHandler
 from quodlibet.plugins import PluginManager
-from quodlibet.util.path import fsdecode
 from quodlibet.util.string import decode
 from quodlibet.util.string.splitters import (split_value, split_title,
     split_people, split_album)
@@ -676,10 +675,8 @@ class EditTags(Gtk.VBox):
                                           decode(row[VALUE]),
                                           decode(row[ORIGVALUE])))
 
-        was_changed = set()
+        to_write = []
         songs = self.__songinfo.songs
-        win = WritingWindow(self, len(songs))
-        win.show()
         for song in songs:
             if not song.valid() and not qltk.ConfirmAction(
                 self, _("Tag may not be accurate"),
@@ -736,26 +733,9 @@ class EditTags(Gtk.VBox):
                 song.add(tag, value)
 
             if changed:
-                try:
-                    song.write()
-                except:
-                    util.print_exc()
-                    qltk.ErrorMessage(
-                        self, _("Unable to save song"),
-                        _("Saving <b>%s</b> failed. The file "
-                          "may be read-only, corrupted, or you "
-                          "do not have permission to edit it.") % (
-                        util.escape(fsdecode(
-                        song('~basename'))))).run()
-                    library.reload(song, changed=was_changed)
-                    break
-                was_changed.add(song)
-
-            if win.step():
-                break
+                to_write.append(song)
 
-        win.destroy()
-        library.changed(was_changed)
+        write_songs(self, library, to_write)
         for b in [save, revert]:
             b.set_sensitive(False)
 
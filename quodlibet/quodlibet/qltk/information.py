@@ -536,8 +536,9 @@ class OneArtist(qltk.Notebook):
 
 
 class ManySongs(qltk.Notebook):
-    def __init__(self, songs):
+    def __init__(self, library, songs):
         super(ManySongs, self).__init__()
+        self.stats = library.get_stats(songs)
         swin = SW()
         swin.title = _("Information")
         vbox = Gtk.VBox(spacing=12)
@@ -595,14 +596,8 @@ class ManySongs(qltk.Notebook):
                         False, False, 0)
 
     def _file(self, songs, box):
-        length = 0
-        size = 0
-        for song in songs:
-            length += song.get("~#length", 0)
-            try:
-                size += filesize(song["~filename"])
-            except EnvironmentError:
-                pass
+        length = self.stats.length
+        size = self.stats.size
         table = Gtk.Table(2, 2)
         table.set_col_spacings(6)
         table.attach(Label(_("Total length:")), 0, 1, 0, 1,
@@ -663,7 +658,7 @@ class Information(Window, PersistentWindowMixin):
             elif min(artists) == max(artists) and artists[0]:
                 self.add(OneArtist(songs))
             else:
-                self.add(ManySongs(songs))
+                self.add(ManySongs(library, songs))
 
         self.set_title(self.get_child().title + " - Quod Libet")
         self.get_child().show_all()
@@ -17,7 +17,7 @@ from quodlibet import util
 from quodlibet import app
 from quodlibet.config import RatingsPrefs, RATINGS
 
-from quodlibet.parse import Query
+from quodlibet.parse import Query, format_cache
 from quodlibet.qltk.ccb import ConfigCheckButton as CCB
 from quodlibet.qltk.data_editors import MultiStringEditor
 from quodlibet.qltk.entry import ValidatingEntry, UndoEntry
@@ -406,6 +406,8 @@ class PreferencesWindow(qltk.UniqueWindow):
                 if it is None:
                     return
                 RATINGS.default = model[it][0]
+                # patterns show the default for unrated songs
+                format_cache.clear()
 
             def populate_default_rating_model(combo, num):
                 model = combo.get_model()
@@ -456,6 +458,7 @@ class PreferencesWindow(qltk.UniqueWindow):
                 if it is None:
                     return
                 RATINGS.number = num = model[it][0]
+                format_cache.clear()
                 refresh_default_combo(num)
 
             refresh_default_combo(RATINGS.number)
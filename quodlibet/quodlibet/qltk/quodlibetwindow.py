@@ -1157,8 +1157,9 @@ class QuodLibetWindow(Gtk.Window, PersistentWindowMixin):
             self.browser.activate()
 
     def __set_time(self, info, songs):
-        i = len(songs)
-        length = sum(song.get("~#length", 0) for song in songs)
-        t = self.browser.statusbar(i) % {
-            'count': i, 'time': util.format_time_long(length)}
+        # uses the running library totals if the whole library is shown
+        stats = self.__library.get_stats(songs)
+        t = self.browser.statusbar(stats.count) % {
+            'count': stats.count,
+            'time': util.format_time_long(stats.length)}
         self.statusbar.set_default_text(t)
@@ -218,7 +218,7 @@ class PatternColumn(WideTextColumn):
         song = model.get_value(iter_)
         if not self._pattern:
             return
-        value = self._pattern % song
+        value = self._pattern.format_cached(song)
         if not self._needs_update(value):
             return
         cell.set_property('text', value)
@@ -17,7 +17,7 @@ from quodlibet import util
 
 from quodlibet.qltk._editpane import EditPane, FilterCheckButton
 from quodlibet.qltk._editpane import EditingPluginHandler
-from quodlibet.qltk.wlw import WritingWindow
+from quodlibet.qltk.tagwriter import write_songs
 from quodlibet.util.path import fsdecode
 from quodlibet.util.string.splitters import split_value
 
@@ -232,10 +232,7 @@ class TagsFromPath(EditPane):
         pattern = TagsFromPattern(pattern_text)
         model = self.view.get_model()
         add = bool(addreplace.get_active())
-        win = WritingWindow(self, len(model))
-        win.show()
-
-        was_changed = set()
+        to_write = []
 
         for row in (model or []):
             song = row[0]
@@ -263,25 +260,9 @@ class TagsFromPath(EditPane):
                                 changed = True
 
             if changed:
-                try:
-                    song.write()
-                except:
-                    qltk.ErrorMessage(
-                        self, _("Unable to edit song"),
-                        _("Saving <b>%s</b> failed. The file "
-                          "may be read-only, corrupted, or you "
-                          "do not have permission to edit it.") % (
-                        util.escape(fsdecode(song('~basename'))))
-                        ).run()
-                    library.reload(song, changed=was_changed)
-                    break
-                was_changed.add(song)
-
-            if win.step():
-                break
+                to_write.append(song)
 
-        win.destroy()
-        library.changed(was_changed)
+        write_songs(self, library, to_write)
         self.save.set_sensitive(False)
 
     def __row_edited(self, renderer, path, new, model, colnum):
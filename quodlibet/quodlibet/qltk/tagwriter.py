@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+# Copyright 2014 Quod Libet contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as
+# published by the Free Software Foundation
+
+"""Saves tags of changed songs to disk in worker threads.
+
+Editors change the songs in the main loop and hand them over to
+write_songs(), which writes them in the background, shows the progress
+as a Task in the status bar and fires one 'changed' signal once the
+whole batch is done.
+
+The workers only write copies of the tags taken in the main loop; what
+write() changes on them (file stats, sanitized values) gets applied to
+the library songs in the main loop again.
+"""
+
+import collections
+import threading
+import time
+
+from gi.repository import GLib
+
+from quodlibet import qltk
+from quodlibet import util
+from quodlibet.qltk.notif import Task
+from quodlibet.util.dprint import print_d, print_w
+from quodlibet.util.path import fsdecode
+from quodlibet.util.threadpool import ThreadPool, get_num_workers
+
+
+class WriteBatch(object):
+    """A set of songs submitted together.
+
+    Once all songs are processed, songs which failed to save or didn't
+    get saved because the batch was stopped get reloaded, and
+    library.changed() gets called once for all of them.
+    """
+
+    def __init__(self, library, songs, callback):
+        self.library = library
+        self.songs = songs
+        self.written = set()
+        self.failed = []
+        self.cancelled = False
+        self.__callback = callback
+        self.__skipped = []
+        self.__pending = len(songs)
+
+        self.task = Task(_("Saving"), _("Saving the songs you changed."),
+                         stop=self.stop)
+
+    def stop(self):
+        """Don't save songs which haven't been saved yet"""
+
+        self.cancelled = True
+
+    def _song_done(self, song, before, after, error, skipped):
+        # main loop
+        if skipped:
+            self.__skipped.append(song)
+        elif error is not None:
+            self.failed.append((song, error))
+        else:
+            _apply_changes(song, before, after)
+            self.written.add(song)
+
+        self.__pending -= 1
+        self.task.update(1 - float(self.__pending) / len(self.songs))
+        if not self.__pending:
+            self._finish()
+
+    def _finish(self):
+        print_d("Saved %d, failed %d, skipped %d songs" % (
+            len(self.written), len(self.failed), len(self.__skipped)))
+
+        self.task.finish()
+        changed = set(self.written)
+        for song in self.__skipped + [s for (s, e) in self.failed]:
+            self.library.reload(song, changed=changed)
+        self.library.changed(changed)
+
+        if self.__callback:
+            self.__callback(self)
+
+
+def _apply_changes(song, before, after):
+    """Apply the changes write() made to a copy of the song tags, unless
+    the song got changed in the meantime.
+    """
+
+    missing = object()
+    for key in set(before) | set(after):
+        if key == "~filename":
+            # renaming goes through the library
+            continue
+        old = before.get(key, missing)
+        new = after.get(key, missing)
+        if old == new or song.get(key, missing) != old:
+            continue
+        if new is missing:
+            del song[key]
+        else:
+            song[key] = new
+
+
+class TagWriter(object):
+    """Writes songs using a pool of worker threads.
+
+    Writes of the same file get queued and done one after another in
+    the order they were submitted, other files get written in parallel.
+
+    Each song write gets retried `retries` times with an increasing
+    delay, to get over temporary failures, e.g. on network shares.
+    """
+
+    def __init__(self, max_workers=None, retries=2, retry_delay=0.5):
+        if max_workers is None:
+            max_workers = get_num_workers()
+        self._pool = ThreadPool(max_workers, name="TagWriter")
+        self._retries = retries
+        self._retry_delay = retry_delay
+        # filename -> deque of pending writes for it
+        self._queues = {}
+        self._lock = threading.Lock()
+
+    def write(self, library, songs, callback=None):
+        """Write all songs in the background.
+
+        When done, callback gets called with the WriteBatch in the
+        main loop. Returns the WriteBatch.
+        """
+
+        songs = list(songs)
+        batch = WriteBatch(library, songs, callback)
+        if not songs:
+            GLib.idle_add(batch._finish)
+            return batch
+
+        for song in songs:
+            self._queue(song.key, (batch, song, dict(song)))
+        return batch
+
+    def wait(self):
+        """Block until all queued songs are written. The results get
+        handled by the main loop afterwards.
+        """
+
+        self._pool.wait()
+
+    def _queue(self, filename, entry):
+        with self._lock:
+            queue = self._queues.get(filename)
+            if queue is not None:
+                # a worker is on it already
+                queue.append(entry)
+                return
+            self._queues[filename] = collections.deque([entry])
+        self._pool.add(self._write_file, filename)
+
+    def _write_file(self, filename):
+        # worker thread
+        while 1:
+            with self._lock:
+                queue = self._queues[filename]
+                if not queue:
+                    del self._queues[filename]
+                    return
+                entry = queue.popleft()
+            self._write_song(filename, *entry)
+
+    def _write_song(self, filename, batch, song, tags):
+        # worker thread
+        error = None
+        after = None
+        skipped = batch.cancelled
+        if not skipped:
+            for attempt in xrange(self._retries + 1):
+                if attempt:
+                    time.sleep(self._retry_delay * 2 ** (attempt - 1))
+                # the library song belongs to the main loop
+                copy = song.__class__.__new__(song.__class__)
+                dict.update(copy, tags)
+                try:
+                    copy.write()
+                except Exception as e:
+                    print_w("Saving %r failed (attempt %d): %r" % (
+                        filename, attempt + 1, e))
+                    error = e
+                else:
+                    error = None
+                    after = dict(copy)
+                    break
+
+        GLib.idle_add(batch._song_done, song, tags, after, error, skipped)
+
+
+_writer = TagWriter()
+
+wait = _writer.wait
+
+
+def write_songs(parent, library, songs, callback=None):
+    """Save songs in the background using the global TagWriter
+    and report failures with an error dialog.
+    """
+
+    def done(batch):
+        if batch.failed:
+            song = batch.failed[0][0]
+            qltk.ErrorMessage(
+                parent, _("Unable to save song"),
+                _("Saving <b>%s</b> failed. The file "
+                  "may be read-only, corrupted, or you "
+                  "do not have permission to edit it.") % (
+                util.escape(fsdecode(song('~basename'))))).run()
+        if callback:
+            callback(batch)
+
+    return _writer.write(library, songs, done)
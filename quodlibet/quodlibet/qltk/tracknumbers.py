@@ -11,7 +11,7 @@ from quodlibet import qltk
 from quodlibet import util
 
 from quodlibet.qltk.views import HintedTreeView, TreeViewColumn
-from quodlibet.qltk.wlw import WritingWindow
+from quodlibet.qltk.tagwriter import write_songs
 from quodlibet.util.path import fsdecode
 
 
@@ -108,14 +108,12 @@ class TrackNumbers(Gtk.VBox):
             save.set_sensitive(True)
 
     def __save_files(self, parent, model, library):
-        win = WritingWindow(parent, len(model))
-        was_changed = set()
+        to_write = []
         for song, track in [(r[0], r[2]) for r in model]:
             if song.get("tracknumber") == track:
-                win.step()
                 continue
             if not song.valid() and not qltk.ConfirmAction(
-                win, _("Tag may not be accurate"),
+                parent, _("Tag may not be accurate"),
                 _("<b>%s</b> changed while the program was running. "
                   "Saving without refreshing your library may "
                   "overwrite other changes to the song.\n\n"
@@ -124,23 +122,8 @@ class TrackNumbers(Gtk.VBox):
                 ).run():
                 break
             song["tracknumber"] = track
-            try:
-                song.write()
-            except:
-                util.print_exc()
-                qltk.ErrorMessage(
-                    win, _("Unable to save song"),
-                    _("Saving <b>%s</b> failed. The file may be "
-                      "read-only, corrupted, or you do not have "
-                      "permission to edit it.") %
-                    util.escape(fsdecode(song('~basename')))).run()
-                library.reload(song, changed=was_changed)
-                break
-            was_changed.add(song)
-            if win.step():
-                break
-        library.changed(was_changed)
-        win.destroy()
+            to_write.append(song)
+        write_songs(parent, library, to_write)
 
     def __preview_tracks(self, ctx, start, total, model, save, revert):
         start = start.get_value_as_int()
@@ -17,7 +17,7 @@ from quodlibet import util
 from quodlibet import config
 from quodlibet.formats._audio import PEOPLE, TAG_TO_SORT, INTERN_NUM_DEFAULT
 from quodlibet.util import thumbnails
-from collections import Iterable
+from collections import Iterable, OrderedDict
 from quodlibet.util.path import fsencode, escape_filename, unescape_filename
 from .collections import HashedList
 
@@ -61,6 +61,17 @@ NUM_FUNCS = {
     "bav": bayesian_average
 }
 
+# Values commonly displayed in browsers and used in queries. Once
+# computed they stay cached until the collection gets finalized,
+# all other values go through a small LRU cache.
+AGGREGATE_KEYS = frozenset(
+    PEOPLE + [TAG_TO_SORT.get(k, k) for k in PEOPLE] + (
+    "album albumsort date originaldate genre labelid musicbrainz_albumid "
+    "~people ~peoplesort ~length ~long-length ~tracks ~discs ~rating "
+    "~filesize ~#length ~#tracks ~#discs ~#rating ~#rating:avg ~#added "
+    "~#lastplayed ~#laststarted ~#playcount ~#skipcount ~#year "
+    "~#originalyear ~#filesize ~#mtime ~#bitrate").split())
+
 
 class Collection(object):
     """A collection of songs which implements some methods similar to the
@@ -74,18 +85,18 @@ class Collection(object):
     songs = ()
 
     def __init__(self):
-        """Cache in _cache, LRU key order in _used, keys that return default
-        are in _default"""
-        self.__cache = {}
+        """Values of AGGREGATE_KEYS in _aggregates, others in _cache in LRU
+        order, keys that return default are in _default"""
+        self.__aggregates = {}
+        self.__cache = OrderedDict()
         self.__default = set()
-        self.__used = []
 
     def finalize(self):
         """Finalize the collection.
         Call this after songs get added or removed"""
+        self.__aggregates.clear()
         self.__cache.clear()
         self.__default.clear()
-        self.__used = []
 
     def get(self, key, default=u"", connector=u" - "):
         if not self.songs:
@@ -122,24 +133,33 @@ class Collection(object):
         return [] if v == "" else v.split("\n")
 
     def __get_cached_value(self, key):
-        if key in self.__cache:
-            self.__used.remove(key)
-            self.__used.insert(0, key)
-            return self.__cache[key]
+        if key in self.__aggregates:
+            return self.__aggregates[key]
+        elif key in self.__cache:
+            # move to the end, the most recently used one
+            val = self.__cache.pop(key)
+            self.__cache[key] = val
+            return val
         elif key in self.__default:
             return None
         else:
             val = self.__get_value(key)
-            if val is None:
-                self.__default.add(key)
-            else:
-                self.__used.insert(0, key)
-                self.__cache[key] = val
-            # Remove the oldest if the cache is full
-            if len(self.__used) > self._cache_size:
-                self.__cache.pop(self.__used.pop(-1))
+            self.__set_cached_value(key, val)
         return val
 
+    def __set_cached_value(self, key, val):
+        if val is None:
+            self.__default.add(key)
+        elif key in AGGREGATE_KEYS:
+            self.__aggregates[key] = val
+        else:
+            cache = self.__cache
+            cache.pop(key, None)
+            cache[key] = val
+            # Remove the oldest if the cache is full
+            if len(cache) > self._cache_size:
+                cache.popitem(last=False)
+
     def __get_value(self, key):
         """This is similar to __call__ in the AudioFile class.
         All internal tags are changed to represent a collection of songs.
@@ -210,14 +230,8 @@ class Collection(object):
                 ret = (ret and "\n".join(ret)) or None
 
                 other, values = keys.popitem()
-                other = "~" + other
-                if not values:
-                    self.__default.add(other)
-                else:
-                    if other in self.__used:
-                        self.__used.remove(other)
-                    self.__used.append(other)
-                    self.__cache[other] = "\n".join(values)
+                self.__set_cached_value(
+                    "~" + other, (values and "\n".join(values)) or None)
                 return ret
             elif key == "length":
                 length = self.__get_value("~#length")
@@ -27,6 +27,136 @@ def background_filter():
         pass
 
 
+class IncrementalFilter(object):
+    """Filters albums (or songs) for a browser search entry.
+
+    The matching items get collected in chunks in the main loop and get
+    passed to the view once complete, so large libraries don't block the
+    UI on each keystroke. A new search cancels the running one. If the
+    new query only narrows down the current one, only the items visible
+    at the moment need to be checked.
+    """
+
+    CHUNK_SIZE = 300
+
+    def __init__(self):
+        self.__text = u""
+        self.__bg_text = u""
+        self.__func = None
+        self.__routine = None
+        # only set while the view gets refiltered
+        self.__matches = None
+        self.__checked = None
+
+    @property
+    def active(self):
+        """If the current query filters anything"""
+
+        return self.__func is not None
+
+    def narrows(self, text):
+        """Whether `text` can only match a subset of what the current
+        query matches.
+        """
+
+        bg_text = config.get("browsers", "background").decode('utf-8')
+        return (bg_text == self.__bg_text and
+                Query.is_refinement(self.__text, text))
+
+    def search(self, text, star, get_all, get_visible, callback, sync=False):
+        """Start checking items against the parsable query `text`.
+
+        get_all() should return all items, get_visible() the ones
+        matching the current query; only those get checked if the query
+        gets refined. Once done, match() uses the new query and
+        callback() gets called, the place to refilter the view.
+        If `sync` is True or there are only a few items, this happens
+        right away.
+        """
+
+        self.cancel()
+
+        search = None
+        if not Query.match_all(text):
+            search = Query(text, star=star).search
+        bg = background_filter()
+        bg_text = config.get("browsers", "background").decode('utf-8')
+
+        if search is None:
+            func = bg
+        elif bg is None:
+            func = search
+        else:
+            def func(item):
+                return bg(item) and search(item)
+
+        narrows = self.__func is not None and self.narrows(text)
+
+        def finish(matches, checked):
+            self.__routine = None
+            self.__text = text
+            self.__bg_text = bg_text
+            self.__func = func
+            self.__matches = matches
+            self.__checked = checked
+            try:
+                callback()
+            finally:
+                self.__matches = self.__checked = None
+
+        if func is None:
+            finish(None, None)
+            return
+
+        if narrows:
+            items = list(get_visible())
+            checked = None
+        else:
+            items = list(get_all())
+            checked = set(items)
+
+        if sync or len(items) <= self.CHUNK_SIZE:
+            finish(set(filter(func, items)), checked)
+            return
+
+        def check():
+            matches = set()
+            size = self.CHUNK_SIZE
+            for i in xrange(0, len(items), size):
+                matches.update(filter(func, items[i:i + size]))
+                yield True
+            print_d("%d of %d items match %r" % (
+                len(matches), len(items), text))
+            finish(matches, checked)
+
+        # a new id each time, so a finished one can't remove the next
+        self.__routine = routine = object()
+        copool.add(check, funcid=routine)
+
+    def match(self, item):
+        """If the item matches the current query"""
+
+        if self.__func is None:
+            return True
+
+        matches = self.__matches
+        if matches is not None:
+            if item in matches:
+                return True
+            # refined: everything else was hidden before
+            if self.__checked is None or item in self.__checked:
+                return False
+
+        return self.__func(item)
+
+    def cancel(self):
+        """Stop the running search, the current query stays active"""
+
+        if self.__routine is not None:
+            copool.remove(self.__routine)
+            self.__routine = None
+
+
 def get_scan_dirs():
     dirs = util.split_scan_dirs(config.get("settings", "scan"))
     return [util.fsnative(d) for d in dirs if d]
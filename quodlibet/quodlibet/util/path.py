@@ -11,6 +11,8 @@ import re
 import sys
 import errno
 import tempfile
+import threading
+import time
 import urllib
 from quodlibet.const import FSCODING as fscoding
 from quodlibet.util.string import decode, encode
@@ -168,10 +170,129 @@ def unexpand(filename, HOME=expanduser("~")):
     return filename
 
 
+def parse_mountinfo(data):
+    """Returns the set of mount points listed in the content of
+    /proc/<pid>/mountinfo"""
+
+    mounts = set()
+    for line in data.splitlines():
+        fields = line.split(" ")
+        if len(fields) < 5:
+            continue
+        mounts.add(re.sub(r"\\([0-7]{3})",
+                          lambda m: chr(int(m.group(1), 8)), fields[4]))
+    return mounts
+
+
+class MountPointResolver(object):
+    """Finds mount points, caching the result for each directory.
+
+    On Linux the mount points get read from /proc/self/mountinfo, which
+    gets checked for changes at most every `interval` seconds. Without
+    it, os.path.ismount() results get cached for `interval` seconds.
+
+    Can be used from multiple threads.
+    """
+
+    def __init__(self, interval=1.0, mountinfo="/proc/self/mountinfo"):
+        self._interval = interval
+        self._mountinfo = mountinfo
+        self._lock = threading.Lock()
+        self._checked = None
+        self._data = None
+        # set of mount points or None if there is no mountinfo
+        self._mounts = None
+        # directory -> mount point
+        self._cache = {}
+        # path -> os.path.ismount(path)
+        self._ismount = {}
+
+    def clear(self):
+        """Forget everything, e.g. after a mount/unmount"""
+
+        with self._lock:
+            self._checked = None
+
+    def _refresh(self):
+        with self._lock:
+            now = time.time()
+            if self._checked is not None and \
+                    0 <= now - self._checked < self._interval:
+                return
+            self._checked = now
+
+            try:
+                with open(self._mountinfo, "rb") as h:
+                    data = h.read()
+            except EnvironmentError:
+                data = None
+
+            if data is None or data != self._data:
+                self._data = data
+                if data is None:
+                    self._mounts = None
+                else:
+                    self._mounts = parse_mountinfo(data)
+                self._cache = {}
+                self._ismount = {}
+
+    def _check(self, path):
+        if self._mounts is not None:
+            return path in self._mounts
+        try:
+            return self._ismount[path]
+        except KeyError:
+            result = self._ismount[path] = os.path.ismount(path)
+            return result
+
+    def ismount(self, path):
+        """Like os.path.ismount()"""
+
+        self._refresh()
+        return self._check(os.path.normpath(path))
+
+    def find(self, path):
+        """Returns the mount point path is on"""
+
+        self._refresh()
+        cache = self._cache
+        path = os.path.normpath(path)
+        todo = []
+        while 1:
+            mount = cache.get(path)
+            if mount is not None:
+                break
+            if self._check(path):
+                mount = path
+                break
+            # relative paths end up at the root as well
+            parent = os.path.dirname(path) or os.sep
+            if parent == path:
+                mount = path
+                break
+            todo.append(path)
+            path = parent
+
+        cache[path] = mount
+        for path in todo:
+            cache[path] = mount
+        return mount
+
+
+_mount_points = MountPointResolver()
+
+
 def find_mount_point(path):
-    while not os.path.ismount(path):
-        path = os.path.dirname(path)
-    return path
+    """Returns the mount point path is on"""
+
+    return _mount_points.find(path)
+
+
+def ismount(path):
+    """Cached os.path.ismount(). Mounts and unmounts get noticed
+    after a second."""
+
+    return _mount_points.ismount(path)
 
 
 def pathname2url_win32(path):
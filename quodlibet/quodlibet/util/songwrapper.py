@@ -5,9 +5,7 @@
 # it under the terms of the GNU General Public License version 2 as
 # published by the Free Software Foundation
 
-from quodlibet import util
-from quodlibet import qltk
-from quodlibet.qltk.wlw import WritingWindow
+from quodlibet.qltk.tagwriter import write_songs
 
 
 class SongWrapper(object):
@@ -84,28 +82,18 @@ def ListWrapper(songs):
 
 
 def check_wrapper_changed(library, parent, songs):
-    needs_write = filter(lambda s: s._needs_write, songs)
+    """Save wrapped songs with changed tags in the background and
+    signal changes of the remaining ones.
+    """
 
+    needs_write = [s._song for s in songs if s._needs_write]
     if needs_write:
-        win = WritingWindow(parent, len(needs_write))
-        win.show()
-        for song in needs_write:
-            try:
-                song._song.write()
-            except Exception:
-                qltk.ErrorMessage(
-                    None, _("Unable to edit song"),
-                    _("Saving <b>%s</b> failed. The file "
-                      "may be read-only, corrupted, or you "
-                      "do not have permission to edit it.") %
-                    util.escape(song('~basename'))).run()
-
-            if win.step():
-                break
-        win.destroy()
+        write_songs(parent, library, needs_write)
 
     changed = []
     for song in songs:
+        if song._needs_write:
+            continue
         if song._was_updated():
             changed.append(song._song)
         elif not song.valid() and song.exists():
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+# Copyright 2014 Quod Libet contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as
+# published by the Free Software Foundation
+
+"""A pool of worker threads for blocking jobs (disk or network IO,
+decoding) which shouldn't run in the main loop.
+
+Results are not passed back to the main loop automatically; jobs
+that need to touch the UI or the library have to use GLib.idle_add.
+"""
+
+import Queue
+import itertools
+import threading
+
+from quodlibet.util.dprint import print_d
+
+
+def get_num_workers():
+    """The number of worker threads to use for CPU bound jobs"""
+
+    try:
+        import multiprocessing
+        return multiprocessing.cpu_count()
+    except (ImportError, NotImplementedError):
+        return 2
+
+
+class Job(object):
+    """A queued function call.
+
+    If cancelled before a worker has picked it up, it will never be run.
+    """
+
+    def __init__(self, func, args, kwargs):
+        self._func = func
+        self._args = args
+        self._kwargs = kwargs
+        self._cancelled = False
+        self._done = threading.Event()
+        self.result = None
+        self.exception = None
+
+    @property
+    def cancelled(self):
+        return self._cancelled
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    def cancel(self):
+        self._cancelled = True
+
+    def wait(self, timeout=None):
+        """Block until the job has finished or was skipped.
+        Returns True if it has.
+        """
+
+        self._done.wait(timeout)
+        return self._done.is_set()
+
+    def _run(self):
+        try:
+            if not self._cancelled:
+                try:
+                    self.result = self._func(*self._args, **self._kwargs)
+                except Exception as e:
+                    self.exception = e
+                    raise
+        finally:
+            self._done.set()
+
+
+class ThreadPool(object):
+    """Runs jobs in up to `max_workers` daemon threads.
+
+    Threads get created on demand and stay around waiting for new jobs
+    until stop() is called.
+    """
+
+    def __init__(self, max_workers=None, name="ThreadPool"):
+        if max_workers is None:
+            max_workers = get_num_workers()
+        self.max_workers = max(1, max_workers)
+        self.name = name
+        self._queue = Queue.PriorityQueue()
+        self._counter = itertools.count()
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def add(self, func, *args, **kwargs):
+        """Queue func(*args, **kwargs) for execution in a worker thread.
+
+        Optional Keyword Arguments:
+        priority -- jobs with a lower value get run first (default 0),
+                    jobs with the same priority in the order added
+
+        Returns a Job instance.
+        """
+
+        priority = kwargs.pop("priority", 0)
+        job = Job(func, args, kwargs)
+        self._queue.put((priority, next(self._counter), job))
+
+        with self._lock:
+            if len(self._threads) < self.max_workers:
+                thread = threading.Thread(
+                    target=self._worker, name="%s-%d" % (
+                        self.name, len(self._threads)))
+                thread.daemon = True
+                self._threads.append(thread)
+                thread.start()
+
+        return job
+
+    def _worker(self):
+        while 1:
+            priority, count, job = self._queue.get()
+            try:
+                if job is None:
+                    break
+                job._run()
+            except Exception:
+                from quodlibet import util
+                util.print_exc()
+            finally:
+                self._queue.task_done()
+
+    def wait(self):
+        """Block until all queued jobs are done"""
+
+        self._queue.join()
+
+    def cancel_all(self):
+        """Cancel all jobs which haven't been started yet"""
+
+        while 1:
+            try:
+                priority, count, job = self._queue.get_nowait()
+            except Queue.Empty:
+                break
+            if job is not None:
+                job.cancel()
+                job._done.set()
+            self._queue.task_done()
+
+    def stop(self):
+        """Cancel all pending jobs and wait for the running ones
+        to finish. The pool can be reused afterwards.
+        """
+
+        self.cancel_all()
+        with self._lock:
+            threads = self._threads
+            self._threads = []
+            for thread in threads:
+                # sort after everything else
+                self._queue.put((float("inf"), next(self._counter), None))
+        for thread in threads:
+            thread.join()
+        print_d("Stopped %d worker threads" % len(threads), self.name)
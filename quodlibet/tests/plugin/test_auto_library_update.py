@@ -0,0 +1,101 @@
+import os
+import shutil
+
+from gi.repository import GLib
+
+from tests.plugin import PluginTestCase
+from tests import skipUnless, mkdtemp, DATA_DIR
+from quodlibet.library import SongFileLibrary
+
+PLUGIN_ID = "Automatic library update"
+
+SILENCE = os.path.join(DATA_DIR, "silence-44-s.ogg")
+
+
+class Event(object):
+
+    def __init__(self, path, name, dir=False):
+        self.path = path
+        self.name = name
+        self.dir = dir
+        self.maskname = "TEST"
+
+
+@skipUnless(PLUGIN_ID in PluginTestCase.plugins, "pyinotify missing")
+class TLibraryEvent(PluginTestCase):
+
+    def setUp(self):
+        self.mod = self.modules[PLUGIN_ID]
+        self.dir = mkdtemp()
+        self.library = SongFileLibrary()
+        self.handler = self.mod.LibraryEvent(self.library)
+        self.handler.DELAY = 0
+
+    def tearDown(self):
+        self.handler.destroy()
+        self.library.destroy()
+        shutil.rmtree(self.dir)
+
+    def _copy(self, *names):
+        path = self.dir
+        for name in names[:-1]:
+            path = os.path.join(path, name)
+            if not os.path.isdir(path):
+                os.mkdir(path)
+        path = os.path.join(path, names[-1])
+        shutil.copy(SILENCE, path)
+        return path
+
+    def _process(self):
+        # run the timer, the worker and the result callback
+        context = GLib.MainContext.default()
+        while self.handler._first_event is not None:
+            context.iteration(True)
+        self.handler.wait()
+        while context.pending():
+            context.iteration(False)
+
+    def test_remove_nested(self):
+        self.assertEqual(
+            self.mod._remove_nested(["/a/b", "/a", "/ab", "/a/c/d"]),
+            ["/a", "/ab"])
+
+    def test_add_dir(self):
+        self._copy("album", "1.ogg")
+        self._copy("album", "cd2", "2.ogg")
+        added = []
+        self.library.connect("added", lambda l, s: added.append(s))
+
+        self.handler.process_IN_MOVED_TO(Event(self.dir, "album", True))
+        self.handler.process_IN_MOVED_TO(
+            Event(os.path.join(self.dir, "album"), "1.ogg"))
+        self._process()
+
+        self.assertEqual(len(self.library), 2)
+        # one signal for the whole batch
+        self.assertEqual(len(added), 1)
+
+    def test_remove_dir(self):
+        paths = [self._copy("album", "1.ogg"), self._copy("album", "2.ogg"),
+                 self._copy("other", "3.ogg")]
+        self.library.add([self.library.add_filename(p, False) for p in paths])
+        removed = []
+        self.library.connect("removed", lambda l, s: removed.append(s))
+
+        shutil.rmtree(os.path.join(self.dir, "album"))
+        self.handler.process_IN_DELETE(
+            Event(os.path.join(self.dir, "album"), "1.ogg"))
+        self.handler.process_IN_DELETE(Event(self.dir, "album", True))
+        self._process()
+
+        self.assertEqual(self.library.keys(), [paths[2]])
+        self.assertEqual(len(removed), 1)
+        self.assertEqual(len(removed[0]), 2)
+
+    def test_created_then_deleted(self):
+        path = self._copy("1.ogg")
+        self.handler.process_IN_MOVED_TO(Event(self.dir, "1.ogg"))
+        os.remove(path)
+        self.handler.process_IN_DELETE(Event(self.dir, "1.ogg"))
+        self._process()
+        self.assertEqual(len(self.library), 0)
@@ -0,0 +1,82 @@
+from tests.plugin import PluginTestCase
+
+from quodlibet import config
+from quodlibet.formats._audio import AudioFile
+from quodlibet.library import SongLibrary
+
+
+def song(filename, artist, title):
+    return AudioFile({"~filename": filename, "artist": artist,
+                      "title": title})
+
+
+class TDuplicates(PluginTestCase):
+
+    def setUp(self):
+        config.init()
+        self.mod = self.modules["Duplicates"]
+        self.kind = self.plugins["Duplicates"].cls
+        self.lib = SongLibrary()
+        self.songs = [song("/a", u"Foo", u"Bar"),
+                      song("/b", u"foo", u"bar"),
+                      song("/c", u"Foo", u"Bar"),
+                      song("/d", u"Other", u"Song")]
+        self.lib.add(self.songs)
+        self.kind._Duplicates__index = None
+
+    def tearDown(self):
+        self.lib.destroy()
+        config.quit()
+
+    def test_index(self):
+        index = self.kind.get_index(self.lib)
+        key = index.get_key(self.songs[0])
+        self.failUnlessEqual(
+            index.get_songs(key), set([self.songs[0], self.songs[2]]))
+        self.failUnless(self.kind.get_index(self.lib) is index)
+        index.destroy()
+
+    def test_disabled(self):
+        index = self.kind.get_index(self.lib)
+        key = index.get_key(self.songs[0])
+        plugin = self.plugins["Duplicates"]
+        instance = plugin.get_instance()
+        try:
+            instance.disabled()
+        finally:
+            plugin.instance = None
+            instance.destroy()
+        self.failIf(self.kind._Duplicates__index)
+
+        # not following the library anymore
+        self.lib.add([song("/e", u"Foo", u"Bar")])
+        self.failIf(index.get_songs(key))
+        self.failIf(self.kind.get_index(self.lib) is index)
+        self.kind.get_index(self.lib).destroy()
+
+    def test_settings_rebuild(self):
+        index = self.kind.get_index(self.lib)
+        self.kind.config_set(self.kind._CFG_CASE_INSENSITIVE, True)
+        new_index = self.kind.get_index(self.lib)
+        self.failIf(new_index is index)
+        key = new_index.get_key(self.songs[0])
+        self.failUnlessEqual(len(new_index.get_songs(key)), 3)
+        new_index.destroy()
+
+    def test_live(self):
+        index = self.mod.DuplicateIndex(self.lib, self.kind.get_key_func())
+        other = self.songs[3]
+        key = index.get_key(self.songs[0])
+
+        other["title"] = u"Bar"
+        other["artist"] = u"Foo"
+        self.lib.changed([other])
+        self.failUnless(other in index.get_songs(key))
+
+        self.lib.remove([self.songs[0]])
+        self.failIf(self.songs[0] in index.get_songs(key))
+
+        new = song("/e", u"Foo", u"Bar")
+        self.lib.add([new])
+        self.failUnlessEqual(len(index.get_songs(key)), 3)
+        index.destroy()
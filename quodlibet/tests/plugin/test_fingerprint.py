@@ -4,7 +4,15 @@
 # it under the terms of version 2 of the GNU General Public License as
 # published by the Free Software Foundation.
 
-from gi.repository import Gtk
+import os
+import gzip
+import json
+import shutil
+import StringIO
+import threading
+import BaseHTTPServer
+
+from gi.repository import Gtk, GLib
 
 try:
     from gi.repository import Gst
@@ -16,8 +24,9 @@ else:
         Gst = None
 
 from tests.plugin import PluginTestCase
-from tests import skipUnless
+from tests import skipUnless, mkdtemp
 from quodlibet import config
+from quodlibet.formats._audio import AudioFile
 
 
 @skipUnless(Gst)
@@ -70,6 +79,128 @@ class TAcoustidLookup(PluginTestCase):
         self.mod.AcoustidSearch.PluginPreferences(Gtk.Window())
 
 
+class StubLookupHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    requests = []
+
+    def do_POST(self):
+        data = self.rfile.read(int(self.headers["Content-Length"]))
+        data = gzip.GzipFile(fileobj=StringIO.StringIO(data)).read()
+        self.requests.append(data)
+        body = json.dumps(ACOUSTID_RESPONSE)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@skipUnless(Gst)
+class TAcoustidStubServer(PluginTestCase):
+
+    def setUp(self):
+        config.init()
+        self.mod = self.modules["AcoustidSearch"]
+        self.server = BaseHTTPServer.HTTPServer(
+            ("127.0.0.1", 0), StubLookupHandler)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        del StubLookupHandler.requests[:]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        config.quit()
+
+    def test_lookup(self):
+        url = "http://127.0.0.1:%d/v2/lookup" % self.server.server_port
+        results = []
+        thread = self.mod.acoustid.AcoustidLookupThread(
+            results.append, url=url)
+        song = AudioFile({"~filename": "/dev/null"})
+        fresult = self.mod.analyze.FingerPrintResult(song, "AQAAAA", 272000)
+        thread.put(fresult)
+        context = GLib.MainContext.default()
+        while not results:
+            context.iteration(True)
+        thread.stop()
+
+        self.assertEqual(len(results), 1)
+        self.assertTrue(results[0].song is song)
+        self.assertEqual(len(results[0].releases), 2)
+        request = StubLookupHandler.requests[0]
+        self.assertTrue("fingerprint=AQAAAA" in request)
+        self.assertTrue("duration=272" in request)
+
+
+@skipUnless(Gst)
+class TFingerPrintCache(PluginTestCase):
+
+    def setUp(self):
+        config.init()
+        self.mod = self.modules["AcoustidSearch"]
+        self.dir = mkdtemp()
+        self.filename = os.path.join(self.dir, "song.ogg")
+        with open(self.filename, "wb") as h:
+            h.write("foo")
+        self.song = AudioFile({"~filename": self.filename})
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+        config.quit()
+
+    def test_get_set(self):
+        analyze = self.mod.analyze
+        cache = analyze.FingerPrintCache()
+        self.assertTrue(cache.get(self.song) is None)
+        cache.set(analyze.FingerPrintResult(self.song, "AQAAAA", 1000))
+        result = cache.get(self.song)
+        self.assertEqual(result.chromaprint, "AQAAAA")
+        self.assertEqual(result.length, 1000)
+        self.assertTrue(result.song is self.song)
+
+        os.utime(self.filename, (0, 0))
+        self.assertTrue(cache.get(self.song) is None)
+
+    def test_save_load(self):
+        analyze = self.mod.analyze
+        cache_path = os.path.join(self.dir, "cache")
+        cache = analyze.FingerPrintCache(cache_path)
+        cache.set(analyze.FingerPrintResult(self.song, "AQAAAA", 1000))
+        cache.save()
+
+        new = analyze.FingerPrintCache(cache_path)
+        new.load()
+        self.assertEqual(len(new), 1)
+        self.assertEqual(new.get(self.song).chromaprint, "AQAAAA")
+
+    def test_load_broken(self):
+        cache_path = os.path.join(self.dir, "cache")
+        with open(cache_path, "wb") as h:
+            h.write("garbage")
+        cache = self.mod.analyze.FingerPrintCache(cache_path)
+        cache.load()
+        self.assertEqual(len(cache), 0)
+
+    def test_pool_uses_cache(self):
+        analyze = self.mod.analyze
+        cache = analyze.FingerPrintCache()
+        cache.set(analyze.FingerPrintResult(self.song, "AQAAAA", 1000))
+        pool = analyze.FingerPrintThreadPool(cache=cache)
+        results = []
+        pool.connect("fingerprint-done", lambda p, r: results.append(r))
+        pool.push(self.song)
+        context = GLib.MainContext.default()
+        while not results:
+            context.iteration(True)
+        pool.stop()
+        self.assertEqual(results[0].chromaprint, "AQAAAA")
+
+
 ACOUSTID_RESPONSE = {
 u'status': u'ok', u'results': [{u'recordings': [{u'releases':
 [{u'track_count': 15, u'title': u'Spex CD #15', u'country': u'DE', u'artists':
@@ -12,6 +12,23 @@ from tests.plugin import PluginTestCase
 
 from quodlibet import library
 from quodlibet import app
+from quodlibet.formats._audio import AudioFile
+from quodlibet.util.collection import Album
+
+
+def albums(*names):
+    result = []
+    for name in names:
+        album = None
+        for track in ["2", "1"]:
+            song = AudioFile({"album": name, "title": name + track,
+                              "tracknumber": track, "artist": "artist",
+                              "~filename": "/%s/%s" % (name, track)})
+            album = album or Album(song)
+            album.songs.add(song)
+        album.finalize()
+        result.append(album)
+    return result
 
 
 class TMediaServer(PluginTestCase):
@@ -52,6 +69,12 @@ class TMediaServer(PluginTestCase):
         iface.Get("org.gnome.UPnP.MediaObject2", "DisplayName", **self._args)
         self.failUnless("Quod Libet" in self._wait()[0])
 
+    def test_entry_searchable(self):
+        iface = self._entry_props_iface()
+        iface.Get("org.gnome.UPnP.MediaContainer2", "Searchable",
+                  **self._args)
+        self.failUnless(self._wait()[0])
+
     def test_name_owner(self):
         bus = dbus.SessionBus()
         self.failUnless(
@@ -65,3 +88,111 @@ class TMediaServer(PluginTestCase):
         self.failIf(
             bus.name_has_owner("org.gnome.UPnP.MediaServer2.QuodLibet"))
         del self.m
+
+
+class TAlbumIndex(PluginTestCase):
+
+    def setUp(self):
+        self.mod = self.modules["mediaserver"]
+
+    def test_sorted(self):
+        index = self.mod.AlbumIndex(albums("b", "c", "a"))
+        self.assertEqual(len(index), 3)
+        self.assertEqual([a("album") for a in index], ["a", "b", "c"])
+        self.assertEqual(
+            [a("album") for a in index.get_slice(1, 1)], ["b"])
+        self.assertEqual(
+            [a("album") for a in index.get_slice(1, 0)], ["b", "c"])
+
+    def test_add_remove(self):
+        a, b, c = albums("a", "b", "c")
+        index = self.mod.AlbumIndex([c])
+        index.add([b])
+        index.add([a])
+        self.assertEqual(list(index), [a, b, c])
+        index.remove([b])
+        self.assertEqual(list(index), [a, c])
+
+    def test_ids(self):
+        get_object_id = self.mod.get_object_id
+        album, = albums("a")
+        index = self.mod.AlbumIndex([album])
+        album_id = get_object_id(album.key)
+        self.assertEqual(album_id, get_object_id(albums("a")[0].key))
+        self.assertTrue(album_id.isalnum())
+        self.assertTrue(index.get(album_id) is album)
+        index.remove([album])
+        self.assertTrue(index.get(album_id) is None)
+
+    def test_songs(self):
+        album, = albums("a")
+        index = self.mod.AlbumIndex([album])
+        self.assertEqual(
+            [s("title") for s in index.get_songs(album)], ["a1", "a2"])
+        song = AudioFile({"album": "a", "title": "a0", "tracknumber": "0",
+                          "~filename": "/a/0"})
+        album.songs.add(song)
+        index.changed([album])
+        self.assertEqual(index.get_songs(album)[0], song)
+
+
+class TSearchCriteria(PluginTestCase):
+
+    def setUp(self):
+        self.mod = self.modules["mediaserver"]
+        self.albums = albums("foo", "bar")
+        self.songs = [s for a in self.albums for s in a.songs]
+
+    def search(self, text):
+        album_query, song_query = self.mod.compile_search_criteria(text)
+        result = []
+        if album_query is not None:
+            result.extend(a("album") for a in self.albums
+                          if album_query.search(a))
+        if song_query is not None:
+            result.extend(sorted(s("title") for s in self.songs
+                                 if song_query.search(s)))
+        return result
+
+    def test_parse(self):
+        parse = self.mod.parse_search_criteria
+        self.assertEqual(parse("*"), None)
+        self.assertEqual(
+            parse('a = "x" or b contains "\\"y\\"" and c exists true'),
+            ("or", ("a", "=", "x"),
+             ("and", ("b", "contains", '"y"'), ("c", "exists", True))))
+
+    def test_parse_invalid(self):
+        compile_ = self.mod.compile_search_criteria
+        for text in ['dc:title', '(dc:title = "x"', 'dc:title is "x"',
+                     'dc:title = "x" foo', 'dc:title exists maybe']:
+            self.assertRaises(ValueError, compile_, text)
+
+    def test_all(self):
+        self.assertEqual(len(self.search("*")), 6)
+
+    def test_class(self):
+        self.assertEqual(
+            self.search('upnp:class derivedfrom "object.container"'),
+            ["foo", "bar"])
+        self.assertEqual(
+            len(self.search('upnp:class derivedfrom "object.item" and '
+                            '@refID exists false')), 4)
+        self.assertEqual(
+            self.search('upnp:class = "object.item.videoItem"'), [])
+
+    def test_tags(self):
+        self.assertEqual(self.search('dc:title contains "O"'),
+                         ["foo", "foo1", "foo2"])
+        self.assertEqual(
+            self.search('upnp:class derivedfrom "object.item" and '
+                        '(dc:title = "foo1" or dc:title = "bar2")'),
+            ["bar2", "foo1"])
+        self.assertEqual(
+            self.search('upnp:class derivedfrom "object.item" and '
+                        'upnp:originalTrackNumber >= "2"'),
+            ["bar2", "foo2"])
+        self.assertEqual(
+            self.search('upnp:class derivedfrom "object.item" and '
+                        'dc:title doesNotContain "o"'),
+            ["bar1", "bar2"])
@@ -0,0 +1,195 @@
+import os
+import shutil
+import urlparse
+import threading
+import SocketServer
+import BaseHTTPServer
+import cPickle as pickle
+
+from tests.plugin import PluginTestCase
+from tests import mkdtemp
+from quodlibet.formats._audio import AudioFile
+from quodlibet import config
+
+
+class FakeScrobblerHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Audioscrobbler 1.2 protocol server"""
+
+    protocol_version = "HTTP/1.1"
+
+    submissions = []
+    clients = set()
+
+    def _respond(self, body):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self.clients.add(self.client_address)
+        base = "http://%s:%d" % self.server.server_address
+        self._respond("OK\nSESSION\n%s/np\n%s/submit\n" % (base, base))
+
+    def do_POST(self):
+        self.clients.add(self.client_address)
+        data = self.rfile.read(int(self.headers["Content-Length"]))
+        data = urlparse.parse_qs(data)
+        if self.path == "/submit":
+            self.submissions.append(data)
+        self._respond("OK\n")
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeScrobblerServer(SocketServer.ThreadingMixIn,
+                          BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+def song(i):
+    return AudioFile({"artist": "artist", "title": "title %d" % i,
+                      "~#length": 200, "~filename": "/dev/null"})
+
+
+class TQLSubmitQueue(PluginTestCase):
+
+    def setUp(self):
+        config.init()
+        self.mod = self.modules["QLScrobbler"]
+        self.Queue = Queue = self.mod.QLSubmitQueue
+        self.dir = mkdtemp()
+        self.__orig = (Queue.JOURNAL, Queue.DUMP, Queue.queue)
+        Queue.JOURNAL = os.path.join(self.dir, "journal")
+        Queue.DUMP = os.path.join(self.dir, "dump")
+        self.reset()
+
+        self.server = FakeScrobblerServer(
+            ("127.0.0.1", 0), FakeScrobblerHandler)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        del FakeScrobblerHandler.submissions[:]
+        FakeScrobblerHandler.clients.clear()
+
+        config.set("plugins", "scrobbler_service", "Other...")
+        config.set("plugins", "scrobbler_url",
+                   "http://127.0.0.1:%d" % self.server.server_port)
+        config.set("plugins", "scrobbler_username", "user")
+        config.set("plugins", "scrobbler_password", "pass")
+
+    def reset(self):
+        # forget the in-memory state, like after a restart
+        if self.Queue.journal is not None:
+            self.Queue.journal.wait()
+        self.Queue.queue = []
+        self.Queue.journal = None
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.reset()
+        self.Queue.JOURNAL, self.Queue.DUMP, self.Queue.queue = self.__orig
+        self.Queue.journal = None
+        shutil.rmtree(self.dir)
+        config.quit()
+
+    def test_backoff(self):
+        get_backoff = self.mod.get_backoff
+        self.assertEqual(get_backoff(0, 60, 600), 60)
+        self.assertEqual(get_backoff(1, 60, 600), 60)
+        self.assertEqual(get_backoff(3, 60, 600), 240)
+        self.assertEqual(get_backoff(10, 60, 600), 600)
+
+    def test_journal(self):
+        queue = self.Queue()
+        queue.submit(song(1), 1000)
+        queue.submit(song(2), 2000)
+        self.reset()
+        queue = self.Queue()
+        self.assertEqual([e["t"] for e in queue.queue],
+                         ["title 1", "title 2"])
+        self.assertEqual(queue.queue[1]["i"], "2000")
+
+    def test_journal_broken_line(self):
+        queue = self.Queue()
+        queue.submit(song(1), 1000)
+        queue.journal.wait()
+        with open(self.Queue.JOURNAL, "ab") as h:
+            h.write('{"a": "artist", "t": "tit')
+        self.reset()
+        self.assertEqual(len(self.Queue().queue), 1)
+
+    def test_migrate_dump(self):
+        with open(self.Queue.DUMP, "wb") as h:
+            pickle.dump([{"a": u"artist", "t": u"title", "i": "1"}], h)
+        queue = self.Queue()
+        self.assertEqual(len(queue.queue), 1)
+        self.assertFalse(os.path.exists(self.Queue.DUMP))
+        self.reset()
+        self.assertEqual(len(self.Queue().queue), 1)
+
+    def test_submit(self):
+        queue = self.Queue()
+        for i in range(60):
+            queue.submit(song(i), 1000 + i)
+        queue.changed()
+        self.assertTrue(queue.send_handshake())
+
+        self.assertTrue(queue.send_submission())
+        self.assertEqual(len(queue.queue), 10)
+        self.assertTrue(queue.send_submission())
+        self.assertFalse(queue.queue)
+
+        first, second = FakeScrobblerHandler.submissions
+        self.assertEqual(first["s"], ["SESSION"])
+        self.assertEqual(first["t[0]"], ["title 0"])
+        self.assertTrue("t[49]" in first)
+        self.assertFalse("t[50]" in first)
+        self.assertEqual(second["t[9]"], ["title 59"])
+
+        # all requests used the same connection
+        self.assertEqual(len(FakeScrobblerHandler.clients), 1)
+
+        # nothing left after a restart
+        self.reset()
+        self.assertFalse(self.Queue().queue)
+
+    def test_max_queue(self):
+        queue = self.Queue()
+        queue.MAX_QUEUE = 2
+        for i in range(3):
+            queue.submit(song(i), 1000 + i)
+        self.assertEqual([e["t"] for e in queue.queue],
+                         ["title 1", "title 2"])
+        self.reset()
+        self.assertEqual(len(self.Queue().queue), 2)
+
+    def test_server_down(self):
+        queue = self.Queue()
+        queue.submit(song(1), 1000)
+        queue.changed()
+        self.assertTrue(queue.send_handshake())
+        queue.submit_url = "http://127.0.0.1:1/submit"
+        self.assertFalse(queue.send_submission())
+        self.assertEqual(len(queue.queue), 1)
+
+    def test_plugin_disabled(self):
+        # keep the scrobbles queued
+        config.set("plugins", "scrobbler_offline", "true")
+        plugin = self.mod.QLScrobbler()
+        plugin.enabled()
+        thread = plugin._QLScrobbler__thread
+        plugin.disabled()
+        thread.join(10)
+        self.assertFalse(thread.is_alive())
+
+        # enabling again starts a new queue
+        plugin.enabled()
+        self.assertTrue(plugin._QLScrobbler__thread.is_alive())
+        plugin.queue.submit(song(1), 1000)
+        plugin.disabled()
+        self.reset()
+        self.assertEqual(len(self.Queue().queue), 1)
@@ -1,5 +1,11 @@
+from gi.repository import Gtk
+
+from quodlibet import app
+from quodlibet import config
 from quodlibet.util.collection import Album
 from quodlibet.formats._audio import AudioFile
+from quodlibet.library import SongLibrary
+from quodlibet.player.nullbe import NullPlayer
 from tests.plugin import PluginTestCase
 from quodlibet.util.dprint import print_d
 
@@ -36,15 +42,40 @@ for song in [A1S1, A1S2, A2S1, A2S2, A3S1, A3S2, A3S3]:
     song["length"] = 100
 
 
+class FakeBrowser(object):
+    albums = None
+
+    def can_filter(self, key):
+        return key == "album"
+
+    def can_filter_albums(self):
+        return True
+
+    def list_albums(self):
+        return app.library.albums.keys()
+
+    def filter_albums(self, keys):
+        self.albums = keys
+
+
+class FakeWindow(object):
+    def __init__(self):
+        self.browser = FakeBrowser()
+
+
 class TRandomAlbum(PluginTestCase):
     """Some basic tests for the random album plugin algorithm"""
     WEIGHTS = {'rating': 0, 'added': 0, 'laststarted': 0, 'lastplayed': 0,
                'length': 0, 'skipcount': 0, 'playcount': 0}
 
     def setUp(self):
+        config.init()
         self.plugin = self.plugins["Random Album Playback"].cls()
         self.albums = [A1, A2, A3]
 
+    def tearDown(self):
+        config.quit()
+
     def get_winner(self, albums):
         print_d("Weights: %s " % self.plugin.weights)
         scores = self.plugin._score(albums)
@@ -86,3 +117,62 @@ class TRandomAlbum(PluginTestCase):
         weights['length'] = 0.5
         # A1 is #1 for Rating, #2 for lastplayed, #2 or 3 length
         self.failUnlessEqual(A1, self.get_winner(self.albums))
+
+    def test_score_many(self):
+        weights = self.plugin.weights = self.WEIGHTS.copy()
+        weights['rating'] = 1
+        weights['lastplayed'] = -0.5
+        albums = []
+        for i in range(200):
+            song = AudioFile({'album': 'album %d' % i, 'title': 'title',
+                              '~#lastplayed': (i * 7) % 13,
+                              '~#rating': ((i * 3) % 11) / 10.0})
+            album = Album(song)
+            album.songs = set([song])
+            albums.append(album)
+
+        # the old quadratic version
+        expected = {}
+        for tag in ['rating', 'lastplayed']:
+            ranked = sorted(albums, key=lambda al: al.get("~#%s" % tag))
+            for album in albums:
+                expected[album] = expected.get(album, 0) + \
+                    ranked.index(album) * weights[tag]
+
+        self.failUnlessEqual(sorted(self.plugin._score(albums)),
+                             sorted((s, a) for a, s in expected.items()))
+
+    def test_cache_invalidation(self):
+        library = SongLibrary()
+        song = AudioFile({'~filename': '/dev/null', 'album': 'changing',
+                          '~#rating': 0.0})
+        other = AudioFile({'~filename': '/dev/zero', 'album': 'other',
+                           '~#rating': 0.5})
+        library.add([song, other])
+        old = app.library, app.player, app.window
+        app.library = library
+        app.player = NullPlayer()
+        app.player.paused = False
+        app.window = FakeWindow()
+
+        plugin = self.plugin
+        plugin.weights = self.WEIGHTS.copy()
+        plugin.weights['rating'] = 1
+        plugin.use_weights = True
+        plugin.delay = 0
+        try:
+            # the album library gets built on first use
+            self.failIf("albums" in library.__dict__)
+            plugin.plugin_on_song_started(None)
+            self.failUnlessEqual(app.window.browser.albums, [other.album_key])
+
+            song['~#rating'] = 1.0
+            library.changed([song])
+            plugin.plugin_on_song_started(None)
+            self.failUnlessEqual(app.window.browser.albums, [song.album_key])
+        finally:
+            plugin.disabled()
+            while Gtk.events_pending():
+                Gtk.main_iteration()
+            app.library, app.player, app.window = old
+            library.destroy()
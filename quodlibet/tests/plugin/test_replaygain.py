@@ -0,0 +1,116 @@
+import os
+import math
+import shutil
+import struct
+import wave
+
+from gi.repository import GLib
+
+try:
+    from gi.repository import Gst
+    Gst
+except ImportError:
+    Gst = None
+else:
+    if not Gst.ElementFactory.find("rganalysis"):
+        Gst = None
+
+from tests.plugin import PluginTestCase
+from tests import skipUnless, mkdtemp
+from quodlibet import config
+from quodlibet.formats.wav import WAVEFile
+
+
+def write_sine(filename, seconds=1, freq=440, volume=0.5, rate=44100):
+    w = wave.open(filename, "wb")
+    w.setnchannels(1)
+    w.setsampwidth(2)
+    w.setframerate(rate)
+    frames = []
+    for i in xrange(rate * seconds):
+        value = volume * math.sin(2 * math.pi * freq * i / rate)
+        frames.append(struct.pack("<h", int(value * 32767)))
+    w.writeframes("".join(frames))
+    w.close()
+
+
+@skipUnless(Gst, "rganalysis not found")
+class TReplayGainScanner(PluginTestCase):
+
+    def setUp(self):
+        config.init()
+        self.mod = self.modules["ReplayGain"]
+        self.dir = mkdtemp()
+        self.songs = []
+        for i, volume in enumerate([0.2, 0.8]):
+            filename = os.path.join(self.dir, "%d.wav" % i)
+            write_sine(filename, volume=volume)
+            song = WAVEFile(filename)
+            song["album"] = u"album"
+            self.songs.append(song)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+        config.quit()
+
+    def _scan(self, cache):
+        scanner = self.mod.RGLibraryScanner(cache, num_pipes=2)
+        albums = []
+        scanner.connect("album-done", lambda s, a: albums.append(a))
+        scanner.add_songs(self.songs)
+        context = GLib.MainContext.default()
+        while scanner.active:
+            context.iteration(True)
+        scanner.destroy()
+        return albums
+
+    def test_scan(self):
+        cache = self.mod.RGCache()
+        albums = self._scan(cache)
+        self.failUnlessEqual(len(albums), 1)
+        album = albums[0]
+        self.failIf(album.error)
+        self.failUnless(album.gain is not None)
+        quiet, loud = sorted(album.songs, key=lambda s: s.filename)
+        self.failUnless(quiet.gain > loud.gain)
+        self.failUnlessEqual(len(cache), 2)
+
+    def test_cached(self):
+        cache = self.mod.RGCache()
+        first = self._scan(cache)[0]
+        second = self._scan(cache)[0]
+        self.failUnlessEqual(first.gain, second.gain)
+        self.failUnlessEqual(
+            sorted(s.gain for s in first.songs),
+            sorted(s.gain for s in second.songs))
+
+    def test_persist(self):
+        filename = os.path.join(self.dir, "cache")
+        cache = self.mod.RGCache(filename)
+        self._scan(cache)
+        cache.save()
+        new = self.mod.RGCache(filename)
+        new.load()
+        self.failUnlessEqual(len(new), 2)
+        self.failUnless(new.get(self.songs[0]))
+
+        os.utime(self.songs[0]("~filename"), (0, 0))
+        self.failIf(new.get(self.songs[0]))
+
+    def test_needs_analysis(self):
+        cache = self.mod.RGCache()
+        needs_analysis = self.mod.RGLibraryScanner.needs_analysis
+        song = self.songs[0]
+        self.failUnless(needs_analysis(song, cache))
+        song["replaygain_track_gain"] = u"1.0 dB"
+        song["replaygain_album_gain"] = u"1.0 dB"
+        self.failIf(needs_analysis(song, cache))
+
+    def test_prioritize(self):
+        scanner = self.mod.RGLibraryScanner(self.mod.RGCache(), num_pipes=0)
+        other = self.songs[1]
+        other["album"] = u"other"
+        scanner.add_songs(self.songs)
+        scanner.prioritize(other)
+        self.failUnless(scanner._todo[0][1] == [other])
+        scanner.destroy()
@@ -1,6 +1,14 @@
-from tests import TestCase
+import os
+import time
+import threading
+import BaseHTTPServer
 
-from quodlibet.browsers.audiofeeds import AudioFeeds
+from gi.repository import GLib
+
+from tests import TestCase, skipUnless
+
+from quodlibet.browsers import audiofeeds
+from quodlibet.browsers.audiofeeds import AudioFeeds, Feed, FeedRefresher
 from quodlibet.player.nullbe import NullPlayer
 from quodlibet.library import SongLibrary
 import quodlibet.config
@@ -16,7 +24,134 @@ class TAudioFeeds(TestCase):
         for key in ["foo", "title", "fake~key", "~woobar", "~#huh"]:
             self.failIf(self.bar.can_filter(key))
 
+    def test_write_unchanged(self):
+        feeds = AudioFeeds._AudioFeeds__feeds
+        feeds.append(row=[Feed("http://example.com/feed.xml")])
+        try:
+            AudioFeeds.write()
+            self.assertTrue(os.path.exists(audiofeeds.FEEDS))
+            os.remove(audiofeeds.FEEDS)
+            # nothing changed, nothing written
+            AudioFeeds.write()
+            self.assertFalse(os.path.exists(audiofeeds.FEEDS))
+            feeds[0][0].failed()
+            AudioFeeds.write()
+            self.assertTrue(os.path.exists(audiofeeds.FEEDS))
+        finally:
+            feeds.clear()
+
     def tearDown(self):
         self.bar.destroy()
         self.library.destroy()
         quodlibet.config.quit()
+
+
+FEED = """\
+<?xml version="1.0" encoding="UTF-8"?>
+<rss version="2.0">
+<channel>
+<title>Some Podcast</title>
+<link>http://example.com/</link>
+<item>
+<title>Episode 1</title>
+<enclosure url="http://example.com/1.mp3" length="1000" type="audio/mpeg"/>
+</item>
+<item>
+<title>Episode 2</title>
+<enclosure url="http://example.com/2.ogg" length="2000" type="audio/ogg"/>
+</item>
+</channel>
+</rss>
+"""
+
+
+class FeedHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    etag = '"v1"'
+    requests = []
+
+    def do_GET(self):
+        self.requests.append(self.path)
+        if self.path != "/feed.xml":
+            self.send_error(404)
+            return
+        if self.headers.get("If-None-Match") == self.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/rss+xml")
+        self.send_header("ETag", self.etag)
+        self.send_header("Content-Length", str(len(FEED)))
+        self.end_headers()
+        self.wfile.write(FEED)
+
+    def log_message(self, *args):
+        pass
+
+
+@skipUnless(getattr(audiofeeds, "feedparser", None), "feedparser missing")
+class TFeed(TestCase):
+
+    def setUp(self):
+        self.server = BaseHTTPServer.HTTPServer(
+            ("127.0.0.1", 0), FeedHandler)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.base = "http://127.0.0.1:%d/" % self.server.server_port
+        del FeedHandler.requests[:]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_parse(self):
+        feed = Feed(self.base + "feed.xml")
+        self.assertTrue(feed.parse())
+        self.assertEqual(feed.name, "Some Podcast")
+        self.assertEqual([s("~uri") for s in feed],
+                         ["http://example.com/1.mp3",
+                          "http://example.com/2.ogg"])
+        self.assertEqual(feed.etag, FeedHandler.etag)
+
+        # second time only a conditional request
+        self.assertFalse(feed.parse())
+        self.assertEqual(len(feed), 2)
+        self.assertEqual(len(FeedHandler.requests), 2)
+        self.assertEqual(feed.failures, 0)
+
+    def test_backoff(self):
+        feed = Feed(self.base + "missing.xml")
+        self.assertTrue(feed.is_due(60))
+        self.assertFalse(feed.parse())
+        self.assertEqual(feed.failures, 1)
+        self.assertFalse(feed.is_due(60))
+        feed.last_check = time.time() - 61
+        self.assertFalse(feed.is_due(60))
+        feed.last_check = time.time() - 121
+        self.assertTrue(feed.is_due(60))
+
+    def test_refresher(self):
+        feeds = [Feed(self.base + "feed.xml"), Feed(self.base + "missing.xml")]
+        refresher = FeedRefresher(max_workers=2)
+        results = []
+        refresher.refresh(feeds, lambda *args: results.append(args))
+        refresher.wait()
+        context = GLib.MainContext.default()
+        while not results:
+            context.iteration(True)
+
+        changed, updated = results[0]
+        self.assertEqual(changed, [feeds[0]])
+        self.assertEqual(updated, [feeds[0]])
+        self.assertEqual(len(feeds[0]), 2)
+        self.assertEqual(feeds[1].failures, 1)
+
+    def test_refresher_empty(self):
+        results = []
+        FeedRefresher().refresh([], lambda *args: results.append(args))
+        context = GLib.MainContext.default()
+        while not results:
+            context.iteration(True)
+        self.assertEqual(results, [([], [])])
@@ -4,6 +4,8 @@
 # it under the terms of the GNU General Public License version 2 as
 # published by the Free Software Foundation
 
+from gi.repository import Gtk
+
 from tests import TestCase
 
 from quodlibet import config
@@ -11,6 +13,7 @@ from quodlibet import config
 from quodlibet.browsers.collection import *
 from quodlibet.formats._audio import AudioFile
 from quodlibet.library import SongLibrary
+from quodlibet.library.libraries import AlbumLibrary
 
 SONGS = [
     AudioFile({"album": "one", "artist": "piman", "~filename": "/dev/null"}),
@@ -77,6 +80,89 @@ class TCollectionAlbums(TestCase):
         model.remove_albums(self.albums)
         self.failUnlessEqual(len(model), 0)
 
+    def test_model_index(self):
+        model = CollectionTreeStore()
+        model.set_albums([("~people", 0)], self.albums)
+        two = [a for a in self.albums.values() if a.title == "two"][0]
+
+        # under "mu" and "boris"
+        paths = model.get_paths_for_album(two)
+        self.failUnlessEqual(len(paths), 2)
+        for path in paths:
+            self.failUnless(model[path][0] is two)
+
+        model.change_albums([two])
+        self.failUnlessEqual(len(model.get_paths_for_album(two)), 2)
+
+        # the empty "mu" node gets removed as well
+        model.remove_albums([two])
+        self.failIf(model.get_paths_for_album(two))
+        self.failIf(model.get_path_for_album(two))
+        self.failUnlessEqual(len(model), 3)
+
+        model.add_albums([two])
+        self.failUnlessEqual(len(model), 4)
+        self.failUnlessEqual(len(model.get_paths_for_album(two)), 2)
+
+    def _check_index(self, model, albums):
+        # compare the index with the rows of the tree store
+        rows = {}
+
+        def walk(iter_):
+            child = model.iter_children(iter_)
+            while child:
+                obj = model[child][0]
+                if isinstance(obj, Album):
+                    path = model.get_path(child).get_indices()
+                    rows.setdefault(obj, []).append(tuple(path))
+                walk(child)
+                child = model.iter_next(child)
+        walk(None)
+
+        for album in albums:
+            paths = model.get_paths_for_album(album)
+            paths = sorted(tuple(p.get_indices()) for p in paths)
+            self.failUnlessEqual(paths, sorted(rows.get(album, [])))
+
+    def test_model_index_rows(self):
+        songs = [AudioFile({"album": "a%d" % i, "artist": "x%d" % (i % 3),
+                            "~filename": "/dev/%d" % i}) for i in range(12)]
+        library = SongLibrary()
+        library.add(songs)
+        library.albums.load()
+        albums = library.albums.values()
+        tags = [("artist", 0), ("album", 0)]
+
+        model = CollectionTreeStore()
+        model.set_albums(tags, albums)
+        self._check_index(model, albums)
+
+        # removing rows shifts the paths of the following siblings
+        first = sorted(albums, key=lambda a: a.title)[:4]
+        model.remove_albums(first)
+        self._check_index(model, albums)
+        model.add_albums(first)
+        self._check_index(model, albums)
+
+        # moving an album into a new node and back
+        song = songs[0]
+        album = library.albums[song.album_key]
+        song["artist"] = "aaa"
+        album.finalize()
+        model.change_albums([album])
+        self.failUnless("aaa" in [r[0] for r in model])
+        self._check_index(model, albums)
+        song["artist"] = "x0"
+        album.finalize()
+        model.change_albums([album])
+        self._check_index(model, albums)
+        self.failUnlessEqual(len(model), 3)
+
+        model.remove_albums(albums)
+        self.failUnlessEqual(len(model), 0)
+        self._check_index(model, albums)
+        library.destroy()
+
     def test_utils(self):
         model = CollectionTreeStore()
         model.set_albums([("~people", 0)], self.albums)
@@ -111,3 +197,26 @@ class TCollectionBrowser(TestCase):
         library = SongLibrary()
         x = CollectionBrowser(library, False)
         x.destroy()
+
+    def test_restore_lazy(self):
+        library = SongLibrary()
+        library.add(SONGS)
+        library.albums = AlbumLibrary(library, lazy=True)
+        config.set("browsers", "collection", "1")
+        x = CollectionBrowser(library, False)
+        try:
+            x.restore()
+            # nothing to select yet, keep the saved selection
+            x.save()
+            self.assertEqual(config.get("browsers", "collection"), "1")
+
+            while Gtk.events_pending():
+                Gtk.main_iteration()
+            self.assertFalse(library.albums.loading)
+            model, paths = x.view.get_selection().get_selected_rows()
+            self.assertEqual(map(tuple, paths), [(1,)])
+            x.save()
+            self.assertEqual(config.get("browsers", "collection"), "1")
+        finally:
+            x.destroy()
+            library.albums.destroy()
@@ -1,6 +1,10 @@
-from tests import TestCase
+import os
+import shutil
+from collections import OrderedDict
 
-from quodlibet.browsers.filesystem import FileSystem
+from tests import TestCase, mkdtemp, DATA_DIR
+
+from quodlibet.browsers.filesystem import FileSystem, list_songs
 from quodlibet.player.nullbe import NullPlayer
 from quodlibet.library import SongLibrary
 import quodlibet.config
@@ -19,3 +23,48 @@ class TFileSystem(TestCase):
     def tearDown(self):
         self.bar.destroy()
         quodlibet.config.quit()
+
+
+class Tlist_songs(TestCase):
+
+    def setUp(self):
+        self.dir = mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def _touch(self, name):
+        path = os.path.join(self.dir, name)
+        shutil.copy(os.path.join(DATA_DIR, "silence-44-s.ogg"), path)
+        return path
+
+    def test_cache(self):
+        path = self._touch("a.ogg")
+        open(os.path.join(self.dir, "b.txt"), "wb").close()
+        cache = {}
+        files = list_songs(self.dir, cache)
+        self.assertEqual(len(files), 1)
+        self.assertEqual(os.path.basename(files[0]), "a.ogg")
+        self.assertTrue(list_songs(self.dir, cache) is files)
+
+        self._touch("c.ogg")
+        mtime = os.path.getmtime(path)
+        os.utime(self.dir, (mtime + 10, mtime + 10))
+        self.assertEqual(len(list_songs(self.dir, cache)), 2)
+
+    def test_cache_size(self):
+        for name in "abc":
+            os.mkdir(os.path.join(self.dir, name))
+        dirs = [os.path.join(self.dir, name) for name in "abc"]
+        cache = OrderedDict()
+        files = list_songs(dirs[0], cache, max_size=2)
+        list_songs(dirs[1], cache, max_size=2)
+        # recently used entries stay
+        self.assertTrue(list_songs(dirs[0], cache, max_size=2) is files)
+        list_songs(dirs[2], cache, max_size=2)
+        self.assertEqual(len(cache), 2)
+        self.assertTrue(list_songs(dirs[0], cache, max_size=2) is files)
+
+    def test_missing(self):
+        self.assertRaises(
+            OSError, list_songs, os.path.join(self.dir, "nope"), {})
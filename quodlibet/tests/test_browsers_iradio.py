@@ -1,10 +1,18 @@
-from tests import TestCase
+import os
+import bz2
+import shutil
+import threading
+import BaseHTTPServer
+
+from tests import TestCase, mkdtemp
 
 from gi.repository import Gtk
 
 from quodlibet.library import SongLibrary
 from quodlibet.formats._audio import AudioFile
 from quodlibet.browsers.iradio import InternetRadio, IRFile, QuestionBar
+from quodlibet.browsers.iradio import parse_taglist, fetch_taglist, \
+    NotModified, load_validators, save_validators
 from quodlibet.player.nullbe import NullPlayer
 import quodlibet.config
 
@@ -93,3 +101,119 @@ class TIRFile(TestCase):
         new.from_dump(dump)
         self.assertTrue("title" not in new)
         self.assertTrue("artist" not in new)
+
+
+TAGLIST = """\
+uri=http://foo.bar/1
+title=Foo
+genre=Rock
+genre=Pop
+genre=Jazz
+bitrate=128000
+~listenerpeak=42
+broken line
+uri=http://foo.bar/2
+organization=Bar
+genre=Rock
+"""
+
+
+class TParseTaglist(TestCase):
+
+    def test_string(self):
+        stations = parse_taglist(TAGLIST)
+        self.assertEqual(len(stations), 2)
+        first, second = stations
+        self.assertEqual(first.key, "http://foo.bar/1")
+        self.assertEqual(first("title"), "Foo")
+        # repeated tags don't get merged, the last one wins
+        self.assertEqual(first.list("genre"), ["Jazz"])
+        self.assertEqual(first("~#bitrate"), 128)
+        self.assertEqual(first("~#listenerpeak"), 42)
+        self.assertEqual(second.key, "http://foo.bar/2")
+        self.assertEqual(second.list("genre"), ["Rock"])
+
+    def test_lines(self):
+        stations = parse_taglist(iter(TAGLIST.splitlines()))
+        self.assertEqual([s.key for s in stations],
+                         [s.key for s in parse_taglist(TAGLIST)])
+
+    def test_empty(self):
+        self.assertEqual(parse_taglist(""), [])
+        self.assertEqual(parse_taglist("title=foo\n"), [])
+
+
+class TaglistHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    data = bz2.compress(TAGLIST)
+    etag = '"v1"'
+    requests = []
+
+    def do_GET(self):
+        self.requests.append(self.path)
+        if not self.path.endswith(".bz2"):
+            self.send_error(404)
+            return
+        if self.headers.get("If-None-Match") == self.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("ETag", self.etag)
+        self.send_header("Content-Length", str(len(self.data)))
+        self.end_headers()
+        self.wfile.write(self.data)
+
+    def log_message(self, *args):
+        pass
+
+
+class TFetchTaglist(TestCase):
+
+    def setUp(self):
+        self.server = BaseHTTPServer.HTTPServer(
+            ("127.0.0.1", 0), TaglistHandler)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.url = "http://127.0.0.1:%d/radiolist.bz2" % \
+            self.server.server_port
+        del TaglistHandler.requests[:]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_fetch(self):
+        progress = []
+        stations, etag, modified = fetch_taglist(
+            self.url, progress=progress.append)
+        self.assertEqual(len(stations), 2)
+        self.assertEqual(etag, TaglistHandler.etag)
+        self.assertTrue(modified is None)
+        self.assertEqual(progress[-1], 1.0)
+
+    def test_not_modified(self):
+        stations, etag, modified = fetch_taglist(self.url)
+        self.assertRaises(NotModified, fetch_taglist, self.url, etag)
+        self.assertEqual(len(fetch_taglist(self.url, '"v0"')[0]), 2)
+        self.assertEqual(len(TaglistHandler.requests), 3)
+
+    def test_not_found(self):
+        self.assertRaises(EnvironmentError, fetch_taglist, self.url + ".x")
+
+
+class TValidators(TestCase):
+
+    def setUp(self):
+        self.dir = mkdtemp()
+        self.filename = os.path.join(self.dir, "info")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_save_load(self):
+        self.assertEqual(load_validators(self.filename), (None, None))
+        save_validators(self.filename, '"v1"', "Sat, 01 Feb 2014 00:00:00")
+        self.assertEqual(load_validators(self.filename),
+                         ('"v1"', "Sat, 01 Feb 2014 00:00:00"))
@@ -0,0 +1,137 @@
+import os
+import shutil
+
+from tests import TestCase, mkdtemp, DATA_DIR
+
+from quodlibet import config
+from quodlibet.devices._sync import DeviceSync
+from quodlibet.formats import MusicFile
+from quodlibet.library import SongFileLibrary
+
+
+class TDeviceSync(TestCase):
+
+    def setUp(self):
+        config.init()
+        self.source = mkdtemp()
+        self.device = mkdtemp()
+        self.songs = []
+        for name in ["a/1.ogg", "a/2.ogg", "b/3.ogg"]:
+            path = os.path.join(self.source, name)
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            shutil.copy(os.path.join(DATA_DIR, "silence-44-s.ogg"), path)
+            self.songs.append(MusicFile(path))
+        self.library = SongFileLibrary()
+        self.covers = []
+
+    def tearDown(self):
+        self.library.destroy()
+        shutil.rmtree(self.source)
+        shutil.rmtree(self.device)
+        config.quit()
+
+    def _get_target(self, song):
+        name = os.path.relpath(song["~filename"], self.source)
+        return os.path.join(self.device, name)
+
+    def _sync(self, **kwargs):
+        return DeviceSync(self.library, self._get_target, **kwargs)
+
+    def _write_cover(self, song, dirname):
+        self.covers.append(dirname)
+
+    def test_copy(self):
+        sync = self._sync(write_cover=self._write_cover)
+        items = sync.diff(self.songs)
+        self.assertEqual(len(items), 3)
+        self.assertEqual(sync.get_size(items),
+                         sum(s("~#filesize") for s in self.songs))
+
+        results = sync.copy(items)
+        self.assertEqual(len(results), 3)
+        self.assertEqual(len(self.library), 3)
+        for song, copy in results:
+            self.assertEqual(copy["~filename"], self._get_target(song))
+            self.assertTrue(os.path.exists(copy["~filename"]))
+            self.assertTrue(copy in self.library)
+            self.assertEqual(copy("title"), song("title"))
+
+        # one cover per album directory
+        self.assertEqual(sorted(self.covers), [
+            os.path.join(self.device, "a"), os.path.join(self.device, "b")])
+
+    def test_resync(self):
+        sync = self._sync()
+        sync.copy(sync.diff(self.songs))
+        self.assertFalse(sync.diff(self.songs))
+
+        # newer source file
+        song = self.songs[1]
+        song["~#mtime"] = os.path.getmtime(self._get_target(song)) + 10
+        items = sync.diff(self.songs)
+        self.assertEqual(items, [(song, self._get_target(song))])
+
+        results = sync.copy(items)
+        self.assertEqual(len(results), 1)
+        self.assertEqual(len(self.library), 3)
+
+    def test_progress(self):
+        calls = []
+
+        def progress(song, done, total):
+            if song is not None:
+                calls.append((done, total))
+
+        sync = self._sync()
+        sync.copy(sync.diff(self.songs), progress)
+        self.assertEqual(calls, [(1, 3), (2, 3), (3, 3)])
+
+    def test_cancel(self):
+        sync = self._sync()
+        items = sync.diff(self.songs)
+        sync.cancel()
+        self.assertFalse(sync.copy(items))
+        self.assertFalse(os.listdir(self.device))
+        self.assertFalse(len(self.library))
+
+    def test_error(self):
+        blocker = os.path.join(self.device, "a")
+        open(blocker, "wb").close()
+
+        sync = self._sync()
+        results = dict(sync.copy(sync.diff(self.songs)))
+        self.assertTrue(isinstance(results[self.songs[0]], unicode))
+        self.assertTrue(isinstance(results[self.songs[1]], unicode))
+        self.assertFalse(isinstance(results[self.songs[2]], unicode))
+        self.assertEqual(len(self.library), 1)
+
+    def test_transcode(self):
+        source = self.songs[0]["~filename"]
+
+        class FakeTranscoder(object):
+            def needs_transcode(self, song):
+                return song["~filename"] == source
+
+            def get_target(self, target):
+                return target[:-len(".ogg")] + "-t.ogg"
+
+            def transcode(self, song):
+                return song["~filename"]
+
+        sync = self._sync(transcoder=FakeTranscoder())
+        items = sync.diff(self.songs)
+        targets = sorted(t for s, t in items)
+        self.assertEqual(targets, [
+            os.path.join(self.device, "a", "1-t.ogg"),
+            os.path.join(self.device, "a", "2.ogg"),
+            os.path.join(self.device, "b", "3.ogg")])
+
+        results = dict(sync.copy(items))
+        copy = results[self.songs[0]]
+        self.assertEqual(copy["~filename"], targets[0])
+        self.assertEqual(copy("title"), self.songs[0]("title"))
+
+        # transcoded files only get compared by mtime
+        copy["~#filesize"] = 0
+        self.assertFalse(sync.diff(self.songs))
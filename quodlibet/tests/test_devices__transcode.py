@@ -0,0 +1,139 @@
+import os
+import time
+import wave
+import shutil
+
+try:
+    from gi.repository import Gst
+except ImportError:
+    Gst = None
+
+from tests import TestCase, mkdtemp, skipUnless, DATA_DIR
+
+from quodlibet import config
+from quodlibet.devices._transcode import Transcoder, TranscodeError
+from quodlibet.formats._audio import AudioFile
+from quodlibet.formats import MusicFile
+
+
+def write_wav(path, seconds=0.5):
+    h = wave.open(path, "wb")
+    h.setnchannels(2)
+    h.setsampwidth(2)
+    h.setframerate(44100)
+    h.writeframes("\x00" * (4 * int(44100 * seconds)))
+    h.close()
+
+
+def has_encoder(name):
+    return bool(Gst and Gst.ElementFactory.find(name))
+
+
+class TTranscoder(TestCase):
+
+    def setUp(self):
+        config.init()
+        self.dir = mkdtemp()
+        self.cache = os.path.join(self.dir, "cache")
+        self.transcoder = Transcoder("flac", "wav", cache=self.cache)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+        config.quit()
+
+    def test_needs_transcode(self):
+        needs = self.transcoder.needs_transcode
+        self.assertTrue(needs(AudioFile({"~filename": "/a/b.WAV"})))
+        self.assertFalse(needs(AudioFile({"~filename": "/a/b.flac"})))
+        self.assertFalse(needs(AudioFile({"~filename": "/a/b.ogg"})))
+
+        # never transcode to the same format
+        transcoder = Transcoder("flac", "flac wav", cache=self.cache)
+        self.assertFalse(
+            transcoder.needs_transcode(AudioFile({"~filename": "/a/b.flac"})))
+
+    def test_get_target(self):
+        self.assertEqual(self.transcoder.get_target("/dev/a/b.wav"),
+                         "/dev/a/b.flac")
+
+    def test_cache_path(self):
+        a = os.path.join(self.dir, "a.wav")
+        b = os.path.join(self.dir, "b.wav")
+        write_wav(a)
+        shutil.copy(a, b)
+        path = self.transcoder.get_cache_path
+        song_a = AudioFile({"~filename": a})
+        song_b = AudioFile({"~filename": b})
+
+        # same content, same cache entry
+        self.assertEqual(path(song_a), path(song_b))
+        self.assertTrue(path(song_a).endswith(".flac"))
+
+        # different encoder, different cache entry
+        other = Transcoder("ogg", "wav", cache=self.cache)
+        self.assertNotEqual(path(song_a), other.get_cache_path(song_a))
+
+        write_wav(b, seconds=0.6)
+        self.assertNotEqual(path(song_a), path(song_b))
+
+    def test_clean(self):
+        os.makedirs(self.cache)
+        now = time.time()
+        for i in range(4):
+            name = os.path.join(self.cache, str(i))
+            with open(name, "wb") as h:
+                h.write("x" * 10)
+            os.utime(name, (now + i, now + i))
+
+        self.transcoder.clean(25)
+        self.assertEqual(sorted(os.listdir(self.cache)), ["2", "3"])
+
+    def test_transcode_error(self):
+        path = os.path.join(self.dir, "a.wav")
+        with open(path, "wb") as h:
+            h.write("not a wav file")
+        song = AudioFile({"~filename": path})
+
+        self.assertRaises(TranscodeError, self.transcoder.transcode, song)
+        # no temporary files left behind
+        self.assertFalse(os.listdir(self.cache))
+
+    def test_copy_tags(self):
+        path = os.path.join(self.dir, "a.wav")
+        write_wav(path)
+        song = AudioFile({"~filename": path, "title": u"Title",
+                          "artist": u"Artist"})
+
+        os.makedirs(self.cache)
+        cache_path = self.transcoder.get_cache_path(song)
+        temp = self.transcoder._get_temp_path(cache_path)
+        self.assertTrue(temp.endswith(".flac"))
+        self.assertNotEqual(temp, cache_path)
+        shutil.copy(os.path.join(DATA_DIR, "silence-44-s.flac"), temp)
+
+        self.transcoder._copy_tags(song, temp)
+        encoded = MusicFile(temp)
+        self.assertEqual(encoded("title"), u"Title")
+        self.assertEqual(encoded("artist"), u"Artist")
+
+    @skipUnless(has_encoder("flacenc"), "GStreamer flacenc missing")
+    def test_transcode(self):
+        path = os.path.join(self.dir, "a.wav")
+        write_wav(path)
+        song = AudioFile({"~filename": path, "title": u"Title",
+                          "artist": u"Artist"})
+
+        result = self.transcoder.transcode(song)
+        self.assertTrue(result.startswith(self.cache))
+        self.assertEqual(os.listdir(self.cache), [os.path.basename(result)])
+
+        encoded = MusicFile(result)
+        self.assertEqual(encoded("title"), u"Title")
+        self.assertEqual(encoded("artist"), u"Artist")
+        self.assertAlmostEqual(encoded("~#length"), 0.5, 1)
+
+        # the second time it comes from the cache
+        mtime = os.path.getmtime(result) - 10
+        os.utime(result, (mtime, mtime))
+        self.assertEqual(self.transcoder.transcode(song), result)
+        self.assertNotEqual(os.path.getmtime(result), mtime)
@@ -6,8 +6,9 @@
 
 import sys
 import os
+import shutil
 
-from tests import TestCase, DATA_DIR
+from tests import TestCase, DATA_DIR, mkdtemp
 from helper import capture_output
 
 from quodlibet import formats
@@ -44,8 +45,32 @@ class TFormats(TestCase):
 
     def test_filter(self):
         self.assertTrue(formats.filter("foo.mp3"))
+        self.assertTrue(formats.filter("foo.MP3"))
         self.assertFalse(formats.filter("foo.doc"))
         self.assertFalse(formats.filter("foomp3"))
+        self.assertFalse(formats.filter("foo.mp3/bar"))
+
+    def test_sniff(self):
+        for name, ext in [("silence-44-s.ogg", ".ogg"),
+                          ("empty.opus", ".opus"),
+                          ("silence-44-s.spx", ".spx"),
+                          ("silence-44-s.flac", ".flac"),
+                          ("silence-44-s.mp3", ".mp3"),
+                          ("silence-44-s.tta", ".tta"),
+                          ("silence-44-s.ape", ".ape"),
+                          ("silence-44-s.mpc", ".mpc"),
+                          ("silence-44-s.wv", ".wv"),
+                          ("test.wma", ".wma"),
+                          ("test.m4a", ".m4a"),
+                          ("test.mid", ".mid"),
+                          ("test.spc", ".spc"),
+                          ("test.vgm", ".vgm")]:
+            self.assertTrue(
+                ext in formats.sniff(os.path.join(DATA_DIR, name)), name)
+
+        self.assertTrue(formats.sniff(os.path.join(DATA_DIR, "nope")) is None)
+        self.assertTrue(
+            formats.sniff(os.path.join(DATA_DIR, "empty.xm")) is None)
 
     def test_music_file(self):
         path = os.path.join(DATA_DIR, 'silence-44-s.mp3')
@@ -62,3 +87,41 @@ class TFormats(TestCase):
             song = formats.MusicFile(os.path.join(DATA_DIR, "nope.xxx"))
             self.assertFalse(song)
             self.assertTrue("extension" in stderr.getvalue())
+
+
+class TMusicFile(TestCase):
+    def setUp(self):
+        config.init()
+        self.dir = mkdtemp()
+        formats.load_stats.reset()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+        config.quit()
+
+    def test_misnamed(self):
+        path = os.path.join(self.dir, "foo.mp3")
+        shutil.copy(os.path.join(DATA_DIR, "silence-44-s.ogg"), path)
+        song = formats.MusicFile(path)
+        self.assertTrue(isinstance(song, formats.xiph.OggFile))
+
+    def test_not_audio(self):
+        path = os.path.join(self.dir, "foo.ogg")
+        with open(path, "wb") as h:
+            h.write("\x89PNG\r\n\x1a\n" + "\x00" * 100)
+        with capture_output() as (stdout, stderr):
+            self.assertFalse(formats.MusicFile(path))
+            self.assertTrue("Not an audio file" in stderr.getvalue())
+        self.assertEqual(formats.load_stats.rejected, 1)
+        self.assertFalse(formats.load_stats.get())
+
+    def test_load_stats(self):
+        formats.MusicFile(os.path.join(DATA_DIR, "silence-44-s.ogg"))
+        with capture_output():
+            formats.MusicFile(os.path.join(DATA_DIR, "nope.ogg"))
+        files, failed, seconds = formats.load_stats.get()["xiph"]
+        self.assertEqual((files, failed), (2, 1))
+        self.assertTrue(seconds >= 0)
+        self.assertTrue("xiph" in str(formats.load_stats))
+        formats.load_stats.reset()
+        self.assertFalse(formats.load_stats.get())
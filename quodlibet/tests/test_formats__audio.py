@@ -1,10 +1,12 @@
 from tests import TestCase, DATA_DIR, mkstemp
 
 import os
+import sys
+import cPickle as pickle
 
 from quodlibet import config
 from quodlibet.formats._audio import AudioFile
-from quodlibet.formats._audio import INTERN_NUM_DEFAULT
+from quodlibet.formats._audio import INTERN_NUM_DEFAULT, share_value
 
 bar_1_1 = AudioFile({
     "~filename": "/fakepath/1",
@@ -415,6 +417,114 @@ class TAudioFile(TestCase):
         # attribute should be unchanged
         self.failIfEqual(AudioFile().multisong, x.multisong)
 
+    def test_sort_cache_pickle(self):
+        copy = pickle.loads(pickle.dumps(AudioFile(bar_1_1), 1))
+        self.assertEqual(copy.sort_key, bar_1_1.sort_key)
+        copy["title"] = copy["title"] + "something"
+        self.assertNotEqual(copy.sort_key, bar_1_1.sort_key)
+        self.assertEqual(copy.album_key, bar_1_1.album_key)
+
+    def test_album_keys_bounded(self):
+        from quodlibet.formats import _audio
+
+        old = _audio.MAX_ALBUM_KEYS
+        _audio.MAX_ALBUM_KEYS = 10
+        try:
+            for i in xrange(25):
+                AudioFile({"album": u"Album %d" % i}).album_key
+            self.assertTrue(len(_audio._album_keys) <= 10)
+        finally:
+            _audio.MAX_ALBUM_KEYS = old
+        _audio.clear_album_keys()
+        self.assertFalse(_audio._album_keys)
+
+    def test_album_key_pickle(self):
+        songs = [AudioFile({"album": u"Bar", "~filename": "/a"}),
+                 AudioFile({"album": u"Bar", "~filename": "/b"})]
+        copies = pickle.loads(pickle.dumps(songs, 1))
+        # pickled once and shared
+        self.assertTrue(copies[0]._album_key is copies[1]._album_key)
+        self.assertEqual(copies[0].album_key, songs[0].album_key)
+
+        # keys pickled by other versions get computed again
+        copy = AudioFile(songs[0])
+        copy.__setstate__((-1, ("x",)))
+        self.assertEqual(copy.album_key, songs[0].album_key)
+
+    def test_compact(self):
+        a = AudioFile(bar_1_2)
+        b = AudioFile({"~filename": "/fakepath/3", "album": u"Bar",
+                       "~#rating": 1})
+        a["album"] = u"Bar"
+        b["~#rating"] = 1.0
+        key = "".join(["al", "bum"])
+        b[key] = b.pop("album")
+        a.compact()
+        b.compact()
+        self.assertEqual(dict(a), dict(bar_1_2))
+        self.assertTrue(a["album"] is b["album"])
+        self.assertTrue([k for k in b if k == "album"][0] is intern("album"))
+        self.assertTrue(isinstance(b["~#rating"], float))
+
+    def test_sanitize_no_compact(self):
+        # write() sanitizes songs in the tag writer thread,
+        # compacting would change them under the main loop
+        song = AudioFile({"~filename": "/fakepath/4", "album": u"Bar"})
+        value = u"".join([u"B", u"ar"])
+        song["album"] = value
+        song.sanitize()
+        self.assertTrue(song["album"] is value)
+
+    def test_share_value_bounded(self):
+        from quodlibet.formats import _audio
+
+        old = _audio.MAX_SHARED_VALUES
+        _audio.MAX_SHARED_VALUES = 10
+        try:
+            for i in xrange(25):
+                share_value(u"value %d" % i)
+            self.assertTrue(len(_audio._shared_values) <= 10)
+            value = u"".join([u"value ", u"24"])
+            self.assertTrue(share_value(value) is not value)
+        finally:
+            _audio.MAX_SHARED_VALUES = old
+
+    def test_compact_memory(self):
+        # a synthetic library where tag names and some values repeat
+        def songs():
+            for i in xrange(2000):
+                song = AudioFile()
+                for key, value in [
+                        ("artist", u"Artist %d" % (i / 100)),
+                        ("album", u"Album %d" % (i / 10)),
+                        ("genre", u"Genre %d" % (i % 10)),
+                        ("title", u"Title %d" % i),
+                        ("tracknumber", u"%d/10" % (i % 10 + 1)),
+                        ("~filename", "/music/%d.ogg" % i),
+                        ("~mountpoint", "/music"),
+                        ("~#added", 1400000000 + i)]:
+                    song["".join(key)] = value
+                yield song
+
+        def footprint(songs):
+            seen = set()
+            size = 0
+            for song in songs:
+                size += sys.getsizeof(song)
+                for obj in song.iteritems():
+                    for obj in obj:
+                        if id(obj) not in seen:
+                            seen.add(id(obj))
+                            size += sys.getsizeof(obj)
+            return size
+
+        before = list(songs())
+        after = list(songs())
+        for song in after:
+            song.compact()
+        self.assertEqual(map(dict, before), map(dict, after))
+        self.assertTrue(footprint(after) < footprint(before) * 0.7)
+
     def test_sort_func(self):
         tags = [lambda s: s("foo"), "artistsort", "albumsort",
                 "~filename", "~format", "discnumber", "~#track"]
@@ -1,6 +1,7 @@
 from gi.repository import Gtk
 
 from tests import TestCase
+from quodlibet.formats._audio import AudioFile
 from quodlibet.library import SongLibrarian
 from quodlibet.library.libraries import Library, SongFileLibrary
 from quodlibet.library.librarians import Librarian
@@ -141,6 +142,22 @@ class TSongLibrarian(TLibrarian):
         self.failUnlessEqual(sorted(self.librarian.tag_values(0)), [])
         self.failIf(self.changed or self.added or self.removed)
 
+    def test_get_stats(self):
+        one = AudioFile({"~filename": "/one", "~#length": 1, "~#filesize": 2})
+        two = AudioFile({"~filename": "/two", "~#length": 3, "~#filesize": 4})
+        other = AudioFile(
+            {"~filename": "/other", "~#length": 5, "~#filesize": 6})
+        self.lib1.add([one])
+        self.lib2.add([two])
+        stats = self.librarian.get_stats([one, two, other])
+        self.assertEqual((stats.count, stats.length, stats.size), (3, 9, 12))
+
+        # all songs of a library, its totals get used
+        self.lib2.get_stats()
+        two["~#length"] = 7
+        stats = self.librarian.get_stats(iter([two]))
+        self.assertEqual((stats.count, stats.length, stats.size), (1, 3, 4))
+
     def test_rename(self):
         new = self.Fake(10)
         new.key = 30
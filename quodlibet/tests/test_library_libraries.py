@@ -3,6 +3,7 @@ from gi.repository import Gtk
 import os
 import shutil
 from quodlibet import config
+from quodlibet.formats import _audio
 from quodlibet.formats._audio import AudioFile
 
 from tests import TestCase, DATA_DIR, mkstemp
@@ -31,6 +32,9 @@ class FakeSong(Fake):
     def rename(self, newname):
         self.key = newname
 
+    def compact(self):
+        pass
+
 
 class AlbumSong(AudioFile):
     """A mock AudioFile belong to one of three albums,
@@ -306,6 +310,95 @@ class TSongLibrary(TLibrary):
         self.failIf(self.changed or self.added or self.removed)
 
 
+def StatSong(num):
+    return AudioFile({"~filename": "/song%d" % num, "~#length": num,
+                      "~#filesize": num * 10})
+
+
+class TSongStats(TestCase):
+
+    def setUp(self):
+        self.library = SongLibrary()
+        self.songs = map(StatSong, range(1, 5))
+        self.library.add(self.songs)
+
+    def tearDown(self):
+        self.library.destroy()
+
+    def assertStats(self, stats, count, length, size):
+        self.assertEqual((stats.count, stats.length, stats.size),
+                         (count, length, size))
+
+    def test_empty(self):
+        self.assertStats(self.library.get_stats([]), 0, 0, 0)
+        self.assertStats(SongLibrary().get_stats(), 0, 0, 0)
+
+    def test_selection(self):
+        stats = self.library.get_stats(self.songs[:2])
+        self.assertStats(stats, 2, 3, 30)
+
+        # songs not in the library work as well
+        stats = self.library.get_stats(iter([self.songs[0], StatSong(10)]))
+        self.assertStats(stats, 2, 11, 110)
+
+        # no ~#filesize, falls back to the real file size
+        song = AudioFile({"~filename": "/dev/null", "~#length": 2})
+        self.assertStats(self.library.get_stats([song]), 1, 2, 0)
+
+    def test_totals(self):
+        self.assertStats(self.library.get_stats(), 4, 10, 100)
+
+        self.library.add([StatSong(10)])
+        self.assertStats(self.library.get_stats(), 5, 20, 200)
+
+        self.library.remove(self.songs[:2])
+        self.assertStats(self.library.get_stats(), 3, 17, 170)
+
+        song = self.songs[-1]
+        song["~#length"] = 5
+        song["~#filesize"] = 0
+        self.library.changed([song])
+        self.assertStats(self.library.get_stats(), 3, 18, 130)
+        self.assertStats(self.library.get_stats([song]), 1, 5, 0)
+
+    def test_totals_copy(self):
+        self.library.get_stats().count = 42
+        self.assertStats(self.library.get_stats(), 4, 10, 100)
+
+    def test_artists_albums(self):
+        songs = self.songs
+        songs[0]["artist"] = u"a\nb"
+        songs[1]["artist"] = u"a"
+        songs[0]["album"] = songs[1]["album"] = u"x"
+        self.library.changed(songs[:2])
+
+        stats = self.library.get_stats()
+        self.assertEqual((stats.artists, stats.albums), (2, 1))
+        stats = self.library.get_stats(songs[1:])
+        self.assertEqual((stats.artists, stats.albums), (1, 1))
+
+        self.library.remove(songs[:1])
+        stats = self.library.get_stats()
+        self.assertEqual((stats.artists, stats.albums), (1, 1))
+        self.library.remove(songs[1:2])
+        stats = self.library.get_stats()
+        self.assertEqual((stats.artists, stats.albums), (0, 0))
+        self.library.add(songs[:1])
+        stats = self.library.get_stats()
+        self.assertEqual((stats.artists, stats.albums), (2, 1))
+
+    def test_whole_library(self):
+        self.library.get_stats()
+        # not announced, so only the selection sees it
+        self.songs[0]["~#length"] = 11
+        stats = self.library.get_stats(self.songs[::-1])
+        self.assertStats(stats, 4, 10, 100)
+        stats = self.library.get_stats(self.songs[:3] + [StatSong(1)])
+        self.assertStats(stats, 4, 17, 70)
+        stats = self.library.get_stats(self.songs[:3])
+        self.assertStats(stats, 3, 16, 60)
+
+
 class TFileLibrary(TLibrary):
     Fake = FakeSongFile
     Library = FileLibrary
@@ -374,11 +467,110 @@ class TFileLibrary(TLibrary):
         self.assertFalse(removed)
 
 
+class PathFake(object):
+    def __init__(self, key, mountpoint="/"):
+        self.key = key
+        self.mountpoint = mountpoint
+
+
+class TPathIndex(TestCase):
+
+    def setUp(self):
+        self.library = FileLibrary()
+        self.index = self.library.path_index
+        self.songs = [
+            PathFake("/music/a/1.ogg"), PathFake("/music/a/2.ogg"),
+            PathFake("/music/a/cd2/3.ogg"), PathFake("/music/b/4.ogg"),
+            PathFake("/media/usb/5.ogg", "/media/usb")]
+        self.library.add(self.songs)
+
+    def tearDown(self):
+        self.library.destroy()
+
+    def test_subtree(self):
+        self.assertEqual(set(self.index.get_subtree("/music/a")),
+                         set(self.songs[:3]))
+        self.assertEqual(set(self.index.get_subtree("/music/a/")),
+                         set(self.songs[:3]))
+        self.assertEqual(len(self.index.get_subtree("/")), 5)
+        self.assertEqual(self.index.get_subtree("/music/c"), [])
+        # no prefix matches
+        self.library.add([PathFake("/music/ab/6.ogg")])
+        self.assertEqual(len(self.index.get_subtree("/music/a")), 3)
+
+    def test_files_subdirs(self):
+        self.assertEqual(set(self.index.get_files("/music/a")),
+                         set(self.songs[:2]))
+        self.assertEqual(self.index.get_subdirs("/music"),
+                         ["/music/a", "/music/b"])
+        self.assertEqual(self.index.get_subdirs("/music/b"), [])
+
+    def test_count(self):
+        self.assertEqual(self.index.count("/"), 5)
+        self.assertEqual(self.index.count("/music"), 4)
+        self.assertEqual(self.index.count("/music/a"), 3)
+        self.assertEqual(self.index.count("/nope"), 0)
+
+    def test_remove(self):
+        self.library.remove(self.songs[2:4])
+        self.assertEqual(self.index.count("/music"), 2)
+        self.assertEqual(self.index.get_subdirs("/music"), ["/music/a"])
+        self.assertEqual(self.index.get_subdirs("/music/a"), [])
+        self.library.remove(self.songs)
+        self.assertEqual(self.index.count("/"), 0)
+        self.assertFalse(self.index._counts)
+        self.assertFalse(self.index._children)
+        self.assertFalse(self.index._files)
+        self.assertFalse(self.index.mount_points)
+
+    def test_mount_points(self):
+        self.assertEqual(sorted(self.index.mount_points), ["/", "/media/usb"])
+        self.assertEqual(self.index.get_mount_point("/media/usb"),
+                         [self.songs[4]])
+        self.library.mask("/media/usb")
+        self.assertEqual(self.index.get_mount_point("/media/usb"), [])
+        self.assertEqual(self.index.count("/"), 4)
+        self.library.unmask("/media/usb")
+        self.assertEqual(self.index.count("/"), 5)
+
+    def test_direct_changes(self):
+        # librarians and reload modify the contents directly
+        song = self.songs[0]
+        del self.library._contents[song.key]
+        self.assertEqual(self.index.count("/music/a"), 2)
+        song.key = "/music/c/1.ogg"
+        self.library._contents[song.key] = song
+        self.assertEqual(self.index.get_subtree("/music/c"), [song])
+        self.library._contents.update({"/x/7.ogg": PathFake("/x/7.ogg")})
+        self.assertEqual(self.index.count("/x"), 1)
+        self.library._contents.pop("/x/7.ogg")
+        self.assertEqual(self.index.count("/x"), 0)
+
+
 class TSongFileLibrary(TSongLibrary):
     Fake = FakeSongFile
     Frange = staticmethod(FSFrange)
     Library = SongFileLibrary
 
+    def test_load_lazy(self):
+        fd, filename = mkstemp()
+        os.close(fd)
+        library = self.Library()
+        try:
+            self.library.add(self.Frange(30))
+            self.library.save(filename)
+            library.load(filename, lazy=True)
+            self.assertTrue(library.loading)
+            self.assertEqual(sorted(library.keys()), range(30))
+            # gets indexed on first access
+            self.assertEqual(library.path_index.mount_points, ["/"])
+            while Gtk.events_pending():
+                Gtk.main_iteration()
+            self.assertFalse(library.loading)
+        finally:
+            library.destroy()
+            os.unlink(filename)
+
     def test__load_exists_invalid(self):
         new = self.Fake(100)
         new._valid = False
@@ -557,6 +749,29 @@ class TAlbumLibrary(TestCase):
         # It shouldn't implement FileLibrary etc
         self.failIf(getattr(self.library, "filename", None))
 
+    def test_lazy(self):
+        albums = AlbumLibrary(self.underlying, lazy=True)
+        added = []
+        albums.connect_object('added', list.extend, added)
+        loaded = []
+        albums.connect('loaded', loaded.append)
+        try:
+            self.assertTrue(albums.loading)
+            self.assertFalse(albums.values())
+            # removed before getting sorted in
+            self.underlying.remove([self.underlying["file_1.mp3"]])
+            while Gtk.events_pending():
+                Gtk.main_iteration()
+            self.assertFalse(albums.loading)
+            self.assertEqual(loaded, [albums])
+            # the keys shared during the build are gone
+            self.assertFalse(_audio._album_keys)
+            self.assertEqual(len(added), 3)
+            self.assertEqual(len(albums), 3)
+            self.assertEqual(sum(len(a.songs) for a in albums), 11)
+        finally:
+            albums.destroy()
+
 
 class TAlbumLibrarySignals(TestCase):
     def setUp(self):
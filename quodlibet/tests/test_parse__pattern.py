@@ -5,7 +5,7 @@ import os
 
 from quodlibet import util
 from quodlibet.parse import (FileFromPattern, XMLFromPattern, Pattern,
-    XMLFromMarkupPattern)
+    XMLFromMarkupPattern, FormatCache)
 
 
 class _TPattern(AbstractTestCase):
@@ -322,3 +322,85 @@ class TPatternFormatList(_TPattern):
 
         pat = Pattern('')
         self.assertEqual(pat.format_list(self.a), set([""]))
+
+
+class TFormatCache(TestCase):
+
+    class Formatter(object):
+        def __init__(self):
+            self.calls = []
+
+        def format(self, song):
+            self.calls.append(song)
+            return u"%d" % song
+
+    def setUp(self):
+        self.cache = FormatCache()
+        self.fmt = self.Formatter()
+
+    def test_format(self):
+        self.assertEqual(self.cache.format(self.fmt, 1), u"1")
+        self.assertEqual(self.cache.format(self.fmt, 1), u"1")
+        self.assertEqual(self.cache.format(self.fmt, 2), u"2")
+        self.assertEqual(self.fmt.calls, [1, 2])
+
+        other = self.Formatter()
+        self.cache.format(other, 1)
+        self.assertEqual(other.calls, [1])
+
+    def test_invalidate(self):
+        other = self.Formatter()
+        for fmt in [self.fmt, other]:
+            self.cache.format(fmt, 1)
+            self.cache.format(fmt, 2)
+        self.cache.invalidate([1])
+        for fmt in [self.fmt, other]:
+            self.cache.format(fmt, 1)
+            self.cache.format(fmt, 2)
+            self.assertEqual(fmt.calls, [1, 2, 1])
+
+        self.cache.clear()
+        self.cache.format(self.fmt, 2)
+        self.assertEqual(self.fmt.calls, [1, 2, 1, 2])
+
+    def test_max_size(self):
+        self.cache = FormatCache(max_size=FormatCache.ENTRY_SIZE * 200)
+        for i in range(1000):
+            self.cache.format(self.fmt, i)
+        self.assertTrue(len(self.cache._new) + len(self.cache._old) <= 200)
+
+        # recently used entries survive
+        del self.fmt.calls[:]
+        for i in range(10):
+            self.cache.format(self.fmt, 0)
+            for j in range(900 + i * 10, 910 + i * 10):
+                self.cache.format(self.fmt, j)
+        self.assertEqual(self.fmt.calls.count(0), 1)
+
+    def test_pattern(self):
+        from quodlibet.formats._audio import AudioFile
+        song = AudioFile({"artist": u"foo"})
+        pattern = Pattern("<artist>")
+        self.assertEqual(pattern.format_cached(song), u"foo")
+
+    def test_library(self):
+        from quodlibet.formats._audio import AudioFile
+        from quodlibet.library import SongLibrary
+
+        library = SongLibrary()
+        self.cache.connect(library)
+        song = AudioFile({"~filename": "/dev/null", "artist": u"foo"})
+        other = AudioFile({"~filename": "/dev/zero", "artist": u"bar"})
+        library.add([song])
+        pattern = Pattern("<artist>")
+
+        self.assertEqual(self.cache.format(pattern, song), u"foo")
+        self.assertEqual(self.cache.format(pattern, other), u"bar")
+        self.assertTrue((pattern, song) in self.cache._new)
+        # nothing would invalidate songs outside of the library
+        self.assertFalse((pattern, other) in self.cache._new)
+
+        song["artist"] = u"quux"
+        library.changed([song])
+        self.assertEqual(self.cache.format(pattern, song), u"quux")
+        library.destroy()
@@ -283,6 +283,18 @@ class TQuery(TestCase):
         self.failUnless(Query.match_all("    "))
         self.failIf(Query.match_all("foo"))
 
+    def test_is_refinement(self):
+        self.failUnless(Query.is_refinement("", "foo"))
+        self.failUnless(Query.is_refinement("foo", "foob"))
+        self.failUnless(Query.is_refinement("foo", "bar Foo"))
+        self.failUnless(Query.is_refinement("foo bar", "bar foo"))
+        self.failIf(Query.is_refinement("foo", ""))
+        self.failIf(Query.is_refinement("foob", "foo"))
+        self.failIf(Query.is_refinement("foo bar", "foo"))
+        self.failIf(Query.is_refinement("artist=foo", "artist=foob"))
+        self.failIf(Query.is_refinement("foo", "!foo"))
+        self.failIf(Query.is_refinement("foo", "|(foo, bar)"))
+
     def test_fs_utf8(self):
         self.failUnless(Query(u"~filename=foü.ogg").search(self.s3))
         self.failUnless(Query(u"~filename=öä").search(self.s3))
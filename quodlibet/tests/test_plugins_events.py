@@ -76,3 +76,32 @@ class TEventPlugins(TestCase):
         self.lib.emit("changed", [None])
         self.failUnlessEqual([("plugin_on_changed", ([None],))],
                              self._get_calls(plugin))
+
+    def test_lib_added_unhandled(self):
+        self.create_plugin(name='Name', funcs=["plugin_on_changed"])
+        self.pm.rescan()
+        plugin = self.pm.plugins[0]
+        self.pm.enable(plugin, True)
+        self.lib.emit("added", [None])
+        self.failUnlessEqual([], self._get_calls(plugin))
+
+    def test_disabled(self):
+        self.create_plugin(name='Name', funcs=["plugin_on_paused"])
+        self.pm.rescan()
+        plugin = self.pm.plugins[0]
+        self.pm.enable(plugin, True)
+        self.pm.enable(plugin, False)
+        self.player.emit("paused")
+        self.failUnlessEqual([], self._get_calls(plugin))
+
+    def test_timings(self):
+        self.create_plugin(name='Name', funcs=["plugin_on_paused"])
+        self.pm.rescan()
+        plugin = self.pm.plugins[0]
+        self.pm.enable(plugin, True)
+        self.failIf(self.handler.get_timings())
+        self.player.emit("paused")
+        self.player.emit("paused")
+        calls, seconds = self.handler.get_timings()["Name"]
+        self.failUnlessEqual(calls, 2)
+        self.failUnless(seconds >= 0)
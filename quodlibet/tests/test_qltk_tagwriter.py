@@ -0,0 +1,160 @@
+import threading
+import time
+
+from tests import TestCase
+
+from gi.repository import Gtk
+
+from quodlibet.formats._audio import AudioFile
+from quodlibet.library import SongFileLibrary
+from quodlibet.qltk.tagwriter import TagWriter
+
+
+class WriteSong(AudioFile):
+    """write() gets called on copies, so the state is kept per filename"""
+
+    # filename -> number of failures left
+    fail = {}
+    # (filename, title) of all written songs in order
+    written = []
+    # filename -> (started, release) events, write() blocks until released
+    block = {}
+
+    def write(self):
+        filename = self["~filename"]
+        if filename in self.block:
+            started, release = self.block.pop(filename)
+            started.set()
+            release.wait()
+        if self.fail.get(filename):
+            self.fail[filename] -= 1
+            raise IOError
+        # like sanitize()
+        self["~#mtime"] = 42
+        self.written.append((filename, self.get("title")))
+
+    def exists(self):
+        return True
+
+    def reload(self):
+        # failed or skipped songs get reloaded
+        pass
+
+
+class TTagWriter(TestCase):
+
+    def setUp(self):
+        WriteSong.fail = {}
+        WriteSong.written = []
+        WriteSong.block = {}
+        self.writer = TagWriter(retry_delay=0)
+        self.lib = SongFileLibrary()
+        self.songs = [WriteSong({"~filename": "/dev/null/%d" % i})
+                      for i in range(10)]
+        self.lib.add(self.songs)
+        self.changed = []
+        self.lib.connect("changed", lambda l, s: self.changed.append(s))
+        self.batches = []
+
+    def tearDown(self):
+        self.writer._pool.stop()
+        self.lib.destroy()
+
+    def _written(self, song):
+        return [w for w in WriteSong.written if w[0] == song.key]
+
+    def _block(self, song):
+        started, release = threading.Event(), threading.Event()
+        WriteSong.block[song.key] = started, release
+        return started, release
+
+    def _wait(self, count=1):
+        self.writer.wait()
+        while len(self.batches) < count:
+            Gtk.main_iteration_do(False)
+
+    def _write(self, songs):
+        self.writer.write(self.lib, songs, self.batches.append)
+        self._wait()
+        return self.batches.pop()
+
+    def test_write(self):
+        batch = self._write(self.songs)
+        self.failUnlessEqual(batch.written, set(self.songs))
+        self.failIf(batch.failed)
+        self.failUnless(all(len(self._written(s)) == 1 for s in self.songs))
+        self.failUnlessEqual(self.changed, [set(self.songs)])
+        # changes of write() get applied in the main loop
+        self.failUnless(all(s["~#mtime"] == 42 for s in self.songs))
+
+    def test_retry(self):
+        WriteSong.fail[self.songs[0].key] = 2
+        batch = self._write(self.songs)
+        self.failUnlessEqual(batch.written, set(self.songs))
+        self.failUnlessEqual(len(self._written(self.songs[0])), 1)
+
+    def test_failed(self):
+        WriteSong.fail[self.songs[0].key] = 3
+        batch = self._write(self.songs)
+        self.failUnlessEqual(len(batch.failed), 1)
+        self.failUnless(batch.failed[0][0] is self.songs[0])
+        self.failUnlessEqual(batch.written, set(self.songs[1:]))
+        self.failIf("~#mtime" in self.songs[0])
+
+    def test_empty(self):
+        batch = self._write([])
+        self.failIf(batch.written)
+        self.failIf(self.changed)
+
+    def test_copy(self):
+        song = self.songs[0]
+        song["title"] = u"old"
+        started, release = self._block(song)
+        self.writer.write(self.lib, [song], self.batches.append)
+        started.wait()
+
+        # the worker writes the tags from the time of submission and
+        # doesn't change the library song
+        song["title"] = u"new"
+        song["~#mtime"] = 1
+        release.set()
+        self._wait()
+        self.failUnlessEqual(self._written(song), [(song.key, u"old")])
+        self.failUnlessEqual(song["title"], u"new")
+        self.failUnlessEqual(song["~#mtime"], 1)
+
+    def test_same_file(self):
+        writer = self.writer = TagWriter(max_workers=2, retry_delay=0)
+        first, other = self.songs[:2]
+        first["title"] = u"1"
+        started, release = self._block(first)
+        writer.write(self.lib, [first], self.batches.append)
+        started.wait()
+
+        first["title"] = u"2"
+        writer.write(self.lib, [first, other], self.batches.append)
+        # other files don't wait, the same file does
+        for i in xrange(500):
+            if self._written(other):
+                break
+            time.sleep(0.01)
+        self.failUnless(self._written(other))
+        self.failIf(self._written(first))
+
+        release.set()
+        self._wait(2)
+        self.failUnlessEqual(
+            self._written(first), [(first.key, u"1"), (first.key, u"2")])
+
+    def test_stop(self):
+        self.writer = TagWriter(max_workers=1, retry_delay=0)
+        first = self.songs[0]
+        started, release = self._block(first)
+        batch = self.writer.write(self.lib, self.songs, self.batches.append)
+        # the first song is being written, the others are still queued
+        started.wait()
+        batch.stop()
+        release.set()
+        self._wait()
+        self.failUnlessEqual(self.batches[0].written, set([first]))
+        self.failUnlessEqual(WriteSong.written, [(first.key, None)])
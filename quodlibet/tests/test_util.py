@@ -10,9 +10,12 @@ import tempfile
 import sys
 import os
 import re
+
+from gi.repository import GLib
 from quodlibet import util
 from quodlibet import config
 from quodlibet.util import format_time_long as f_t_l
+from quodlibet.formats._audio import AudioFile
 
 
 is_win = os.name == "nt"
@@ -661,6 +664,68 @@ class Tlibrary(TestCase):
             self.failUnlessEqual(get_scan_dirs(), ["foo", "bar"])
 
 
+class TIncrementalFilter(TestCase):
+
+    def setUp(self):
+        config.init()
+        self.items = [AudioFile({"artist": "foo%d" % i}) for i in range(1000)]
+        self.filter = IncrementalFilter()
+        self.calls = []
+        self.checked = []
+
+    def tearDown(self):
+        self.filter.cancel()
+        config.quit()
+
+    def _search(self, text, visible=None, sync=False):
+        def get_visible():
+            self.checked.extend(visible)
+            return visible
+
+        def callback():
+            self.calls.append(
+                [i for i in self.items if self.filter.match(i)])
+
+        self.filter.search(text, ["artist"], lambda: self.items,
+                           get_visible, callback, sync=sync)
+
+    def _process(self):
+        context = GLib.MainContext.default()
+        while context.pending():
+            context.iteration(False)
+
+    def test_sync(self):
+        self._search("foo99", sync=True)
+        self.assertEqual(len(self.calls[0]), 11)
+        self.assertTrue(self.filter.active)
+        self._search("", sync=True)
+        self.assertEqual(len(self.calls[1]), 1000)
+        self.assertFalse(self.filter.active)
+
+    def test_chunked(self):
+        self._search("foo99")
+        self.assertFalse(self.calls)
+        self._process()
+        self.assertEqual(len(self.calls[0]), 11)
+
+    def test_cancel(self):
+        self._search("foo1")
+        self._search("foo2")
+        self._process()
+        self.assertEqual(len(self.calls), 1)
+        self.assertTrue(all("2" in i("artist") for i in self.calls[0]))
+
+    def test_narrow(self):
+        self._search("foo1", sync=True)
+        visible = self.calls[0]
+        self._search("foo12", visible=visible, sync=True)
+        self.assertEqual(len(self.checked), len(visible))
+        self.assertEqual(len(self.calls[1]), 11)
+        self._search("foo3", visible=self.calls[1], sync=True)
+        self.assertEqual(len(self.checked), len(visible))
+        self.assertEqual(len(self.calls[2]), 111)
+
+
 class TNormalizePath(TestCase):
     def test_darwin(self):
         if is_win:
@@ -744,6 +809,57 @@ class Tatomic_save(TestCase):
         self.assertFalse(os.path.exists(filename + ".tmp"))
 
 
+MOUNTINFO = """\
+15 20 0:3 / /proc rw,relatime - proc proc rw
+16 20 0:14 / / rw,relatime - ext4 /dev/sda1 rw
+17 20 0:15 / /media/my\\040disk rw,relatime - vfat /dev/sdb1 rw
+"""
+
+
+class TMountPointResolver(TestCase):
+
+    def setUp(self):
+        fd, self.filename = mkstemp()
+        os.close(fd)
+        with open(self.filename, "wb") as h:
+            h.write(MOUNTINFO)
+
+    def tearDown(self):
+        os.remove(self.filename)
+
+    def test_parse_mountinfo(self):
+        self.assertEqual(parse_mountinfo(MOUNTINFO),
+                         set(["/proc", "/", "/media/my disk"]))
+
+    def test_find(self):
+        resolver = MountPointResolver(mountinfo=self.filename)
+        self.assertEqual(resolver.find("/media/my disk/a/b"), "/media/my disk")
+        self.assertEqual(resolver.find("/media/my disk/a"), "/media/my disk")
+        self.assertEqual(resolver.find("/media/other"), "/")
+        self.assertEqual(resolver.find("/"), "/")
+        self.assertEqual(resolver.find("relative/path"), "/")
+        self.assertTrue(resolver.ismount("/media/my disk/"))
+        self.assertFalse(resolver.ismount("/media"))
+
+    def test_refresh(self):
+        resolver = MountPointResolver(interval=0, mountinfo=self.filename)
+        self.assertEqual(resolver.find("/media/my disk/a"), "/media/my disk")
+        with open(self.filename, "wb") as h:
+            h.write(MOUNTINFO.splitlines(True)[1])
+        self.assertEqual(resolver.find("/media/my disk/a"), "/")
+
+    def test_no_mountinfo(self):
+        resolver = MountPointResolver(mountinfo=self.filename + "_missing")
+        path = os.path.realpath(self.filename)
+        self.assertEqual(resolver.find(path), find_mount_point(path))
+        self.assertTrue(resolver.ismount("/"))
+
+    def test_ismount(self):
+        self.assertTrue(ismount("/"))
+        self.assertEqual(ismount(self.filename),
+                         os.path.ismount(self.filename))
+
+
 class Tescape_filename(TestCase):
 
     def test_str(self):
@@ -7,6 +7,7 @@ from quodlibet.formats._audio import AudioFile as Fakesong
 from quodlibet.formats._audio import INTERN_NUM_DEFAULT, PEOPLE
 from quodlibet.util.collection import Album, Playlist, avg, bayesian_average
 from quodlibet.library.libraries import FileLibrary
+from quodlibet.parse import Query
 
 config.RATINGS = config.HardCodedRatingsPrefs()
 
@@ -26,6 +27,20 @@ NUMERIC_SONGS = [
 AMAZING_SONG = Fakesong({"~#length": 123, "~#rating": 1.0})
 
 
+class CountingSong(Fakesong):
+    """Counts how often values were requested"""
+
+    calls = 0
+
+    def __call__(self, *args, **kwargs):
+        self.calls += 1
+        return super(CountingSong, self).__call__(*args, **kwargs)
+
+    def list(self, *args, **kwargs):
+        self.calls += 1
+        return super(CountingSong, self).list(*args, **kwargs)
+
+
 class TAlbum(TestCase):
     def setUp(self):
         config.init()
@@ -232,6 +247,67 @@ class TAlbum(TestCase):
         s.failUnlessEqual(album.comma("c"), "cc3, cc1")
         s.failUnlessEqual(album.comma("~c~b"), "cc3, cc1 - bb1, bb4")
 
+    def test_cache(s):
+        song = CountingSong({"album": "a", "foo": "f", "~#rating": 0.5})
+        album = Album(song)
+        album.songs.add(song)
+
+        s.failUnlessEqual(album("album"), "a")
+        s.failUnlessEqual(album("foo"), "f")
+        s.failUnlessEqual(album("~#rating:avg"), 0.5)
+        s.failUnlessEqual(album("nope", "x"), "x")
+        calls = song.calls
+
+        # more uncommon keys than the LRU can hold
+        for i in xrange(album._cache_size * 2):
+            song["foo%d" % i] = "x"
+            album("foo%d" % i)
+        calls = song.calls
+        s.failUnlessEqual(album("album"), "a")
+        s.failUnlessEqual(album("~#rating:avg"), 0.5)
+        s.failUnlessEqual(album("nope", "x"), "x")
+        s.failUnlessEqual(song.calls, calls)
+        s.failUnlessEqual(album("foo"), "f")
+        s.failIfEqual(song.calls, calls)
+
+        # recently used uncommon keys stay
+        calls = song.calls
+        album("foo")
+        s.failUnlessEqual(song.calls, calls)
+
+        song["album"] = "b"
+        s.failUnlessEqual(album("album"), "a")
+        album.finalize()
+        s.failUnlessEqual(album("album"), "b")
+
+    def test_refilter_many_albums(s):
+        # Query all albums with more keys than the LRU could hold
+        # a few times, like the album browser does when filtering
+        albums = []
+        for i in xrange(300):
+            song = CountingSong({
+                "album": "album%d" % i, "artist": "artist%d" % (i % 100),
+                "genre": "genre%d" % (i % 10), "date": str(1960 + i % 50),
+                "labelid": "label%d" % i, "~#rating": 0.5, "~#length": i})
+            album = Album(song)
+            album.songs.add(song)
+            albums.append(album)
+
+        query = Query("&(album=/album1/, |(artist=artist1, genre=genre1), "
+                      "date=/19/, labelid=label, #(rating > 0.1), "
+                      "#(length > 10), ~people=artist, albumartist=!foo)")
+
+        result = filter(query.search, albums)
+        s.failUnless(result)
+        for album in albums:
+            for song in album.songs:
+                song.calls = 0
+
+        # all values needed are cached now
+        for i in xrange(3):
+            s.failUnlessEqual(filter(query.search, albums), result)
+        s.failIf(sum(song.calls for a in albums for song in a.songs))
+
     def tearDown(self):
         config.quit()
 
@@ -0,0 +1,62 @@
+import threading
+
+from tests import TestCase
+
+from quodlibet.util.threadpool import ThreadPool, get_num_workers
+
+
+class TThreadPool(TestCase):
+
+    def setUp(self):
+        self.pool = ThreadPool(2)
+
+    def tearDown(self):
+        self.pool.stop()
+
+    def test_num_workers(self):
+        self.assertTrue(get_num_workers() >= 1)
+
+    def test_results(self):
+        jobs = [self.pool.add(lambda x: x * 2, i) for i in xrange(20)]
+        self.pool.wait()
+        self.assertEqual([j.result for j in jobs], range(0, 40, 2))
+        self.assertTrue(all(j.done for j in jobs))
+
+    def test_exception(self):
+        def fail():
+            raise ValueError
+        job = self.pool.add(fail)
+        self.assertTrue(job.wait(5))
+        self.assertTrue(isinstance(job.exception, ValueError))
+
+    def test_priority(self):
+        pool = ThreadPool(1)
+        event = threading.Event()
+        order = []
+        pool.add(event.wait)
+        pool.add(order.append, 1, priority=1)
+        pool.add(order.append, 2, priority=0)
+        event.set()
+        pool.wait()
+        pool.stop()
+        self.assertEqual(order, [2, 1])
+
+    def test_cancel(self):
+        pool = ThreadPool(1)
+        event = threading.Event()
+        order = []
+        pool.add(event.wait)
+        job = pool.add(order.append, 1)
+        job.cancel()
+        event.set()
+        pool.wait()
+        pool.stop()
+        self.assertTrue(job.done)
+        self.assertTrue(job.cancelled)
+        self.assertEqual(order, [])
+
+    def test_stop_reuse(self):
+        self.pool.stop()
+        job = self.pool.add(lambda: 42)
+        self.pool.wait()
+        self.assertEqual(job.result, 42)